@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+from corsheaders.defaults import default_headers
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -39,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # Thư viện của bên thứ ba
     'rest_framework',
@@ -96,6 +98,110 @@ DATABASES = {
     }
 }
 
+# Pool kết nối của Django (cần psycopg 3 + psycopg_pool), bật bằng DB_POOL_MAX_SIZE > 0.
+# Nên bật khi chạy ASGI: view async đọc database từ thread riêng của mỗi request nên
+# không giữ được kết nối lâu dài (CONN_MAX_AGE) mà mượn / trả kết nối từ pool.
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 0))
+if DB_POOL_MAX_SIZE:
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {'min_size': min(4, DB_POOL_MAX_SIZE), 'max_size': DB_POOL_MAX_SIZE, 'timeout': 10},
+    }
+
+# Cache: dùng Redis khi có REDIS_URL (production), mặc định là bộ nhớ trong process
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Cache catalog (core/cache.py)
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', 300))  # giây, 0 để tắt
+CATALOG_CACHE_LOCK_TIMEOUT = 10   # thời gian giữ lock tối đa khi tính lại một entry
+CATALOG_CACHE_LOCK_WAIT = 2       # thời gian các request khác chờ entry đang được tính
+
+# Cận trên các khoảng giá trong facet của danh sách sản phẩm (core/facets.py)
+PRODUCT_PRICE_BUCKETS = (500_000, 1_000_000, 5_000_000, 10_000_000, 20_000_000)
+
+# Thời gian giữ hàng cho sản phẩm trong giỏ (giây), xem core/inventory.py
+CART_RESERVATION_TTL = 30 * 60
+
+# Giới hạn tốc độ cho đặt hàng / giỏ hàng (core/throttling.py):
+# scope -> {'user' | 'global': (tốc độ nạp token, burst)}; bỏ một mục để không giới hạn
+THROTTLE_CACHE_ALIAS = 'default'
+THROTTLE_BUCKETS = {
+    'checkout': {'user': ('10/min', 5), 'global': ('100/s', 200)},
+    'cart': {'user': ('120/min', 30), 'global': ('500/s', 1000)},
+}
+# Số request tối đa cùng xử lý một sản phẩm (0 để tắt) và thời gian xếp hàng tối đa (giây)
+PRODUCT_CONCURRENCY_LIMIT = 8
+PRODUCT_CONCURRENCY_WAIT = 0.5
+PRODUCT_CONCURRENCY_LEASE = 30        # chỗ giữ quá thời gian này (worker bị dừng) được tự giải phóng
+PRODUCT_CONCURRENCY_RETRY_AFTER = 1   # giây, trả về trong Retry-After khi hết chỗ
+
+# Header Idempotency-Key cho đặt hàng và giỏ hàng (core/idempotency.py)
+IDEMPOTENCY_KEY_TTL = 86400           # giây, key cũ hơn được xóa (worker) và dùng lại được
+IDEMPOTENCY_LOCK_TIMEOUT = 60         # giây, request đầu chạy lâu hơn (bị dừng) thì request gửi lại được chạy thay
+IDEMPOTENCY_RETRY_AFTER = 1           # giây, Retry-After của 409 khi request đầu còn đang chạy
+
+# Hàng đợi công việc chạy nền (core/jobs.py), chạy bằng `manage.py runworker`
+JOB_QUEUE_ASYNC = True            # False: chạy job ngay sau commit trong process hiện tại (dùng khi test)
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BACKOFF = 5             # giây, nhân đôi sau mỗi lần lỗi
+JOB_RETRY_MAX_BACKOFF = 600
+JOB_LOCK_TIMEOUT = 300            # job running lâu hơn (worker bị dừng) được đưa lại hàng đợi
+JOB_RETENTION_DAYS = 7            # job đã xong được xóa sau số ngày này
+
+# Change feed /api/events/ (core/outbox.py)
+OUTBOX_FEED_MAX_BATCH = 5000
+OUTBOX_RETENTION_DAYS = 30        # worker (runworker) xóa sự kiện cũ hơn
+
+# Hàm worker (runworker) gọi định kỳ: {đường dẫn import: số giây}
+PERIODIC_TASKS = {
+    'core.analytics.sync': 10,    # cộng đơn hàng mới / bị hủy vào bảng tổng hợp doanh số
+}
+
+# Báo cáo doanh số /api/analytics/ (core/analytics.py)
+ANALYTICS_DEFAULT_DAYS = 30       # khoảng mặc định khi không có ?from / ?to
+ANALYTICS_MAX_DAYS = 366
+ANALYTICS_TOP_PRODUCTS_MAX = 100
+
+# Gợi ý sản phẩm mua / yêu thích cùng (core/recommendations.py), tính bằng `manage.py build_recommendations`
+RECOMMENDATION_TOP_K = 10
+RECOMMENDATION_PURCHASE_WEIGHT = 1.0
+RECOMMENDATION_FAVORITE_WEIGHT = 0.5
+RECOMMENDATION_BLOCK_SIZE = 1000      # số sản phẩm mỗi khối của Mᵀ·M (bộ nhớ tỉ lệ với giá trị này)
+RECOMMENDATION_READ_CHUNK = 50_000    # số dòng đọc từ database mỗi lô
+
+# Việc phụ của đơn hàng (core/order_events.py)
+ORDER_EMAILS = os.environ.get('ORDER_EMAILS', '0') == '1'
+LOW_STOCK_THRESHOLD = 5
+
+# Ảnh thu nhỏ của sản phẩm (core/images.py)
+PRODUCT_IMAGE_WIDTHS = (160, 320, 640, 1280)
+PRODUCT_IMAGE_WORKERS = None      # số process resize ảnh, None = số CPU
+PRODUCT_IMAGE_ASYNC = True        # False: xử lý ngay trong request (dùng khi test)
+
+# Đo hiệu năng từng request: header Server-Timing, /api/metrics/ và log request chậm (core/metrics.py)
+PERF_METRICS = os.environ.get('PERF_METRICS', '1') == '1'
+PERF_SLOW_REQUEST_MS = int(os.environ.get('PERF_SLOW_REQUEST_MS', 500))
+PERF_SLOW_REQUEST_MAX_QUERIES = 50     # số câu SQL tối đa ghi vào log của một request chậm
+# Ngoài admin, Prometheus đọc /api/metrics/ bằng header "Authorization: Bearer <token>"
+PERF_METRICS_TOKEN = os.environ.get('PERF_METRICS_TOKEN', '')
+# Các IP đọc được /api/metrics/ không cần xác thực (VD: "10.0.0.5,10.0.0.6"), mặc định không có:
+# sau reverse proxy REMOTE_ADDR là địa chỉ của proxy nên mọi request đều khớp
+PERF_METRICS_ALLOWED_IPS = tuple(filter(None, os.environ.get('PERF_METRICS_ALLOWED_IPS', '').split(',')))
+if PERF_METRICS:
+    MIDDLEWARE.insert(0, 'core.metrics.PerformanceMiddleware')
+
 # Hoặc an toàn hơn cho production:
 # CORS_ALLOWED_ORIGINS = [
 #     "http://localhost:3000", # Địa chỉ của React App
@@ -103,6 +209,7 @@ DATABASES = {
 # ]
 
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -154,15 +261,17 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.TokenAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWT tin claim đã ký, không đọc bảng User mỗi request (core/authentication.py)
+        'core.authentication.FastJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     # Cấu hình thêm cho bộ lọc và tìm kiếm ở bước sau
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
-        'rest_framework.permissions.IsAuthenticated',
     ],
-    
+    # Phân trang mặc định (offset); sản phẩm và đơn hàng dùng keyset, xem core/pagination.py
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.StandardResultsSetPagination',
+    'PAGE_SIZE': 20,
 }
 
 # Cấu hình cho Simple JWT
@@ -200,7 +309,7 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_LIFETIME": timedelta(minutes=5),
     "SLIDING_TOKEN_REFRESH_LIFETIME": timedelta(days=1),
 
-    "TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainPairSerializer",
+    "TOKEN_OBTAIN_SERIALIZER": "core.authentication.ClaimsTokenObtainPairSerializer",
     "TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSerializer",
     "TOKEN_VERIFY_SERIALIZER": "rest_framework_simplejwt.serializers.TokenVerifySerializer",
     "TOKEN_BLACKLIST_SERIALIZER": "rest_framework_simplejwt.serializers.TokenBlacklistSerializer",
@@ -208,4 +317,8 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSlidingSerializer",
 }
 
+# Cache kết quả kiểm tra access token trong process (core/authentication.py)
+JWT_AUTH_CACHE_TTL = 30           # giây, không vượt quá hạn của token
+JWT_AUTH_CACHE_SIZE = 10_000      # số token tối đa giữ trong cache
+
 
@@ -0,0 +1,408 @@
+"""
+Báo cáo doanh số (admin) đọc từ các bảng tổng hợp DailySales, DailyCategorySales,
+DailyProductSales và ProductSales thay vì cộng OrderItem mỗi lần: báo cáo theo ngày
+đọc một dòng mỗi ngày (nhân số danh mục / sản phẩm có bán khi xem theo danh mục /
+sản phẩm), sản phẩm bán chạy từ trước tới nay đọc thẳng theo index của ProductSales.
+
+Cập nhật dần: sync() đọc các sự kiện order.created / order.status_changed của outbox
+(core/outbox.py) sau vị trí lưu trong SalesCursor, cộng chênh lệch vào các bảng và lưu
+vị trí trong cùng transaction nên mỗi sự kiện được cộng đúng một lần. Worker
+(`manage.py runworker`, PERIODIC_TASKS) gọi sync() định kỳ, nên checkout không phải
+tranh khóa hàng tổng hợp của ngày hôm nay.
+
+rebuild() tính lại từ Order / OrderItem theo từng khoảng ngày, song song trên nhiều
+process. Các process đọc cùng một snapshot REPEATABLE READ (pg_export_snapshot) với
+snapshot dùng để đặt lại SalesCursor, nên đơn hàng commit trong lúc rebuild được sync()
+cộng sau đúng một lần.
+"""
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+import django
+from django.db import OperationalError, connection, transaction
+from django.db.models import Count, DecimalField, F, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import outbox
+from .models import (DailyCategorySales, DailyProductSales, DailySales, Order, OrderItem, Product, ProductSales,
+                     SalesCursor)
+
+CANCELLED = 'cancelled'
+# SQLSTATE serialization_failure: snapshot REPEATABLE READ cũ hơn thay đổi cần khóa
+SERIALIZATION_FAILURE = '40001'
+REBUILD_ATTEMPTS = 5
+EVENT_TYPES = (outbox.ORDER_CREATED, outbox.ORDER_STATUS_CHANGED)
+CENT = Decimal('0.01')
+REVENUE_FIELD = DecimalField(max_digits=14, decimal_places=2)
+
+
+def local_date(value):
+    return timezone.localdate(value)
+
+
+def start_of(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class SalesDelta:
+    """
+    Chênh lệch cần cộng vào các bảng tổng hợp, gom theo khóa của từng bảng.
+    """
+
+    def __init__(self):
+        self.daily = defaultdict(lambda: [0, 0, Decimal(0)])        # ngày -> [orders, units, revenue]
+        self.categories = defaultdict(lambda: [0, Decimal(0)])     # (ngày, category_id) -> [units, revenue]
+        self.products = defaultdict(lambda: [0, Decimal(0)])       # (ngày, product_id) -> [units, revenue]
+
+    def add_order(self, day, sign, items, categories):
+        """
+        items: [(product_id, quantity, price)]; sign = 1 khi thêm đơn hàng, -1 khi bớt (hủy).
+        """
+        daily = self.daily[day]
+        daily[0] += sign
+        for product_id, quantity, price in items:
+            units, revenue = sign * quantity, sign * price * quantity
+            daily[1] += units
+            daily[2] += revenue
+            for row in (self.categories[day, categories.get(product_id)], self.products[day, product_id]):
+                row[0] += units
+                row[1] += revenue
+
+    def totals(self):
+        totals = defaultdict(lambda: [0, Decimal(0)])
+        for (_, product_id), (units, revenue) in self.products.items():
+            totals[product_id][0] += units
+            totals[product_id][1] += revenue
+        return totals
+
+    def save(self):
+        add_deltas(DailySales, ('date',), ('orders', 'units', 'revenue'), {(day,): row for day, row in self.daily.items()})
+        add_deltas(DailyCategorySales, ('date', 'category_id'), ('units', 'revenue'), self.categories)
+        # Sản phẩm đã bị xóa (cùng các OrderItem của nó) không còn trong bảng theo sản phẩm
+        existing = set(Product.objects.filter(pk__in={product_id for _, product_id in self.products}).values_list('pk', flat=True))
+        add_deltas(
+            DailyProductSales, ('date', 'product_id'), ('units', 'revenue'),
+            {key: row for key, row in self.products.items() if key[1] in existing},
+        )
+        add_deltas(
+            ProductSales, ('product_id',), ('units', 'revenue'),
+            {(product_id,): row for product_id, row in self.totals().items() if product_id in existing},
+        )
+
+
+def add_deltas(model, key_fields, value_fields, deltas):
+    """
+    Cộng deltas {khóa: [giá trị theo value_fields]} vào các dòng của model, tạo dòng
+    mới nếu chưa có. Chỉ gọi khi đang giữ SalesCursor (không có hai lần ghi đồng thời).
+    """
+    if not deltas:
+        return
+    query = Q()
+    for index, field in enumerate(key_fields):
+        values = {key[index] for key in deltas}
+        condition = Q(**{f'{field}__in': values - {None}})
+        if None in values:
+            condition |= Q(**{f'{field}__isnull': True})
+        query &= condition
+    rows = {tuple(getattr(row, field) for field in key_fields): row for row in model.objects.filter(query)}
+
+    changed, created = [], []
+    for key, values in deltas.items():
+        row = rows.get(key)
+        if row is None:
+            created.append(model(**dict(zip(key_fields, key)), **dict(zip(value_fields, values))))
+            continue
+        for field, value in zip(value_fields, values):
+            setattr(row, field, getattr(row, field) + value)
+        changed.append(row)
+    model.objects.bulk_update(changed, value_fields, batch_size=500)
+    model.objects.bulk_create(created, batch_size=500)
+
+
+def cancel_sign(old_status, new_status):
+    # Đơn hàng bị hủy thì trừ khỏi doanh số, khôi phục lại thì cộng vào
+    if new_status == CANCELLED and old_status != CANCELLED:
+        return -1
+    if old_status == CANCELLED and new_status != CANCELLED:
+        return 1
+    return 0
+
+
+def apply_events(events):
+    sales = []  # (ngày, dấu, [(product_id, quantity, price)])
+    status_changes = []
+    for event in events:
+        payload = event['payload']
+        if event['event_type'] == outbox.ORDER_CREATED:
+            if payload['status'] == CANCELLED:
+                continue
+            created_at = parse_datetime(payload['created_at']) if 'created_at' in payload else event['created_at']
+            items = [(item['product_id'], item['quantity'], Decimal(item['price'])) for item in payload['items']]
+            sales.append((local_date(created_at), 1, items))
+        else:
+            sign = cancel_sign(payload['old_status'], payload['new_status'])
+            if sign:
+                status_changes.append((event['object_id'], sign))
+
+    if status_changes:
+        order_ids = {order_id for order_id, _ in status_changes}
+        days = {pk: local_date(created_at) for pk, created_at in Order.objects.filter(pk__in=order_ids).values_list('pk', 'created_at')}
+        order_items = defaultdict(list)
+        rows = OrderItem.objects.filter(order_id__in=order_ids).values_list('order_id', 'product_id', 'quantity', 'price')
+        for order_id, product_id, quantity, price in rows:
+            order_items[order_id].append((product_id, quantity, price))
+        # Đơn hàng đã bị xóa thì bỏ qua
+        sales.extend((days[order_id], sign, order_items[order_id]) for order_id, sign in status_changes if order_id in days)
+
+    product_ids = {product_id for _, _, items in sales for product_id, _, _ in items}
+    categories = dict(Product.objects.filter(pk__in=product_ids).values_list('pk', 'category_id'))
+    delta = SalesDelta()
+    for day, sign, items in sales:
+        delta.add_order(day, sign, items, categories)
+    delta.save()
+
+
+def sync(batch_size=1000):
+    """
+    Cộng các sự kiện đơn hàng mới trong outbox vào bảng tổng hợp. Trả về số sự kiện đã xử lý.
+    """
+    SalesCursor.objects.get_or_create(pk=1)
+    processed = 0
+    while True:
+        with transaction.atomic():
+            # Khóa con trỏ: hai worker không cộng cùng một lô sự kiện
+            cursor = SalesCursor.objects.select_for_update().get(pk=1)
+            events, has_more = outbox.read((cursor.last_transaction_id, cursor.last_event_id), batch_size, EVENT_TYPES)
+            if not events:
+                return processed
+            counted = set(cursor.counted_transactions)
+            apply_events([event for event in events if event['transaction_id'] not in counted])
+            cursor.last_transaction_id, cursor.last_event_id = outbox.position(events[-1])
+            # Transaction đã đọc qua hết thì không cần nhớ nữa
+            cursor.counted_transactions = [
+                transaction_id for transaction_id in cursor.counted_transactions
+                if transaction_id >= cursor.last_transaction_id
+            ]
+            cursor.save(update_fields=['last_transaction_id', 'last_event_id', 'counted_transactions', 'updated_at'])
+        processed += len(events)
+        if not has_more:
+            return processed
+
+
+def use_snapshot(snapshot):
+    """
+    Đọc bằng snapshot đã export của process cha. Gọi đầu tiên trong transaction.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        cursor.execute('SET TRANSACTION SNAPSHOT %s', [snapshot])
+
+
+def rebuild_chunk(first_day, last_day, snapshot=None):
+    """
+    Tính lại các bảng theo ngày cho [first_day, last_day]. Không dùng kết nối của
+    process cha nên chạy được trong process con; snapshot: id từ pg_export_snapshot
+    của process cha. Trả về (số đơn hàng, {product_id: (units, revenue)}).
+    """
+    start, end = start_of(first_day), start_of(last_day + timedelta(days=1))
+    with transaction.atomic():
+        if snapshot is not None:
+            use_snapshot(snapshot)
+        orders = Order.objects.filter(created_at__gte=start, created_at__lt=end).exclude(status=CANCELLED)
+        order_counts = (
+            orders.order_by().annotate(day=TruncDate('created_at')).values('day').annotate(count=Count('pk'))
+        )
+        items = (
+            OrderItem.objects.filter(order__created_at__gte=start, order__created_at__lt=end)
+            .exclude(order__status=CANCELLED)
+            .annotate(day=TruncDate('order__created_at'))
+            .values('day', 'product_id', 'product__category_id')
+            .annotate(units=Sum('quantity'), revenue=Sum(F('price') * F('quantity'), output_field=REVENUE_FIELD))
+            .order_by()
+        )
+
+        delta = SalesDelta()
+        for row in order_counts:
+            delta.daily[row['day']][0] += row['count']
+        for row in items:
+            daily = delta.daily[row['day']]
+            daily[1] += row['units']
+            daily[2] += row['revenue']
+            for target in (delta.categories[row['day'], row['product__category_id']], delta.products[row['day'], row['product_id']]):
+                target[0] += row['units']
+                target[1] += row['revenue']
+
+        for model in (DailySales, DailyCategorySales, DailyProductSales):
+            model.objects.filter(date__range=(first_day, last_day)).delete()
+        DailySales.objects.bulk_create(
+            [DailySales(date=day, orders=orders, units=units, revenue=revenue) for day, (orders, units, revenue) in delta.daily.items()],
+            batch_size=1000,
+        )
+        DailyCategorySales.objects.bulk_create([
+            DailyCategorySales(date=day, category_id=category_id, units=units, revenue=revenue)
+            for (day, category_id), (units, revenue) in delta.categories.items()
+        ], batch_size=1000)
+        DailyProductSales.objects.bulk_create([
+            DailyProductSales(date=day, product_id=product_id, units=units, revenue=revenue)
+            for (day, product_id), (units, revenue) in delta.products.items()
+        ], batch_size=1000)
+    totals = {product_id: tuple(row) for product_id, row in delta.totals().items()}
+    return sum(row[0] for row in delta.daily.values()), totals
+
+
+def day_chunks(first_day, last_day, chunk_days):
+    while first_day <= last_day:
+        end = min(first_day + timedelta(days=chunk_days - 1), last_day)
+        yield first_day, end
+        first_day = end + timedelta(days=1)
+
+
+def is_serialization_failure(exc):
+    cause = exc.__cause__
+    return SERIALIZATION_FAILURE in (getattr(cause, 'sqlstate', None), getattr(cause, 'pgcode', None))
+
+
+def rebuild(workers=None, chunk_days=30, progress=None):
+    """
+    Tính lại toàn bộ bảng tổng hợp, mỗi khoảng chunk_days ngày một tác vụ chạy song
+    song trên `workers` process (mặc định bằng số CPU; 0 để chạy trong process hiện
+    tại). Chỉ PostgreSQL chạy song song được: process con cần snapshot của process
+    cha. Trả về số đơn hàng đã tính.
+    """
+    SalesCursor.objects.get_or_create(pk=1)
+    if connection.vendor != 'postgresql':
+        # SQLite chỉ có một transaction ghi tại một thời điểm: cả quá trình là một snapshot
+        with transaction.atomic():
+            return _rebuild(0, chunk_days, progress)
+    outermost = not connection.in_atomic_block
+    for attempt in range(1, REBUILD_ATTEMPTS + 1):
+        try:
+            with transaction.atomic():
+                if outermost:
+                    with connection.cursor() as cursor:
+                        cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+                else:
+                    # Đang trong transaction của nơi gọi: không đổi được mức cô lập, chạy tuần tự trong đó
+                    workers = 0
+                # Giữ khóa con trỏ suốt quá trình để sync() không chạy xen vào. Khóa lấy
+                # ngay sau khi snapshot được tạo; sync() vừa ghi con trỏ thì thử lại.
+                SalesCursor.objects.select_for_update().get(pk=1)
+                return _rebuild(workers, chunk_days, progress)
+        except OperationalError as exc:
+            if not is_serialization_failure(exc) or attempt == REBUILD_ATTEMPTS:
+                raise
+
+
+def _rebuild(workers, chunk_days, progress):
+    # Đọc trong cùng snapshot với Order / OrderItem bên dưới: sự kiện tới vị trí này
+    # đã nằm trong dữ liệu được tính lại, sync() cộng các sự kiện sau đó
+    after, counted = outbox.snapshot_position(EVENT_TYPES)
+    bounds = Order.objects.aggregate(first=Min('created_at'), last=Max('created_at'))
+    if bounds['first'] is None:
+        chunks = []
+        first_day = last_day = None
+    else:
+        first_day, last_day = local_date(bounds['first']), local_date(bounds['last'])
+        chunks = list(day_chunks(first_day, last_day, chunk_days))
+
+    # Ngày ngoài khoảng có đơn hàng (đơn hàng đã bị xóa)
+    for model in (DailySales, DailyCategorySales, DailyProductSales):
+        stale = model.objects.all()
+        if first_day is not None:
+            stale = stale.exclude(date__range=(first_day, last_day))
+        stale.delete()
+
+    total = 0
+    product_totals = defaultdict(lambda: [0, Decimal(0)])
+
+    def add(result):
+        orders, totals = result
+        for product_id, (units, revenue) in totals.items():
+            product_totals[product_id][0] += units
+            product_totals[product_id][1] += revenue
+        return orders
+
+    if workers == 0:
+        for done, (start, end) in enumerate(chunks, 1):
+            total += add(rebuild_chunk(start, end))
+            if progress is not None:
+                progress(done, len(chunks))
+    else:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_export_snapshot()')
+            snapshot = cursor.fetchone()[0]
+        # spawn thay vì fork: process con không dùng chung kết nối (đang giữ transaction) của process cha.
+        # Process con tự cấu hình Django (django.setup) trước khi nhận rebuild_chunk.
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as executor:
+            futures = [executor.submit(rebuild_chunk, start, end, snapshot) for start, end in chunks]
+            for done, future in enumerate(futures, 1):
+                total += add(future.result())
+                if progress is not None:
+                    progress(done, len(chunks))
+
+    # Tổng theo sản phẩm cộng từ kết quả các lô: snapshot của process này không thấy
+    # các dòng process con vừa ghi
+    ProductSales.objects.all().delete()
+    ProductSales.objects.bulk_create([
+        ProductSales(product_id=product_id, units=units, revenue=revenue)
+        for product_id, (units, revenue) in product_totals.items()
+    ], batch_size=1000)
+    SalesCursor.objects.filter(pk=1).update(
+        last_transaction_id=after[0], last_event_id=after[1], counted_transactions=counted,
+    )
+    return total
+
+
+def money(value):
+    return str((value or Decimal(0)).quantize(CENT))
+
+
+def summary(start, end):
+    row = DailySales.objects.filter(date__range=(start, end)).aggregate(
+        orders=Sum('orders'), units=Sum('units'), revenue=Sum('revenue'),
+    )
+    return {'orders': row['orders'] or 0, 'units': row['units'] or 0, 'revenue': money(row['revenue'])}
+
+
+def revenue_by_day(start, end):
+    rows = DailySales.objects.filter(date__range=(start, end)).order_by('date').values('date', 'orders', 'units', 'revenue')
+    return [{**row, 'revenue': money(row['revenue'])} for row in rows]
+
+
+def revenue_by_category(start, end):
+    rows = (
+        DailyCategorySales.objects.filter(date__range=(start, end))
+        .values('category_id', category_name=F('category__name'))
+        .annotate(units=Sum('units'), revenue=Sum('revenue'))
+        .order_by('-revenue', 'category_id')
+    )
+    return [{**row, 'revenue': money(row['revenue'])} for row in rows]
+
+
+def top_products(start=None, end=None, limit=10, order_by='units'):
+    """
+    Sản phẩm bán chạy theo units hoặc revenue; không có khoảng ngày thì lấy tổng từ trước tới nay.
+    """
+    fields = {'name': F('product__name'), 'slug': F('product__slug')}
+    if start is None and end is None:
+        rows = ProductSales.objects.values('product_id', **fields, total_units=F('units'), total_revenue=F('revenue'))
+    else:
+        rows = (
+            DailyProductSales.objects.filter(date__range=(start, end))
+            .values('product_id', **fields)
+            .annotate(total_units=Sum('units'), total_revenue=Sum('revenue'))
+        )
+    rows = rows.order_by(f'-total_{order_by}', 'product_id')[:limit]
+    return [
+        {
+            'product_id': row['product_id'], 'name': row['name'], 'slug': row['slug'],
+            'units': row['total_units'], 'revenue': money(row['total_revenue']),
+        }
+        for row in rows
+    ]
@@ -0,0 +1,103 @@
+"""
+View async (ASGI) cho các endpoint đọc catalog công khai: danh mục, danh sách /
+chi tiết sản phẩm và đánh giá của sản phẩm (/api/async/...).
+
+Payload giống hệt endpoint đồng bộ tương ứng với người dùng ẩn danh. Việc dựng
+queryset (bộ lọc, tìm kiếm, sắp xếp, phân trang) dùng lại code của các viewset
+DRF; phần đọc database chạy bằng async ORM (`async for`, `aget`, `acount`) nên
+worker ASGI không bị chiếm trong lúc chờ database hay client chậm. Các view này
+không xác thực (luôn ẩn danh) và không đi qua cache catalog.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from rest_framework import exceptions
+from rest_framework.request import Request
+
+from .fast_serializers import ProductValuesSerializer
+from .models import Product
+from .pagination import AsyncPageNumberPagination, ReviewKeysetPagination
+from .renderers import FastJSONRenderer
+from .serializers import CategorySerializer, ProductReviewSerializer, ProductSerializer
+from .views import CategoryViewSet, ProductViewSet
+
+renderer = FastJSONRenderer()
+
+
+def render(data, status=200):
+    return HttpResponse(renderer.render(data), status=status, content_type=renderer.media_type)
+
+
+def api_view(func):
+    """
+    Chỉ nhận GET, truyền Request của DRF (không authenticator, tức ẩn danh) cho view
+    và trả lỗi cùng định dạng với exception handler của DRF.
+    """
+    @functools.wraps(func)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return render({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+        try:
+            return render(await func(Request(request), *args, **kwargs))
+        except Http404 as exc:
+            return render({'detail': str(exc) if exc.args else 'Not found.'}, status=404)
+        except exceptions.APIException as exc:
+            data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            return render(data, status=exc.status_code)
+    return wrapper
+
+
+def get_view(viewset_class, request, action, **kwargs):
+    return viewset_class(action=action, request=request, args=(), kwargs=kwargs, format_kwarg=None)
+
+
+async def filtered_queryset(view):
+    # Bộ lọc có thể truy vấn database (VD: kiểm tra ?category= tồn tại) nên chạy trong thread
+    return await sync_to_async(lambda: view.filter_queryset(view.get_queryset()))()
+
+
+async def get_product(queryset, slug):
+    try:
+        return await queryset.aget(slug=slug)
+    except Product.DoesNotExist:
+        raise Http404('No Product matches the given query.')
+
+
+@api_view
+async def category_list(request):
+    view = get_view(CategoryViewSet, request, 'list')
+    queryset = await filtered_queryset(view)
+    paginator = AsyncPageNumberPagination()
+    page = await paginator.apaginate_queryset(queryset, request)
+    serializer = CategorySerializer(page, many=True, context=view.get_serializer_context())
+    return paginator.get_paginated_response(serializer.data).data
+
+
+@api_view
+async def product_list(request):
+    view = get_view(ProductViewSet, request, 'list')
+    queryset = await filtered_queryset(view)
+    serializer = ProductValuesSerializer(context=view.get_serializer_context())
+    paginator = view.paginator
+    rows = view.values_queryset(serializer, queryset)
+    page = paginator.get_page([row async for row in paginator.get_page_queryset(rows, request)])
+    return paginator.get_paginated_response(serializer.serialize(page)).data
+
+
+@api_view
+async def product_detail(request, slug):
+    view = get_view(ProductViewSet, request, 'retrieve', slug=slug)
+    product = await get_product(await filtered_queryset(view), slug)
+    return ProductSerializer(product, context=view.get_serializer_context()).data
+
+
+@api_view
+async def product_reviews(request, slug):
+    view = get_view(ProductViewSet, request, 'reviews', slug=slug)
+    product = await get_product(Product.objects.filter(is_available=True).only('id'), slug)
+    queryset = ProductReviewSerializer.setup_eager_loading(product.reviews.order_by('-created_at', '-id'))
+    paginator = ReviewKeysetPagination()
+    page = paginator.get_page([review async for review in paginator.get_page_queryset(queryset, request)])
+    serializer = ProductReviewSerializer(page, many=True, context=view.get_serializer_context())
+    return paginator.get_paginated_response(serializer.data).data
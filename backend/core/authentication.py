@@ -0,0 +1,108 @@
+"""
+Xác thực JWT không đọc database cho mỗi request.
+
+JWTAuthentication của simplejwt đọc bảng User ở mọi request. Access token do
+/api/token/ cấp (ClaimsTokenObtainPairSerializer) mang thêm is_staff, is_superuser
+và is_active; FastJWTAuthentication tin các claim đã ký này và dựng một ClaimsUser:
+instance User chỉ có các field đó, các field còn lại (username, email...) chỉ được
+đọc từ database khi view thực sự dùng tới (một query cho cả bản ghi).
+
+Kết quả giải mã token được giữ trong bộ nhớ process JWT_AUTH_CACHE_TTL giây (không
+quá hạn của token) nên request lặp lại với cùng token không phải kiểm tra chữ ký.
+Token cũ không có các claim này vẫn được xác thực bằng cách đọc database như trước.
+
+Đánh đổi: khóa tài khoản hoặc bỏ quyền staff chỉ có hiệu lực với access token được
+cấp sau đó (access token sống ACCESS_TOKEN_LIFETIME).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework import exceptions
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import USER_CLAIMS, ClaimsUser
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Thêm USER_CLAIMS vào refresh token; access token tạo từ refresh (kể cả ở
+    /api/token/refresh/) sao chép lại các claim này.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for claim in USER_CLAIMS:
+            token[claim] = getattr(user, claim)
+        return token
+
+
+class TokenCache:
+    """
+    Cache LRU có hạn trong process: token thô -> (hạn, user_id, claims, token đã kiểm tra).
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache(getattr(settings, 'JWT_AUTH_CACHE_SIZE', 10_000))
+
+
+class FastJWTAuthentication(JWTAuthentication):
+    """
+    Thay cho JWTAuthentication trong DEFAULT_AUTHENTICATION_CLASSES.
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        entry = token_cache.get(raw_token)
+        if entry is not None:
+            _, user_id, claims, validated_token = entry
+            return ClaimsUser.from_claims(user_id, claims), validated_token
+
+        validated_token = self.get_validated_token(raw_token)
+        if not all(claim in validated_token for claim in USER_CLAIMS):
+            # Token cấp trước khi có claim: đọc User từ database
+            return self.get_user(validated_token), validated_token
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        claims = {claim: validated_token[claim] for claim in USER_CLAIMS}
+        if not claims['is_active']:
+            raise exceptions.AuthenticationFailed('User is inactive', code='user_inactive')
+        ttl = getattr(settings, 'JWT_AUTH_CACHE_TTL', 30)
+        expires = min(time.time() + ttl, validated_token['exp'])
+        token_cache.set(raw_token, (expires, user_id, claims, validated_token))
+        return ClaimsUser.from_claims(user_id, claims), validated_token
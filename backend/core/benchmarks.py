@@ -0,0 +1,703 @@
+"""
+Các kịch bản benchmark chạy bằng `python manage.py benchmark <tên>`.
+
+Mỗi kịch bản nhận `options` (dict các tham số dòng lệnh) và trả về list các dòng
+kết quả dạng dict để command in ra bảng hoặc JSON. Kết quả JSON có thể lưu lại làm
+baseline; `compare` ghép các dòng theo cột khóa của kịch bản để so sánh.
+"""
+import json
+import os
+import re
+import resource
+import statistics
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, reset_queries, transaction
+from django.db.models import Q
+from django.http import HttpResponse
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from . import catalog_io
+from .authentication import ClaimsTokenObtainPairSerializer, FastJWTAuthentication, token_cache
+from . import fast_serializers
+from . import metrics
+from . import outbox
+from . import ratings
+from . import serializers
+from .models import Cart, CartItem, Category, Favorite, Order, OrderItem, OutboxEvent, Product, ProductReview
+from .pagination import ProductKeysetPagination
+from .renderers import FastJSONRenderer
+from .search import RANK_FIELD, icontains_search, search_products, supports_full_text
+
+SCENARIOS = {}
+# Tên kịch bản -> các cột xác định một dòng kết quả (để so với baseline)
+SCENARIO_KEYS = {}
+
+
+def scenario(name, key=()):
+    def register(func):
+        SCENARIOS[name] = func
+        SCENARIO_KEYS[name] = key
+        return func
+    return register
+
+
+def measure(func, repeat):
+    """
+    Chạy func `repeat` lần, trả về (median, p95) thời gian tính bằng mili giây.
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), percentile(timings, 0.95)
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def format_table(rows):
+    """
+    Các dòng văn bản của bảng kết quả (cột lấy theo khóa của dòng đầu tiên).
+    """
+    if not rows:
+        return []
+    columns = list(rows[0])
+    widths = [max(len(str(column)), *(len(str(row[column])) for row in rows)) for column in columns]
+    lines = ['  '.join(str(c).ljust(w) for c, w in zip(columns, widths))]
+    for row in rows:
+        lines.append('  '.join(str(row[c]).ljust(w) for c, w in zip(columns, widths)))
+    return lines
+
+
+def is_metric(column):
+    return column.endswith(('_ms', '_us', '_per_s', '_mb')) or column in ('queries', 'speedup')
+
+
+def higher_is_better(column):
+    return column.endswith('_per_s') or column == 'speedup'
+
+
+def compare(results, baseline, threshold=None):
+    """
+    So sánh kết quả với baseline (cùng định dạng JSON của `benchmark --json`): với
+    mỗi dòng có trong cả hai và mỗi cột số đo, trả về giá trị cũ / mới và % thay đổi.
+    Dòng bị đánh dấu regression khi xấu đi quá `threshold` phần trăm.
+    """
+    rows = []
+    for name, current_rows in results.items():
+        key_columns = SCENARIO_KEYS.get(name, ())
+        previous = {tuple(row.get(column) for column in key_columns): row for row in baseline.get(name, [])}
+        for row in current_rows:
+            old_row = previous.get(tuple(row.get(column) for column in key_columns))
+            if old_row is None:
+                continue
+            for column, value in row.items():
+                old = old_row.get(column)
+                if column in key_columns or not is_metric(column):
+                    continue
+                if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or old == 0:
+                    continue
+                change = (value - old) / old * 100
+                worse = change < 0 if higher_is_better(column) else change > 0
+                rows.append({
+                    'scenario': name,
+                    'row': ' '.join(str(row.get(column)) for column in key_columns),
+                    'metric': column,
+                    'baseline': old,
+                    'current': value,
+                    'change_%': round(change, 1),
+                    'regression': threshold is not None and worse and abs(change) > threshold,
+                })
+    return rows
+
+
+def api_client(user=None):
+    client = APIClient(SERVER_NAME='localhost')
+    if user is not None:
+        client.force_authenticate(user)
+    return client
+
+
+def delete_in_batches(queryset, batch_size=5000):
+    # delete() trên cả queryset nạp mọi đối tượng liên quan vào bộ nhớ cùng lúc
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        queryset.model.objects.filter(pk__in=ids).delete()
+
+
+def benchmark_admin():
+    user, _ = User.objects.get_or_create(username='benchmark-admin', defaults={'is_staff': True})
+    return user
+
+
+@scenario('pagination', key=('ordering', 'page'))
+def pagination(options):
+    """
+    So sánh phân trang offset (?page=) với keyset (?cursor=) ở các độ sâu trang khác nhau.
+    """
+    page_size = ProductKeysetPagination.page_size
+    total = Product.objects.filter(is_available=True).count()
+    admin_client = api_client(benchmark_admin())
+    public_client = api_client()
+
+    rows = []
+    for ordering in ('-created_at', 'price'):
+        paginator = ProductKeysetPagination()
+        paginator.ordering = ordering
+        field = ordering.lstrip('-')
+        tiebreak = '-id' if ordering.startswith('-') else 'id'
+        ordered = Product.objects.filter(is_available=True).order_by(ordering, tiebreak)
+
+        for page in (1, 10, 100, 1_000, 10_000, 50_000):
+            if (page - 1) * page_size >= total:
+                break
+            offset_url = f'/api/products/?ordering={ordering}&page={page}'
+            keyset_url = f'/api/products/?ordering={ordering}'
+            if page > 1:
+                # Cursor của bản ghi cuối trang trước (không tính vào thời gian đo)
+                last = ordered.values_list(field, 'pk')[(page - 1) * page_size - 1]
+                cursor = paginator.encode_cursor((paginator.serialize_value(last[0]), last[1]))
+                keyset_url += f'&cursor={cursor}'
+
+            offset_median, offset_p95 = measure(lambda: admin_client.get(offset_url), options['repeat'])
+            keyset_median, keyset_p95 = measure(lambda: public_client.get(keyset_url), options['repeat'])
+            rows.append({
+                'ordering': ordering,
+                'page': page,
+                'offset_median_ms': round(offset_median, 2),
+                'offset_p95_ms': round(offset_p95, 2),
+                'keyset_median_ms': round(keyset_median, 2),
+                'keyset_p95_ms': round(keyset_p95, 2),
+            })
+    return rows
+
+
+@scenario('search', key=('term',))
+def search(options):
+    """
+    So sánh ILIKE trên name/description với backend tìm kiếm hiện tại (full-text trên PostgreSQL).
+    """
+    products = Product.objects.filter(is_available=True).defer('search_vector')
+    backend = 'full-text' if supports_full_text(products) else 'icontains'
+    rows = []
+
+    def ranked(term):
+        # Giống API: kết quả full-text được xếp theo độ liên quan
+        results = search_products(products, term)
+        if RANK_FIELD in results.query.annotations:
+            results = results.order_by(f'-{RANK_FIELD}', '-id')
+        return list(results[:20])
+
+    for term in ('laptop', 'dell gaming', 'tai nghe không dây', 'lapotp'):
+        ilike_median, ilike_p95 = measure(lambda: list(icontains_search(products, term)[:20]), options['repeat'])
+        backend_median, backend_p95 = measure(lambda: ranked(term), options['repeat'])
+        rows.append({
+            'term': term,
+            'backend': backend,
+            'ilike_median_ms': round(ilike_median, 2),
+            'ilike_p95_ms': round(ilike_p95, 2),
+            'backend_median_ms': round(backend_median, 2),
+            'backend_p95_ms': round(backend_p95, 2),
+            'matches': search_products(products, term).count(),
+        })
+    return rows
+
+
+@scenario('import', key=('format',))
+def import_export(options):
+    """
+    Nhập `--rows` sản phẩm từ file JSONL/CSV tạm (lần hai là upsert) rồi xuất lại, đo
+    số dòng/giây và RSS cao nhất của process để kiểm tra bộ nhớ không tăng theo số dòng.
+    """
+    rows = options['rows']
+    Category.objects.get_or_create(slug='bench-import', defaults={'name': 'bench import'})
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for file_format in catalog_io.FORMATS:
+            path = os.path.join(directory, f'products.{file_format}')
+            with open(path, 'w', encoding='utf-8', newline='') as output:
+                records = (
+                    {
+                        'slug': f'bench-import-{i}', 'name': f'Bench import {i}', 'description': 'Sản phẩm nhập thử',
+                        'price': f'{i % 1000}.99', 'stock': i % 50, 'is_available': True, 'category': 'bench-import',
+                    }
+                    for i in range(rows)
+                )
+                if file_format == 'csv':
+                    output.write(','.join(catalog_io.PRODUCT_COLUMNS) + '\n')
+                    for record in records:
+                        output.write(','.join(str(record[column]) for column in catalog_io.PRODUCT_COLUMNS) + '\n')
+                else:
+                    for record in records:
+                        output.write(json.dumps(record) + '\n')
+
+            def run_import():
+                with open(path, encoding='utf-8', newline='') as stream:
+                    return catalog_io.import_catalog(stream, catalog_io.PRODUCTS, file_format)
+
+            delete_in_batches(Product.objects.filter(slug__startswith='bench-import-'))
+            started = time.perf_counter()
+            result = run_import()
+            insert_seconds = time.perf_counter() - started
+            started = time.perf_counter()
+            run_import()
+            upsert_seconds = time.perf_counter() - started
+            started = time.perf_counter()
+            exported = sum(1 for _ in catalog_io.export_catalog(catalog_io.PRODUCTS, file_format))
+            export_seconds = time.perf_counter() - started
+
+            results.append({
+                'format': file_format,
+                'rows': rows,
+                'imported': result.created_or_updated,
+                'insert_rows_per_s': round(rows / insert_seconds),
+                'upsert_rows_per_s': round(rows / upsert_seconds),
+                'exported': exported,
+                'export_rows_per_s': round(exported / export_seconds),
+                'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            })
+    return results
+
+
+# Serializer trong core/serializers.py -> (model, ValuesSerializer tương ứng nếu có)
+SERIALIZER_BENCHMARKS = [
+    (serializers.CategorySerializer, Category, None),
+    (serializers.ProductSerializer, Product, fast_serializers.ProductValuesSerializer),
+    (serializers.OrderItemSerializer, OrderItem, fast_serializers.OrderItemValuesSerializer),
+    (serializers.OrderSerializer, Order, fast_serializers.OrderValuesSerializer),
+    (serializers.CartItemSerializer, CartItem, None),
+    (serializers.CompactCartItemSerializer, CartItem, None),
+    (serializers.CartSerializer, Cart, None),
+    (serializers.CompactCartSerializer, Cart, None),
+    (serializers.ProductReviewSerializer, ProductReview, None),
+    (serializers.FavoriteSerializer, Favorite, fast_serializers.FavoriteValuesSerializer),
+]
+
+
+@scenario('serializers', key=('serializer',))
+def serializer_throughput(options):
+    """
+    Số object/giây của từng serializer (object đã nạp sẵn, không tính query), so với
+    ValuesSerializer (core/fast_serializers.py, tính cả query Order.items) và tốc độ
+    render JSON của JSONRenderer / FastJSONRenderer trên cùng payload.
+    """
+    limit = options['objects']
+    context = {'request': Request(APIRequestFactory().get('/', SERVER_NAME='localhost'))}
+    rows = []
+    for serializer_class, model, values_class in SERIALIZER_BENCHMARKS:
+        queryset = model.objects.order_by('pk')
+        instances = list(serializer_class.setup_eager_loading(queryset)[:limit])
+        row = dict.fromkeys(
+            ['serializer', 'objects', 'drf_objects_per_s', 'values_objects_per_s', 'speedup', 'json_render_ms', 'fast_render_ms'],
+            '-',
+        )
+        row.update(serializer=serializer_class.__name__, objects=len(instances))
+        rows.append(row)
+        if not instances:
+            continue
+        count = len(instances)
+        drf_median, _ = measure(lambda: serializer_class(instances, many=True, context=context).data, options['repeat'])
+        row['drf_objects_per_s'] = round(count / (drf_median / 1000))
+        if values_class is not None:
+            values = list(values_class(context).values(queryset)[:limit])
+            values_median, _ = measure(lambda: values_class(context).serialize(values), options['repeat'])
+            row['values_objects_per_s'] = round(count / (values_median / 1000))
+            row['speedup'] = round(drf_median / values_median, 1)
+
+        data = serializer_class(instances, many=True, context=context).data
+        json_median, _ = measure(lambda: JSONRenderer().render(data), options['repeat'])
+        fast_median, _ = measure(lambda: FastJSONRenderer().render(data), options['repeat'])
+        row['json_render_ms'] = round(json_median, 2)
+        row['fast_render_ms'] = round(fast_median, 2)
+    return rows
+
+
+@scenario('middleware', key=('queries',))
+def middleware_overhead(options):
+    """
+    Chi phí của PerformanceMiddleware (core/metrics.py) cho mỗi request: bọc một view
+    giả chạy N câu `SELECT 1` và trả về 4 KB, so với gọi view trực tiếp (micro giây).
+    """
+    metrics.install_query_wrapper(None, connection)
+    request = APIRequestFactory().get('/api/products/')
+    calls = 200
+    rows = []
+    for query_count in (0, 10, 50):
+        def view(request):
+            with connection.cursor() as cursor:
+                for _ in range(query_count):
+                    cursor.execute('SELECT 1')
+            return HttpResponse(b'x' * 4096)
+
+        middleware = metrics.PerformanceMiddleware(view)
+
+        def run(handler):
+            for _ in range(calls):
+                handler(request)
+
+        bare_median, _ = measure(lambda: run(view), options['repeat'])
+        instrumented_median, _ = measure(lambda: run(middleware), options['repeat'])
+        rows.append({
+            'queries': query_count,
+            'bare_us': round(bare_median * 1000 / calls, 1),
+            'instrumented_us': round(instrumented_median * 1000 / calls, 1),
+            'overhead_us': round((instrumented_median - bare_median) * 1000 / calls, 1),
+        })
+    return rows
+
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+
+ORDER_PAYLOAD = {
+    'first_name': 'Nguyễn', 'last_name': 'Văn A', 'email': 'buyer@example.com', 'address': '1 Lê Lợi',
+    'postal_code': '70000', 'city': 'HCM', 'items': [{'product_id': '{product}', 'quantity': 1}],
+}
+
+
+def category_upload():
+    return {'file': SimpleUploadedFile('categories.csv', b'slug,name,description\nbench-upload,Bench upload,\n')}
+
+
+# Mọi route trong core/urls.py: (tên URL, method, đường dẫn, người gọi, body).
+# Người gọi: None (ẩn danh), 'user' (người dùng benchmark) hoặc 'admin'; body là hàm
+# thì được gửi dạng multipart. Request ghi được chạy trong transaction rồi rollback.
+API_ROUTES = [
+    ('api-root', 'GET', '', None, None),
+    ('category-list', 'GET', 'categories/', None, None),
+    ('category-detail', 'GET', 'categories/{category}/', None, None),
+    ('product-list', 'GET', 'products/', None, None),
+    ('product-list', 'GET', 'products/?ordering=price&category={category}', None, None),
+    ('product-list', 'GET', 'products/?search=laptop', None, None),
+    ('product-list', 'GET', 'products/?page=last', 'admin', None),
+    ('product-list', 'POST', 'products/', 'admin', {
+        'name': 'Benchmark', 'slug': 'benchmark-new', 'description': '...', 'price': '10.00',
+        'stock': 5, 'category': '{category}',
+    }),
+    ('product-detail', 'GET', 'products/{slug}/', None, None),
+    ('product-detail', 'PATCH', 'products/{slug}/', 'admin', {'stock': 99}),
+    ('product-reviews', 'GET', 'products/{slug}/reviews/', None, None),
+    ('product-related', 'GET', 'products/{slug}/related/', None, None),
+    ('order-list', 'GET', 'orders/', 'user', None),
+    ('order-list', 'GET', 'orders/?status=delivered', 'user', None),
+    ('order-detail', 'GET', 'orders/{order}/', 'user', None),
+    ('cart-list', 'GET', 'carts/', 'user', None),
+    ('cart-list', 'POST', 'carts/', 'user', {}),
+    ('cart-detail', 'GET', 'carts/{cart}/', 'user', None),
+    ('cart-add-item', 'POST', 'carts/{cart}/add_item/', 'user', {'product_id': '{product}', 'quantity': 1}),
+    ('cart-update-item', 'POST', 'carts/{cart}/update_item/', 'user', {'item_id': '{cart_item}', 'quantity': 2}),
+    ('cart-remove-item', 'DELETE', 'carts/{cart}/remove_item/', 'user', {'item_id': '{cart_item}'}),
+    ('review-list', 'GET', 'reviews/', 'user', None),
+    ('review-list', 'POST', 'reviews/', 'user', {'product': '{product}', 'rating': 4, 'comment': 'Benchmark'}),
+    ('review-detail', 'GET', 'reviews/{review}/', 'user', None),
+    ('review-detail', 'PATCH', 'reviews/{review}/', 'user', {'rating': 3}),
+    ('favorites-list', 'GET', 'favorites/', 'user', None),
+    ('favorites-detail', 'GET', 'favorites/{favorite}/', 'user', None),
+    ('favorites-detail', 'DELETE', 'favorites/{favorite}/', 'user', None),
+    ('auth_register', 'POST', 'register/', None, {
+        'username': 'benchmark-new', 'password': BENCHMARK_PASSWORD, 'email': 'new@example.com',
+    }),
+    ('auth_login', 'POST', 'login/', None, {'username': 'benchmark-user', 'password': BENCHMARK_PASSWORD}),
+    ('token_obtain_pair', 'POST', 'token/', None, {'username': 'benchmark-user', 'password': BENCHMARK_PASSWORD}),
+    ('token_refresh', 'POST', 'token/refresh/', None, {'refresh': '{refresh}'}),
+    ('user_profile', 'GET', 'profile/', 'user', None),
+    ('create_order', 'POST', 'order/create/', 'user', ORDER_PAYLOAD),
+    ('update_order_status', 'PATCH', 'order/{order}/status/', 'user', {'status': 'shipped'}),
+    ('catalog_export', 'GET', 'catalog/export/?kind=categories', 'admin', None),
+    ('catalog_import', 'POST', 'catalog/import/?kind=categories&file_format=csv', 'admin', category_upload),
+    ('metrics', 'GET', 'metrics/', None, None),
+    ('event_feed', 'GET', 'events/?after=0&limit=500', 'admin', None),
+    ('analytics-summary', 'GET', 'analytics/summary/', 'admin', None),
+    ('analytics-revenue', 'GET', 'analytics/revenue/?group=day', 'admin', None),
+    ('analytics-revenue', 'GET', 'analytics/revenue/?group=category', 'admin', None),
+    ('analytics-top-products', 'GET', 'analytics/top-products/?by=revenue', 'admin', None),
+    ('async_category_list', 'GET', 'async/categories/', None, None),
+    ('async_product_list', 'GET', 'async/products/', None, None),
+    ('async_product_detail', 'GET', 'async/products/{slug}/', None, None),
+    ('async_product_reviews', 'GET', 'async/products/{slug}/reviews/', None, None),
+]
+
+
+def fill(value, values):
+    if isinstance(value, str):
+        return value.format_map(values)
+    if isinstance(value, dict):
+        return {key: fill(item, values) for key, item in value.items()}
+    if isinstance(value, list):
+        return [fill(item, values) for item in value]
+    return value
+
+
+def api_fixtures():
+    """
+    Người dùng benchmark có sẵn đơn hàng, giỏ hàng, đánh giá, yêu thích; trả về các
+    id dùng để điền vào đường dẫn của API_ROUTES.
+    """
+    user, created = User.objects.get_or_create(username='benchmark-user', defaults={'email': 'bench@example.com'})
+    if created:
+        user.set_password(BENCHMARK_PASSWORD)
+        user.save()
+    product = (
+        Product.objects.filter(is_available=True, stock__gte=10, category__isnull=False)
+        .order_by('-rating_count', 'pk').first()
+    )
+    if product is None:
+        raise ValueError('Cần ít nhất một sản phẩm còn hàng có danh mục, chạy seed_catalog trước.')
+    order = user.orders.first()
+    if order is None:
+        order = Order.objects.create(user=user, total_price=product.price, **{
+            key: value for key, value in ORDER_PAYLOAD.items() if key != 'items'
+        })
+        OrderItem.objects.create(order=order, product=product, price=product.price)
+    cart = user.carts.first() or Cart.objects.create(user=user)
+    cart_item, _ = CartItem.objects.get_or_create(cart=cart, product=product)
+    review = user.reviews.first()
+    if review is None:
+        review = ProductReview.objects.create(user=user, product=product, rating=5)
+        ratings.review_created(review)
+    favorite, _ = Favorite.objects.get_or_create(user=user, product=product)
+    return user, {
+        'slug': product.slug, 'product': product.pk, 'category': product.category_id, 'order': order.pk,
+        'cart': cart.pk, 'cart_item': cart_item.pk, 'review': review.pk, 'favorite': favorite.pk,
+        'refresh': str(RefreshToken.for_user(user)),
+    }
+
+
+def request_percentiles(timings, elapsed):
+    timings = sorted(timings)
+    return {
+        'req_per_s': round(len(timings) / elapsed, 1),
+        'p50_ms': round(percentile(timings, 0.50), 2),
+        'p95_ms': round(percentile(timings, 0.95), 2),
+        'p99_ms': round(percentile(timings, 0.99), 2),
+    }
+
+
+@scenario('api', key=('route', 'method', 'path'))
+def api_routes(options):
+    """
+    Gọi lần lượt từng route của core/urls.py `--repeat` lần: req/s (tuần tự), p50/p95/p99
+    và số query mỗi request. Mặc định qua test client của Django (cache catalog tắt,
+    request ghi được rollback); với --base-url thì gọi server đang chạy (bỏ qua
+    request ghi, số query đọc từ header Server-Timing).
+    """
+    user, values = api_fixtures()
+    base_url = options.get('base_url')
+    rows = []
+    for name, method, path, caller, body in API_ROUTES:
+        row = {'route': name, 'method': method, 'path': path, 'status': '-', 'requests': 0}
+        row.update(dict.fromkeys(['req_per_s', 'p50_ms', 'p95_ms', 'p99_ms', 'queries'], '-'))
+        rows.append(row)
+        if base_url and method != 'GET':
+            row['status'] = 'skipped'
+            continue
+        caller_user = {'user': user, 'admin': benchmark_admin(), None: None}[caller]
+        url = path.format_map(values)
+        if base_url:
+            send = http_sender(base_url + url, caller_user)
+        else:
+            send = client_sender(caller_user, method, '/api/' + url, body, values)
+
+        timings, queries = [], []
+        started_all = time.perf_counter()
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            status, query_count = send()
+            timings.append((time.perf_counter() - started) * 1000)
+            queries.append(query_count)
+        row.update(request_percentiles(timings, time.perf_counter() - started_all))
+        row.update(status=status, requests=len(timings))
+        if None not in queries:
+            row['queries'] = round(statistics.mean(queries), 1)
+    return rows
+
+
+def client_sender(user, method, path, body, values):
+    client = api_client(user)
+    call = getattr(client, method.lower())
+
+    def request():
+        if callable(body):
+            return call(path, body(), format='multipart')
+        return call(path, fill(body, values), format='json')
+
+    def send():
+        # Với DEBUG=True, log query đầy (9000 câu) làm CaptureQueriesContext đếm sai
+        reset_queries()
+        # Throttle tắt: cùng một user gửi lặp lại liên tục; test client gửi từ 127.0.0.1 (/api/metrics/)
+        with override_settings(CATALOG_CACHE_TIMEOUT=0, THROTTLE_BUCKETS={}, PERF_METRICS_ALLOWED_IPS=('127.0.0.1',)), \
+                CaptureQueriesContext(connection) as context:
+            if method == 'GET':
+                response = request()
+            else:
+                with transaction.atomic():
+                    response = request()
+                    transaction.set_rollback(True)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return response.status_code, len(context)
+    return send
+
+
+def http_sender(url, user):
+    headers = {'Accept': 'application/json'}
+    if user is not None:
+        token, _ = Token.objects.get_or_create(user=user)
+        headers['Authorization'] = f'Token {token.key}'
+
+    def send():
+        request = urllib.request.Request(url, headers=headers)
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                status, timing = response.status, response.headers.get('Server-Timing', '')
+        except urllib.error.HTTPError as exc:
+            status, timing = exc.code, exc.headers.get('Server-Timing', '')
+        match = re.search(r'desc="(\d+) queries"', timing)
+        return status, int(match.group(1)) if match else None
+    return send
+
+
+@scenario('auth', key=('endpoint', 'auth'))
+def authentication_overhead(options):
+    """
+    Chi phí xác thực mỗi request cho giỏ hàng và đơn hàng: token DRF (đọc Token + User),
+    JWT đọc User từ database (trước đây) và JWT dựng user từ claim (core/authentication.py,
+    cache nóng / cache nguội). auth_us là thời gian authenticate() riêng, các cột còn
+    lại đo cả request qua test client.
+    """
+    user, _ = api_fixtures()
+    token, _ = Token.objects.get_or_create(user=user)
+    claims_access = str(ClaimsTokenObtainPairSerializer.get_token(user).access_token)
+    plain_access = str(AccessToken.for_user(user))
+    modes = [
+        ('token', TokenAuthentication(), f'Token {token.key}', False),
+        ('jwt-db', JWTAuthentication(), f'Bearer {plain_access}', False),
+        ('jwt-claims', FastJWTAuthentication(), f'Bearer {claims_access}', False),
+        ('jwt-claims-cold', FastJWTAuthentication(), f'Bearer {claims_access}', True),
+    ]
+    factory = APIRequestFactory()
+    calls = 200
+    rows = []
+    for endpoint in ('carts/', 'orders/'):
+        path = f'/api/{endpoint}'
+        for name, authenticator, header, cold in modes:
+            request = Request(factory.get(path, HTTP_AUTHORIZATION=header))
+
+            def authenticate():
+                for _ in range(calls):
+                    if cold:
+                        token_cache.clear()
+                    authenticator.authenticate(request)
+
+            auth_median, _ = measure(authenticate, options['repeat'])
+            client = APIClient(SERVER_NAME='localhost', HTTP_AUTHORIZATION=header)
+
+            def get():
+                if cold:
+                    token_cache.clear()
+                return client.get(path)
+
+            reset_queries()
+            with CaptureQueriesContext(connection) as context:
+                get()
+            request_median, request_p95 = measure(get, options['repeat'])
+            rows.append({
+                'endpoint': endpoint,
+                'auth': name,
+                'auth_us': round(auth_median * 1000 / calls, 1),
+                'request_p50_ms': round(request_median, 2),
+                'request_p95_ms': round(request_p95, 2),
+                'queries': len(context),
+            })
+    return rows
+
+
+@scenario('checkout', key=('threads',))
+def concurrent_checkout(options):
+    """
+    Nhiều thread cùng đặt mua một sản phẩm tồn kho thấp qua /api/order/create/, mỗi
+    thread `--repeat` lần: checkouts/s (mọi request, kể cả bị từ chối), p95 và số đơn
+    bán được / bị từ chối vì hết hàng / bị trả 503 do giới hạn đồng thời. Các đơn hàng
+    được ghi thật (mỗi thread một connection) nên bị xóa sau mỗi lần chạy.
+    """
+    category, _ = Category.objects.get_or_create(slug='bench-checkout', defaults={'name': 'bench checkout'})
+    rows = []
+    for threads in (1, 4, 16):
+        attempts = threads * options['repeat']
+        # Một nửa số request bán được, nửa còn lại đo đường hết hàng
+        stock = max(1, attempts // 2)
+        Product.objects.filter(slug=f'bench-checkout-{threads}').delete()
+        product = Product.objects.create(
+            category=category, name='Bench checkout', slug=f'bench-checkout-{threads}',
+            description='...', price='1.00', stock=stock,
+        )
+        users = [User.objects.get_or_create(username=f'benchmark-checkout-{i}')[0] for i in range(threads)]
+        body = {**ORDER_PAYLOAD, 'items': [{'product_id': product.pk, 'quantity': 1}]}
+        statuses, timings = [], []
+        lock = threading.Lock()
+
+        def checkout(user):
+            client = api_client(user)
+            # Lỗi (VD: SQLite "database is locked") được đếm vào cột errors thay vì dừng thread
+            client.raise_request_exception = False
+            try:
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    status = client.post('/api/order/create/', body, format='json').status_code
+                    with lock:
+                        timings.append((time.perf_counter() - started) * 1000)
+                        statuses.append(status)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=checkout, args=(user,)) for user in users]
+        with override_settings(THROTTLE_BUCKETS={}):
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - started
+
+        product.refresh_from_db()
+        order_ids = list(Order.objects.filter(items__product=product).values_list('pk', flat=True))
+        sold = statuses.count(201)
+        rows.append({
+            'threads': threads,
+            'stock': stock,
+            'sold': sold,
+            'out_of_stock': statuses.count(400),
+            'busy': statuses.count(503),
+            'errors': len(statuses) - sold - statuses.count(400) - statuses.count(503),
+            'oversold': stock - product.stock != sold or len(order_ids) != sold,
+            'checkouts_per_s': round(len(statuses) / elapsed, 1),
+            'p95_ms': round(percentile(sorted(timings), 0.95), 2),
+        })
+        OutboxEvent.objects.filter(
+            Q(event_type=outbox.ORDER_CREATED, object_id__in=order_ids)
+            | Q(event_type=outbox.PRODUCT_STOCK_CHANGED, object_id=product.pk)
+        ).delete()
+        Order.objects.filter(pk__in=order_ids).delete()
+        product.delete()
+    User.objects.filter(username__startswith='benchmark-checkout-').delete()
+    return rows
@@ -0,0 +1,132 @@
+"""
+Cache đọc cho catalog (danh mục, sản phẩm) dựa trên Django cache framework.
+
+Mỗi entry được gắn với các "version key" (toàn bộ sản phẩm, từng sản phẩm theo
+slug, danh mục...). Signal của Product/Category tăng version tương ứng nên entry
+cũ tự động không còn được đọc tới, thay vì chờ hết TTL.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+PRODUCT = 'product'
+CATEGORY = 'category'
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+
+class CacheStats:
+    """
+    Bộ đếm hit/miss trong process (thread-safe).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.waits = 0
+
+    def incr(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def as_dict(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'waits': self.waits}
+
+
+stats = CacheStats()
+
+
+def version_key(namespace, ident=None):
+    if ident is None:
+        return f'catalog:version:{namespace}'
+    return f'catalog:version:{namespace}:{ident}'
+
+
+def new_version():
+    # Dùng thời gian thay vì 1 để version key bị evict không "hồi sinh" entry cũ
+    return time.time_ns()
+
+
+def get_versions(keys):
+    cache = get_cache()
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, new_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump(*keys):
+    # Xóa version key tương đương tăng version: lần đọc sau sẽ khởi tạo version mới
+    # theo thời gian (get_versions). delete_many chỉ tốn một round-trip.
+    get_cache().delete_many(keys)
+
+
+def invalidate_products(slugs):
+    """
+    Vô hiệu hóa cache của các sản phẩm được cập nhật bằng queryset.update()
+    (không phát signal post_save).
+    """
+    keys = [version_key(PRODUCT, slug) for slug in slugs]
+    bump(version_key(PRODUCT), *keys)
+
+
+def make_key(prefix, version_keys, params=()):
+    versions = get_versions(list(version_keys))
+    digest = hashlib.sha1(repr(sorted(params)).encode('utf-8')).hexdigest()
+    version = '.'.join(str(v) for v in versions)
+    return f'catalog:{prefix}:{version}:{digest}'
+
+
+def get_or_set(key, compute, timeout=None):
+    """
+    Đọc key từ cache, nếu miss thì gọi compute() và ghi lại.
+
+    Chống stampede: chỉ request giữ được lock (cache.add) mới tính lại, các
+    request khác chờ tối đa CATALOG_CACHE_LOCK_WAIT giây để đọc kết quả rồi mới
+    tự tính. Trả về (value, hit).
+    """
+    cache = get_cache()
+    value = cache.get(key)
+    if value is not None:
+        stats.incr('hits')
+        return value, True
+
+    lock_key = f'{key}:lock'
+    lock_timeout = getattr(settings, 'CATALOG_CACHE_LOCK_TIMEOUT', 10)
+    if not cache.add(lock_key, 1, timeout=lock_timeout):
+        stats.incr('waits')
+        deadline = time.monotonic() + getattr(settings, 'CATALOG_CACHE_LOCK_WAIT', 2)
+        while time.monotonic() < deadline:
+            time.sleep(0.01)
+            value = cache.get(key)
+            if value is not None:
+                stats.incr('hits')
+                return value, True
+        value = compute()
+        stats.incr('misses')
+        return value, False
+
+    try:
+        value = compute()
+        cache.set(key, value, timeout=get_timeout() if timeout is None else timeout)
+    finally:
+        cache.delete(lock_key)
+    stats.incr('misses')
+    return value, False
@@ -0,0 +1,236 @@
+"""
+Nhập / xuất catalog (Category, Product) dạng CSV hoặc JSONL theo luồng.
+
+Nhập: đọc file từng dòng, gom thành lô, kiểm tra bằng serializer (kế thừa
+ProductSerializer / CategorySerializer) rồi upsert theo slug bằng một câu
+bulk_create(update_conflicts=True) mỗi lô. Xuất: duyệt bảng theo id (keyset)
+từng lô nên bộ nhớ không phụ thuộc kích thước bảng.
+"""
+import csv
+import io
+import json
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from . import cache as catalog_cache
+from . import outbox
+from .models import Category, Product
+from .serializers import CategorySerializer, ProductSerializer
+
+FORMATS = ('csv', 'jsonl')
+PRODUCTS = 'products'
+CATEGORIES = 'categories'
+KINDS = (PRODUCTS, CATEGORIES)
+
+PRODUCT_COLUMNS = ['slug', 'name', 'description', 'price', 'stock', 'is_available', 'category']
+CATEGORY_COLUMNS = ['slug', 'name', 'description']
+
+MAX_REPORTED_ERRORS = 100
+
+
+class ProductImportSerializer(ProductSerializer):
+    """
+    Kiểm tra một dòng sản phẩm; danh mục ghi bằng slug và được tra trong
+    context['categories'] (nạp sẵn một lần mỗi lô) thay vì một query mỗi dòng.
+    """
+    category_name = None
+    category = serializers.SlugField()
+
+    class Meta(ProductSerializer.Meta):
+        fields = ['slug', 'name', 'description', 'price', 'stock', 'is_available', 'category']
+        read_only_fields = []
+        # Bỏ UniqueValidator của slug vì slug đã tồn tại sẽ được cập nhật (upsert)
+        extra_kwargs = {'slug': {'validators': []}}
+
+    def validate_category(self, value):
+        try:
+            return self.context['categories'][value]
+        except KeyError:
+            raise serializers.ValidationError(f"Danh mục '{value}' không tồn tại.")
+
+
+class CategoryImportSerializer(CategorySerializer):
+
+    class Meta(CategorySerializer.Meta):
+        fields = ['slug', 'name', 'description']
+        extra_kwargs = {'slug': {'validators': []}, 'name': {'validators': []}}
+
+
+def read_records(stream, file_format):
+    """
+    Đọc từng bản ghi (dict) từ stream văn bản, không nạp cả file vào bộ nhớ.
+    """
+    if file_format == 'csv':
+        # Ô trống trong CSV được coi như không có giá trị (dùng mặc định của field)
+        for record in csv.DictReader(stream):
+            yield {key: value for key, value in record.items() if value != ''}
+    elif file_format == 'jsonl':
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    else:
+        raise ValueError(f'Định dạng không hỗ trợ: {file_format}')
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ImportResult:
+
+    def __init__(self):
+        self.created_or_updated = 0
+        self.invalid = 0
+        self.errors = []
+
+    def add_error(self, row, error):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row, 'errors': error})
+
+    def as_dict(self):
+        return {'imported': self.created_or_updated, 'invalid': self.invalid, 'errors': self.errors}
+
+
+def import_catalog(stream, kind=PRODUCTS, file_format='csv', batch_size=2000, progress=None):
+    """
+    Upsert Category/Product theo slug từ stream. Dòng không hợp lệ bị bỏ qua và
+    được ghi lại trong kết quả (tối đa MAX_REPORTED_ERRORS lỗi).
+    """
+    result = ImportResult()
+    row = 0
+    for chunk in chunked(read_records(stream, file_format), batch_size):
+        if kind == PRODUCTS:
+            valid = validate_products(chunk, row, result)
+        else:
+            valid = validate_categories(chunk, row, result)
+        row += len(chunk)
+        if valid:
+            result.created_or_updated += save_rows(kind, valid, result)
+        if progress is not None:
+            progress(row, result)
+    return result
+
+
+def validate_batch(serializer_class, chunk, first_row, result, context=None):
+    # Dùng chung một instance serializer cho cả lô (giống child của ListSerializer)
+    # để không phải dựng lại các field cho từng dòng
+    serializer = serializer_class(context=context or {})
+    valid = []
+    for offset, record in enumerate(chunk):
+        try:
+            valid.append((first_row + offset + 1, serializer.run_validation(record)))
+        except serializers.ValidationError as exc:
+            result.add_error(first_row + offset + 1, exc.detail)
+    return valid
+
+
+def validate_products(chunk, first_row, result):
+    # Dòng không phải object / category không phải chuỗi được serializer báo lỗi theo dòng
+    slugs = {
+        record['category'] for record in chunk
+        if isinstance(record, dict) and isinstance(record.get('category'), str)
+    }
+    categories = {category.slug: category for category in Category.objects.filter(slug__in=slugs).only('id', 'slug')}
+    return validate_batch(ProductImportSerializer, chunk, first_row, result, {'categories': categories})
+
+
+def validate_categories(chunk, first_row, result):
+    return validate_batch(CategoryImportSerializer, chunk, first_row, result)
+
+
+def save_rows(kind, rows, result):
+    """
+    Ghi các dòng (số dòng, dữ liệu) đã hợp lệ, trả về số dòng đã ghi. Lô vi phạm ràng
+    buộc của database (vd. trùng tên danh mục) được chia đôi và ghi lại từng nửa
+    (mỗi lần trong một savepoint) để chỉ các dòng lỗi bị bỏ qua và báo lỗi.
+    """
+    try:
+        save_batch(kind, [data for _, data in rows])
+    except IntegrityError as exc:
+        if len(rows) == 1:
+            result.add_error(rows[0][0], str(exc))
+            return 0
+        middle = len(rows) // 2
+        return save_rows(kind, rows[:middle], result) + save_rows(kind, rows[middle:], result)
+    return len(rows)
+
+
+def save_batch(kind, rows):
+    # Trong cùng một lô, slug xuất hiện sau thắng (giống ghi tuần tự)
+    rows = list({row['slug']: row for row in rows}.values())
+    now = timezone.now()
+    if kind == PRODUCTS:
+        model, update_fields = Product, ['name', 'description', 'price', 'stock', 'is_available', 'category', 'updated_at']
+    else:
+        model, update_fields = Category, ['name', 'description', 'updated_at']
+    objects = [model(**row, updated_at=now) for row in rows]
+    with transaction.atomic():
+        model.objects.bulk_create(objects, update_conflicts=True, unique_fields=['slug'], update_fields=update_fields)
+        if kind == PRODUCTS:
+            # bulk_create upsert không trả về id trên mọi database nên đọc lại theo slug
+            ids = Product.objects.filter(slug__in=[row['slug'] for row in rows]).values_list('pk', 'slug')
+            outbox.record(*[outbox.event(outbox.PRODUCT_CHANGED, pk, {'slug': slug}) for pk, slug in ids])
+
+    if kind == PRODUCTS:
+        catalog_cache.invalidate_products([row['slug'] for row in rows])
+    else:
+        catalog_cache.bump(catalog_cache.version_key(catalog_cache.CATEGORY))
+
+
+def export_rows(kind=PRODUCTS, batch_size=2000):
+    """
+    Sinh từng dòng (list giá trị theo cột) theo thứ tự id, mỗi lần đọc một lô.
+    """
+    if kind == PRODUCTS:
+        queryset = Product.objects.values_list(
+            'pk', 'slug', 'name', 'description', 'price', 'stock', 'is_available', 'category__slug',
+        )
+    else:
+        queryset = Category.objects.values_list('pk', 'slug', 'name', 'description')
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_id).order_by('pk')[:batch_size])
+        if not batch:
+            return
+        last_id = batch[-1][0]
+        for row in batch:
+            yield row[1:]
+
+
+def columns_for(kind):
+    return PRODUCT_COLUMNS if kind == PRODUCTS else CATEGORY_COLUMNS
+
+
+def export_catalog(kind=PRODUCTS, file_format='csv', batch_size=2000):
+    """
+    Sinh nội dung file xuất (từng chuỗi) để ghi ra file hoặc StreamingHttpResponse.
+    """
+    columns = columns_for(kind)
+    if file_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def render(values):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(values)
+            return buffer.getvalue()
+
+        yield render(columns)
+        for row in export_rows(kind, batch_size):
+            yield render(['' if value is None else value for value in row])
+    elif file_format == 'jsonl':
+        for row in export_rows(kind, batch_size):
+            yield json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str) + '\n'
+    else:
+        raise ValueError(f'Định dạng không hỗ trợ: {file_format}')
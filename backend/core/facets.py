@@ -0,0 +1,76 @@
+"""
+Facet cho danh sách sản phẩm (?facets=1): số sản phẩm theo danh mục và theo
+khoảng giá của tập kết quả đã lọc.
+
+Cả hai được tính bằng một query GROUP BY (danh mục, khoảng giá) rồi cộng dồn
+trong Python, thay vì một COUNT cho mỗi facet. Kết quả được cache theo version
+của sản phẩm / danh mục (core/cache.py) nên mọi thay đổi Product (kể cả tồn kho)
+làm facet được tính lại; các tham số không đổi tập kết quả (cursor, ordering...)
+không nằm trong key nên các trang của cùng một bộ lọc dùng chung một entry.
+"""
+from django.conf import settings
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from . import cache as catalog_cache
+
+# Cận trên của các khoảng giá (khoảng cuối không có cận trên)
+DEFAULT_PRICE_BUCKETS = (500_000, 1_000_000, 5_000_000, 10_000_000, 20_000_000)
+
+# Tham số không ảnh hưởng tới số đếm
+IGNORED_PARAMS = {'cursor', 'page', 'page_size', 'ordering', 'facets', 'format'}
+
+
+def get_price_buckets():
+    return tuple(sorted(getattr(settings, 'PRODUCT_PRICE_BUCKETS', DEFAULT_PRICE_BUCKETS)))
+
+
+def price_bucket(bounds):
+    """
+    Chỉ số khoảng giá của sản phẩm: i nếu price < bounds[i] (i nhỏ nhất), len(bounds) nếu lớn hơn tất cả.
+    """
+    return Case(
+        *[When(price__lt=upper, then=Value(index)) for index, upper in enumerate(bounds)],
+        default=Value(len(bounds)),
+        output_field=IntegerField(),
+    )
+
+
+def compute(queryset, bounds):
+    rows = (
+        queryset.order_by()
+        .annotate(price_bucket=price_bucket(bounds))
+        .values('category_id', 'category__name', 'category__slug', 'price_bucket')
+        .annotate(count=Count('pk'))
+    )
+    categories = {}
+    prices = [0] * (len(bounds) + 1)
+    for row in rows:
+        category = categories.setdefault(row['category_id'], {
+            'id': row['category_id'], 'name': row['category__name'], 'slug': row['category__slug'], 'count': 0,
+        })
+        category['count'] += row['count']
+        prices[row['price_bucket']] += row['count']
+
+    lowers = (None, *bounds)
+    uppers = (*bounds, None)
+    return {
+        # Sản phẩm không có danh mục nằm trong mục id=None
+        'categories': sorted(categories.values(), key=lambda item: (-item['count'], item['name'] or '')),
+        'price': [
+            {'min': lower, 'max': upper, 'count': count}
+            for lower, upper, count in zip(lowers, uppers, prices)
+        ],
+    }
+
+
+def get_facets(params, get_queryset):
+    """
+    Facet của tập kết quả lọc theo params, đọc từ cache nếu có. get_queryset()
+    trả về queryset đã lọc, chỉ được gọi khi phải tính lại.
+    """
+    bounds = get_price_buckets()
+    version_keys = [catalog_cache.version_key(catalog_cache.PRODUCT), catalog_cache.version_key(catalog_cache.CATEGORY)]
+    params = [(name, values) for name, values in params if name not in IGNORED_PARAMS]
+    key = catalog_cache.make_key('product:facets', version_keys, [*params, ('buckets', bounds)])
+    facets, _ = catalog_cache.get_or_set(key, lambda: compute(get_queryset(), bounds))
+    return facets
@@ -0,0 +1,233 @@
+"""
+Serializer chỉ đọc cho các danh sách nóng (sản phẩm, tóm tắt đơn hàng, yêu thích).
+
+ModelSerializer tốn CPU cho từng field của từng object (get_attribute,
+to_representation, dựng OrderedDict...). ValuesSerializer đọc dữ liệu bằng
+queryset.values() và dựng dict bằng các accessor được "biên dịch" một lần từ
+serializer DRF gốc: cùng tên field, thứ tự và cách định dạng (Decimal, datetime,
+URL ảnh...), nên JSON trả về giống hệt từng byte. Quan hệ FK lồng nhau được JOIN
+trong cùng câu query; quan hệ nhiều (Order.items) tốn thêm đúng một query.
+"""
+from collections import defaultdict
+from operator import itemgetter
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField, StringRelatedField
+
+from . import images
+from . import metrics
+from .serializers import (FavoriteSerializer, OrderItemSerializer, OrderSerializer, OrderSummarySerializer, ProductSerializer,
+                          RelatedProductSerializer)
+
+# Giá trị database của các field này đã đúng kiểu JSON, to_representation không đổi gì
+PASSTHROUGH_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.BooleanField, serializers.ReadOnlyField)
+
+# Đánh dấu field bị bỏ khỏi payload (như SkipField của DRF)
+SKIP = object()
+
+
+class ValuesSerializer:
+    """
+    Khai báo:
+    - serializer_class: serializer DRF gốc (field, thứ tự, định dạng).
+    - sources: ghi đè đường dẫn values() của field (VD: StringRelatedField).
+    - method_fields: {tên: (đường dẫn values(), hàm(giá trị, context))} thay cho SerializerMethodField;
+      đường dẫn là tuple thì hàm nhận lần lượt giá trị của từng đường dẫn rồi tới context.
+    - nested: {tên: ValuesSerializer con} cho các serializer lồng nhau.
+    """
+    serializer_class = None
+    sources = {}
+    method_fields = {}
+    nested = {}
+
+    def __init__(self, context=None, prefix=''):
+        self.context = context or {}
+        self.prefix = prefix
+        self.model = self.serializer_class.Meta.model
+        self.pk_path = prefix + self.model._meta.pk.name
+        self.paths = [self.pk_path]
+        # (tên field, ValuesSerializer con, tên FK của model con trỏ về model này)
+        self.many = []
+        self.children = {}
+        self.skippable = False
+        fields = self.serializer_class(context=self.context).fields
+        self.getters = [
+            (name, self.compile_field(name, field))
+            for name, field in fields.items() if not field.write_only
+        ]
+
+    def add_path(self, path):
+        if path not in self.paths:
+            self.paths.append(path)
+        return path
+
+    def compile_field(self, name, field):
+        if name in self.nested:
+            return self.compile_nested(name, field)
+        if name in self.method_fields:
+            path, method = self.method_fields[name]
+            context = self.context
+            if isinstance(path, tuple):
+                keys = [self.add_path(self.prefix + part) for part in path]
+                return lambda row: method(*[row[key] for key in keys], context)
+            key = self.add_path(self.prefix + path)
+            return lambda row: method(row[key], context)
+        if isinstance(field, (serializers.BaseSerializer, ManyRelatedField, serializers.SerializerMethodField)):
+            raise ImproperlyConfigured(
+                f'{type(self).__name__}: field "{name}" phải được khai báo trong nested hoặc method_fields.'
+            )
+
+        key = self.add_path(self.prefix + self.sources.get(name, '__'.join(field.source_attrs)))
+        convert = self.get_converter(field)
+        relations = [] if name in self.sources else [
+            self.add_path(self.prefix + '__'.join(field.source_attrs[:depth]))
+            for depth in range(1, len(field.source_attrs))
+        ]
+        if relations:
+            return self.compile_related(field, key, relations, convert)
+        if convert is None:
+            return itemgetter(key)
+
+        def getter(row):
+            # Giống Serializer.to_representation của DRF: None được giữ nguyên
+            value = row[key]
+            return None if value is None else convert(value)
+        return getter
+
+    def compile_related(self, field, key, relations, convert):
+        """
+        Field có source qua quan hệ (VD: category.name). Như Field.get_attribute của
+        DRF: khi quan hệ là None thì trả None nếu allow_null, không thì bỏ field.
+        """
+        if field.default is not serializers.empty:
+            raise ImproperlyConfigured(f'{type(self).__name__}: field "{field.field_name}" có default không được hỗ trợ.')
+        missing = None if field.allow_null else SKIP
+        self.skippable = self.skippable or missing is SKIP
+
+        def getter(row):
+            for relation in relations:
+                if row[relation] is None:
+                    return missing
+            value = row[key]
+            if value is None or convert is None:
+                return value
+            return convert(value)
+        return getter
+
+    def get_converter(self, field):
+        """
+        Hàm chuyển giá trị database sang giá trị JSON, None nếu dùng nguyên giá trị.
+        """
+        if isinstance(field, serializers.FileField):
+            if not getattr(field, 'use_url', True):
+                return None
+            return self.file_url(self.model._meta.get_field(field.source_attrs[-1]).storage)
+        if isinstance(field, PrimaryKeyRelatedField):
+            # values() trả về khóa chính của quan hệ thay vì object
+            return None if field.pk_field is None else field.pk_field.to_representation
+        if isinstance(field, StringRelatedField):
+            return str
+        if isinstance(field, PASSTHROUGH_FIELDS):
+            return None
+        return field.to_representation
+
+    def file_url(self, storage):
+        request = self.context.get('request')
+
+        def convert(name):
+            # Như FileField.to_representation: URL tuyệt đối nếu có request
+            if not name:
+                return None
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+        return convert
+
+    def compile_nested(self, name, field):
+        source = '__'.join(field.source_attrs)
+        child_class = self.nested[name]
+        if isinstance(field, serializers.ListSerializer):
+            if self.prefix:
+                raise ImproperlyConfigured(f'{type(self).__name__}: quan hệ nhiều chỉ hỗ trợ ở serializer gốc.')
+            child = child_class(self.context)
+            self.many.append((name, child, self.model._meta.get_field(source).field.name))
+            pk_path = self.pk_path
+            children = self.children
+            return lambda row: children[name].get(row[pk_path], [])
+
+        child = child_class(self.context, prefix=f'{self.prefix}{source}__')
+        for path in child.paths:
+            self.add_path(path)
+        pk_path = child.pk_path
+        to_representation = child.to_representation
+        return lambda row: None if row[pk_path] is None else to_representation(row)
+
+    def values(self, queryset, extra=()):
+        """
+        queryset.values() với các cột cần cho payload, cộng thêm `extra` (VD: trường
+        sắp xếp mà phân trang keyset cần đọc từ bản ghi cuối trang).
+        """
+        paths = self.paths + [path for path in extra if path not in self.paths]
+        return queryset.prefetch_related(None).values(*paths)
+
+    def to_representation(self, row):
+        if self.skippable:
+            return {name: value for name, value in ((name, getter(row)) for name, getter in self.getters) if value is not SKIP}
+        return {name: getter(row) for name, getter in self.getters}
+
+    def serialize(self, rows):
+        """
+        Dựng payload cho các dict do values() trả về (đã phân trang).
+        """
+        rows = list(rows)
+        if self.many:
+            pks = [row[self.pk_path] for row in rows]
+            for name, child, fk_name in self.many:
+                grouped = defaultdict(list)
+                queryset = child.model._default_manager.filter(**{f'{fk_name}__in': pks}).order_by('pk')
+                for row in queryset.values(fk_name, *child.paths):
+                    grouped[row[fk_name]].append(child.to_representation(row))
+                self.children[name] = grouped
+        with metrics.serializing():
+            return [self.to_representation(row) for row in rows]
+
+
+def product_srcset(variants, context):
+    return images.srcset(variants, context.get('request'))
+
+
+class ProductValuesSerializer(ValuesSerializer):
+    serializer_class = ProductSerializer
+    method_fields = {'image_srcset': ('image_variants', product_srcset)}
+
+
+class OrderItemValuesSerializer(ValuesSerializer):
+    serializer_class = OrderItemSerializer
+    nested = {'product': ProductValuesSerializer}
+
+
+class OrderValuesSerializer(ValuesSerializer):
+    serializer_class = OrderSerializer
+    # StringRelatedField: str(user) là username
+    sources = {'user': 'user__username'}
+    nested = {'items': OrderItemValuesSerializer}
+
+
+def order_thumbnail(name, variants, context):
+    return images.thumbnail(name, variants, context.get('request'))
+
+
+class OrderSummaryValuesSerializer(ValuesSerializer):
+    serializer_class = OrderSummarySerializer
+    # Các annotation của OrderSummarySerializer.get_annotations
+    method_fields = {'thumbnail': (('thumbnail_image', 'thumbnail_variants'), order_thumbnail)}
+
+
+class FavoriteValuesSerializer(ValuesSerializer):
+    serializer_class = FavoriteSerializer
+    nested = {'product': ProductValuesSerializer}
+
+
+class RelatedProductValuesSerializer(ValuesSerializer):
+    serializer_class = RelatedProductSerializer
+    nested = {'product': ProductValuesSerializer}
@@ -0,0 +1,33 @@
+"""
+Bộ lọc sản phẩm cho ProductViewSet.
+
+Khoảng giá dùng index (price, id) / (category, price, id) của Product, ví dụ:
+/api/products/?category=3&price_min=100000&price_max=500000&in_stock=true
+"""
+import django_filters
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from . import inventory
+from .models import Product
+
+
+class ProductFilterSet(django_filters.FilterSet):
+    price_min = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
+    price_max = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
+    # Còn hàng theo Product.stock trừ số lượng đang được giữ trong giỏ hàng
+    in_stock = django_filters.BooleanFilter(method='filter_in_stock')
+
+    class Meta:
+        model = Product
+        # price / stock lọc chính xác, giữ lại cho client cũ
+        fields = ['category', 'price', 'stock']
+
+    def filter_in_stock(self, queryset, name, value):
+        reserved = Coalesce(Subquery(
+            inventory.active_reservations().filter(product=OuterRef('pk'))
+            .order_by().values('product').annotate(total=Sum('quantity')).values('total')
+        ), 0)
+        if value:
+            return queryset.filter(stock__gt=reserved)
+        return queryset.filter(stock__lte=reserved)
@@ -0,0 +1,159 @@
+"""
+Header Idempotency-Key cho đặt hàng và các action ghi của giỏ hàng.
+
+Client gửi lại request khi bị timeout; không có key thì mỗi lần gửi lại tạo thêm một
+đơn hàng và trừ tồn kho thêm một lần. Với cùng một key (theo user):
+
+- request đầu tiên ghi IdempotencyKey (đang xử lý) rồi chạy view. Các thay đổi của
+  view và response được ghi trong cùng một transaction, nên nếu process chết giữa
+  chừng thì không có gì được ghi và request gửi lại được chạy lại;
+- request gửi lại sau khi đã xong nhận lại đúng status / body cũ (header
+  Idempotent-Replayed: true) mà không chạy lại view;
+- request gửi lại khi request đầu còn đang chạy nhận 409 kèm Retry-After; quá
+  IDEMPOTENCY_LOCK_TIMEOUT giây (worker bị dừng) thì request sau được chạy thay;
+- cùng key nhưng khác method / path / body -> 422.
+
+Chỉ response 2xx được lưu để trả lại. View ném exception (dữ liệu không hợp lệ, hết
+hàng...) hoặc trả về response khác 2xx (VD 404 / 400 của update_item) thì key được
+bỏ đi để có thể gửi lại khi lỗi đã được khắc phục. Key hết hạn sau IDEMPOTENCY_KEY_TTL giây; worker
+(`manage.py runworker`) xóa các key đã hết hạn.
+"""
+import functools
+import hashlib
+import json
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+class RequestInProgress(APIException):
+    """
+    409 kèm Retry-After (exception handler của DRF đọc thuộc tính `wait`).
+    """
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Request với Idempotency-Key này đang được xử lý, vui lòng thử lại sau.'
+    default_code = 'request_in_progress'
+
+    def __init__(self, wait, detail=None, code=None):
+        super().__init__(detail, code)
+        self.wait = max(1, math.ceil(wait))
+
+
+class KeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'Idempotency-Key đã được dùng cho một request khác.'
+    default_code = 'idempotency_key_reused'
+
+
+def get_ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 86400))
+
+
+def get_lock_timeout():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 60))
+
+
+def fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.get_full_path()}\n{body}'.encode('utf-8')).hexdigest()
+
+
+def claim(user, key, digest):
+    """
+    Trả về (IdempotencyKey, True) nếu request này được chạy view, hoặc
+    (IdempotencyKey đã có, False) nếu đã có request khác với cùng key.
+    """
+    while True:
+        now = timezone.now()
+        try:
+            # Commit ngay (ngoài transaction của view) để request trùng ở process khác thấy
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(user=user, key=key, fingerprint=digest, created_at=now, locked_at=now), True
+        except IntegrityError:
+            pass
+        record = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if record is None:
+            # Request trước vừa bỏ key (lỗi), thử ghi lại
+            continue
+        expired = record.created_at < now - get_ttl()
+        abandoned = record.response_status is None and record.locked_at < now - get_lock_timeout()
+        if not (expired or abandoned):
+            return record, False
+        # Chỉ một request nhận lại được key (điều kiện trên locked_at cũ)
+        taken = IdempotencyKey.objects.filter(pk=record.pk, locked_at=record.locked_at).update(
+            fingerprint=digest, created_at=now, locked_at=now, response_status=None, response_body=None,
+        )
+        if taken:
+            record.fingerprint, record.created_at, record.locked_at = digest, now, now
+            record.response_status = record.response_body = None
+            return record, True
+
+
+def release(record):
+    IdempotencyKey.objects.filter(pk=record.pk, locked_at=record.locked_at, response_status__isnull=True).delete()
+
+
+def replay(record):
+    response = Response(record.response_body, status=record.response_status)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def execute(request, key, handler):
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise ValidationError({'error': f'{HEADER} phải có từ 1 tới {MAX_KEY_LENGTH} ký tự.'})
+    digest = fingerprint(request)
+    record, claimed = claim(request.user, key, digest)
+    if not claimed:
+        if record.fingerprint != digest:
+            raise KeyReused()
+        if record.response_status is None:
+            raise RequestInProgress(getattr(settings, 'IDEMPOTENCY_RETRY_AFTER', 1))
+        return replay(record)
+
+    try:
+        with transaction.atomic():
+            response = handler()
+            if status.is_success(response.status_code):
+                IdempotencyKey.objects.filter(pk=record.pk).update(
+                    response_status=response.status_code, response_body=response.data,
+                )
+    except BaseException:
+        release(record)
+        raise
+    if not status.is_success(response.status_code):
+        release(record)
+    return response
+
+
+def idempotent(method):
+    """
+    Decorator cho handler / action của view DRF: request có header Idempotency-Key
+    (của user đã đăng nhập) được chạy đúng một lần.
+    """
+    @functools.wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None or not request.user.is_authenticated:
+            return method(view, request, *args, **kwargs)
+        return execute(request, key, lambda: method(view, request, *args, **kwargs))
+    return wrapper
+
+
+def purge_expired():
+    """
+    Xóa key cũ hơn IDEMPOTENCY_KEY_TTL giây.
+    """
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=timezone.now() - get_ttl()).delete()
+    return deleted
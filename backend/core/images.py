@@ -0,0 +1,237 @@
+"""
+Tạo sẵn ảnh thu nhỏ (WebP) cho Product.image.
+
+Mỗi ảnh gốc được resize theo các chiều rộng trong PRODUCT_IMAGE_WIDTHS và lưu
+cạnh ảnh gốc với tên cố định `<tên ảnh gốc>_<w>w.webp`. Việc resize chạy trong
+process pool của chính ứng dụng (không cần dịch vụ ngoài) sau khi transaction
+lưu Product commit; kết quả ghi vào Product.image_variants để ProductSerializer
+trả về `image_srcset` mà không phải kiểm tra file trên storage. Khi ảnh bị thay
+hoặc sản phẩm bị xóa, các biến thể cũ được xóa khỏi storage sau khi commit.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from . import cache as catalog_cache
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WIDTHS = (160, 320, 640, 1280)
+WEBP_QUALITY = 80
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_widths():
+    return tuple(sorted(getattr(settings, 'PRODUCT_IMAGE_WIDTHS', DEFAULT_WIDTHS)))
+
+
+def variant_name(name, width):
+    stem, _ = os.path.splitext(name)
+    return f'{stem}_{width}w.webp'
+
+
+def generate_variants(name, widths):
+    """
+    Tạo các biến thể WebP của ảnh `name` trên storage, trả về {'<w>w': tên file}.
+
+    Không truy cập database nên chạy được trong process con. Không phóng to ảnh:
+    các chiều rộng lớn hơn ảnh gốc bị bỏ qua (nếu ảnh nhỏ hơn mọi chiều rộng thì
+    chỉ tạo một biến thể bằng kích thước gốc).
+    """
+    with default_storage.open(name, 'rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'PA', 'P') else 'RGB')
+
+    targets = [width for width in widths if width < image.width] or [image.width]
+    variants = {}
+    for width in targets:
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        buffer = io.BytesIO()
+        resized.save(buffer, format='WEBP', quality=WEBP_QUALITY, method=4)
+        target = variant_name(name, width)
+        # Tên cố định: ghi đè biến thể cũ thay vì để storage thêm hậu tố ngẫu nhiên
+        default_storage.delete(target)
+        variants[f'{width}w'] = default_storage.save(target, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def record_variants(product_id, name, variants):
+    """
+    Lưu kết quả vào Product.image_variants nếu sản phẩm vẫn dùng ảnh `name`
+    (ảnh có thể đã bị thay trong lúc đang xử lý). Trả về slug của sản phẩm hoặc None.
+    """
+    product = Product.objects.filter(pk=product_id, image=name)
+    slug = product.values_list('slug', flat=True).first()
+    if slug is None:
+        # Ảnh đã bị thay (hoặc sản phẩm đã bị xóa) trong lúc xử lý: bỏ các file vừa tạo
+        delete_variants(name, variants.values())
+        return None
+    product.update(image_variants=variants, updated_at=timezone.now())
+    return slug
+
+
+def delete_variants(name, variants):
+    """
+    Xóa các file biến thể `variants` của ảnh `name`, trừ khi vẫn còn sản phẩm dùng ảnh
+    này (tên biến thể suy ra từ tên ảnh nên các sản phẩm chung ảnh dùng chung file).
+    """
+    variants = list(variants)
+    if not variants or Product.objects.filter(image=name).exists():
+        return
+    for target in variants:
+        try:
+            default_storage.delete(target)
+        except Exception:
+            logger.exception('Không xóa được ảnh thu nhỏ %s', target)
+
+
+def delete_variants_on_commit(name, variants):
+    variants = list(variants)
+    if variants:
+        transaction.on_commit(lambda: delete_variants(name, variants))
+
+
+def process(product_id, name):
+    slug = record_variants(product_id, name, generate_variants(name, get_widths()))
+    if slug is not None:
+        catalog_cache.invalidate_products([slug])
+    return slug
+
+
+def init_worker():
+    # Với start method spawn/forkserver process con cần tự cấu hình Django
+    django.setup()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'PRODUCT_IMAGE_WORKERS', None),
+                initializer=init_worker,
+            )
+        return _executor
+
+
+def _on_done(product_id, name, future):
+    try:
+        slug = record_variants(product_id, name, future.result())
+        if slug is not None:
+            catalog_cache.invalidate_products([slug])
+    except Exception:
+        logger.exception('Không tạo được ảnh thu nhỏ cho sản phẩm %s (%s)', product_id, name)
+    finally:
+        # Callback chạy trên thread quản lý của pool: đóng kết nối DB riêng của thread này
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+def schedule(product_id, name):
+    """
+    Đưa ảnh của sản phẩm vào hàng đợi xử lý. Với PRODUCT_IMAGE_ASYNC = False
+    (dùng khi test) ảnh được xử lý ngay trong process hiện tại.
+    """
+    if not getattr(settings, 'PRODUCT_IMAGE_ASYNC', True):
+        return process(product_id, name)
+    future = get_executor().submit(generate_variants, name, get_widths())
+    future.add_done_callback(lambda done: _on_done(product_id, name, done))
+
+
+def schedule_on_commit(product):
+    product_id, name = product.pk, product.image.name
+    transaction.on_commit(lambda: schedule(product_id, name))
+
+
+def srcset(variants, request=None):
+    """
+    {'<w>w': URL} theo thứ tự chiều rộng tăng dần; URL tuyệt đối nếu có request
+    (giống ImageField của DRF).
+    """
+    result = {}
+    for key, name in sorted(variants.items(), key=lambda item: int(item[0][:-1])):
+        url = default_storage.url(name)
+        result[key] = request.build_absolute_uri(url) if request is not None else url
+    return result
+
+
+def thumbnail(name, variants, request=None):
+    """
+    URL của ảnh thu nhỏ nhỏ nhất (ảnh gốc nếu chưa có), None nếu không có ảnh.
+    """
+    if variants:
+        name = min(variants.items(), key=lambda item: int(item[0][:-1]))[1]
+    if not name:
+        return None
+    url = default_storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def backfill(workers=None, batch_size=200, force=False, progress=None):
+    """
+    Tạo biến thể cho các sản phẩm đã có ảnh (chưa có biến thể, hoặc tất cả với
+    force=True), song song trên `workers` process (mặc định bằng số CPU; 0 để
+    xử lý ngay trong process hiện tại). Trả về (số ảnh đã xử lý, số ảnh lỗi).
+    """
+    queryset = Product.objects.exclude(image='').exclude(image__isnull=True)
+    if not force:
+        queryset = queryset.filter(image_variants={})
+    widths = get_widths()
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker) if workers != 0 else None
+    processed = failed = 0
+    last_id = 0
+    try:
+        while True:
+            batch = list(queryset.filter(pk__gt=last_id).order_by('pk').values_list('pk', 'image')[:batch_size])
+            if not batch:
+                return processed, failed
+            last_id = batch[-1][0]
+            if executor is None:
+                results = (run_inline(pk, name, widths) for pk, name in batch)
+            else:
+                futures = {executor.submit(generate_variants, name, widths): (pk, name) for pk, name in batch}
+                results = (futures[future] + (future,) for future in as_completed(futures))
+
+            slugs = []
+            for pk, name, future in results:
+                try:
+                    variants = future.result()
+                except Exception:
+                    logger.exception('Không tạo được ảnh thu nhỏ cho sản phẩm %s (%s)', pk, name)
+                    failed += 1
+                else:
+                    slug = record_variants(pk, name, variants)
+                    if slug is not None:
+                        slugs.append(slug)
+                    processed += 1
+                if progress is not None:
+                    progress(processed, failed)
+            catalog_cache.invalidate_products(slugs)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def run_inline(pk, name, widths):
+    future = Future()
+    try:
+        future.set_result(generate_variants(name, widths))
+    except Exception as exc:
+        future.set_exception(exc)
+    return pk, name, future
@@ -0,0 +1,143 @@
+"""
+Giữ hàng cho giỏ hàng bằng StockReservation thay vì trừ thẳng Product.stock.
+
+Số lượng còn bán được = Product.stock - tổng các reservation còn hạn. Thêm/sửa
+giỏ hàng không khóa hàng Product (checkout và các UPDATE stock dùng khóa đó): việc
+giữ hàng của cùng một sản phẩm được tuần tự hóa bằng advisory lock, nên hai giỏ giữ
+cùng lúc không vượt quá stock; stock chỉ bị trừ lúc đặt hàng. Reservation chỉ mang
+tính "mềm": đặt hàng vẫn kiểm tra lại tồn kho khi đã khóa.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from rest_framework import serializers
+
+from . import cache as catalog_cache
+from . import outbox
+from .models import CartItem, Product, StockReservation
+
+# Khóa thứ nhất của pg_advisory_xact_lock(int, int) cho việc giữ hàng; khóa thứ hai là product_id
+RESERVATION_LOCK = 0x52455356
+
+
+def reservation_expiry():
+    return timezone.now() + timedelta(seconds=getattr(settings, 'CART_RESERVATION_TTL', 30 * 60))
+
+
+def active_reservations():
+    return StockReservation.objects.filter(expires_at__gt=timezone.now())
+
+
+def reserved_quantities(product_ids, exclude_cart=None, exclude_user=None):
+    """
+    Tổng số lượng đang được giữ (còn hạn) theo product_id.
+    """
+    reservations = active_reservations().filter(product_id__in=product_ids)
+    if exclude_cart is not None:
+        reservations = reservations.exclude(cart_item__cart=exclude_cart)
+    if exclude_user is not None:
+        reservations = reservations.exclude(cart_item__cart__user=exclude_user)
+    rows = reservations.values('product_id').annotate(quantity=Sum('quantity'))
+    return {row['product_id']: row['quantity'] for row in rows}
+
+
+def available_stock(product, exclude_cart=None):
+    reserved = reserved_quantities([product.id], exclude_cart=exclude_cart)
+    return product.stock - reserved.get(product.id, 0)
+
+
+def invalidate_catalog(slugs):
+    """
+    Số lượng còn bán được (filter in_stock) phụ thuộc reservation: sau khi commit thì
+    vô hiệu hóa cache catalog của các sản phẩm có reservation thay đổi.
+    """
+    slugs = set(slugs)
+    if slugs:
+        transaction.on_commit(lambda: catalog_cache.invalidate_products(slugs))
+
+
+def lock_product_holds(product_id):
+    """
+    Tuần tự hóa việc giữ hàng của một sản phẩm tới hết transaction. Database khác
+    PostgreSQL (SQLite) chỉ có một transaction ghi tại một thời điểm, và reserve()
+    ghi trước rồi mới kiểm tra, nên không cần khóa.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        # id vượt quá int4 thì vài sản phẩm dùng chung một khóa, chỉ phải chờ nhau
+        cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [RESERVATION_LOCK, product_id % 2 ** 31])
+
+
+def reserve(cart, product, quantity):
+    """
+    Đặt số lượng của product trong giỏ thành `quantity` và giữ hàng tương ứng.
+    """
+    expires_at = reservation_expiry()
+    with transaction.atomic():
+        lock_product_holds(product.pk)
+        cart_item, _ = CartItem.objects.update_or_create(cart=cart, product=product, defaults={'quantity': quantity})
+        StockReservation.objects.update_or_create(
+            cart_item=cart_item,
+            defaults={'product': product, 'quantity': quantity, 'expires_at': expires_at},
+        )
+        # Kiểm tra sau khi ghi, theo stock hiện tại (không theo instance truyền vào);
+        # không đủ thì exception rollback các thay đổi trên
+        stock = Product.objects.filter(pk=product.pk).values_list('stock', flat=True).get()
+        if stock - reserved_quantities([product.pk], exclude_cart=cart).get(product.pk, 0) < quantity:
+            raise serializers.ValidationError("Số lượng tồn kho không đủ.")
+        # Người dùng còn thao tác với giỏ nên gia hạn các reservation khác của giỏ
+        StockReservation.objects.filter(cart_item__cart=cart).update(expires_at=expires_at)
+        outbox.record(outbox.event(outbox.STOCK_RESERVED, product.pk, {
+            'cart_id': cart.pk, 'quantity': quantity, 'expires_at': expires_at,
+        }))
+        invalidate_catalog([product.slug])
+    return cart_item
+
+
+def convert_for_user(user, quantities):
+    """
+    Chuyển hàng user đang giữ thành hàng đã bán (stock đã bị trừ): số lượng vừa đặt
+    {product_id: quantity} được trừ vào reservation và dòng giỏ hàng tương ứng; dòng
+    nào được mua hết thì bị xóa cùng reservation, phần còn lại vẫn được giữ. Cache
+    catalog của các sản phẩm này do người gọi vô hiệu hóa cùng với việc trừ stock.
+    """
+    remaining = dict(quantities)
+    used_up, reduced = [], []
+    reservations = (
+        StockReservation.objects.filter(cart_item__cart__user=user, product_id__in=quantities)
+        .select_related('cart_item').order_by('pk')
+    )
+    for reservation in reservations:
+        used = min(remaining[reservation.product_id], reservation.quantity)
+        if not used:
+            continue
+        remaining[reservation.product_id] -= used
+        if used == reservation.quantity:
+            used_up.append(reservation.cart_item_id)
+            continue
+        reservation.quantity -= used
+        reservation.cart_item.quantity = max(1, reservation.cart_item.quantity - used)
+        reduced.append(reservation)
+    # Reservation bị xóa theo (on_delete=CASCADE)
+    CartItem.objects.filter(pk__in=used_up).delete()
+    StockReservation.objects.bulk_update(reduced, ['quantity'])
+    CartItem.objects.bulk_update([reservation.cart_item for reservation in reduced], ['quantity'])
+
+
+def sweep_expired(batch_size=1000):
+    """
+    Xóa các reservation đã hết hạn theo lô, trả về số bản ghi đã xóa.
+    """
+    deleted = 0
+    now = timezone.now()
+    while True:
+        rows = list(StockReservation.objects.filter(expires_at__lte=now).values_list('pk', 'product__slug')[:batch_size])
+        if not rows:
+            return deleted
+        with transaction.atomic():
+            deleted += StockReservation.objects.filter(pk__in=[pk for pk, _ in rows]).delete()[0]
+            invalidate_catalog(slug for _, slug in rows)
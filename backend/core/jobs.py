@@ -0,0 +1,224 @@
+"""
+Hàng đợi công việc chạy nền lưu trong database (model Job).
+
+Việc phụ sau khi đặt hàng / đổi trạng thái đơn hàng (email, cảnh báo tồn kho...)
+không chạy trong request: request chỉ ghi một dòng Job sau khi transaction commit
+(enqueue_on_commit). Lệnh `manage.py runworker` lấy các job đến hạn bằng
+SELECT ... FOR UPDATE SKIP LOCKED nên nhiều worker (nhiều process / máy) chạy song
+song không lấy trùng job, mỗi worker chạy job trên một thread pool.
+
+Job lỗi được thử lại sau JOB_RETRY_BACKOFF * 2^(lần thử - 1) giây (tối đa
+JOB_RETRY_MAX_BACKOFF) cho tới max_attempts lần rồi chuyển sang failed. Job có thể
+chạy nhiều hơn một lần (worker bị dừng giữa chừng) nên hàm xử lý phải chạy lại được.
+
+Với JOB_QUEUE_ASYNC = False (dùng khi test) job chạy ngay trong process hiện tại
+sau khi commit, không ghi vào bảng Job.
+
+Worker cũng gọi các hàm trong PERIODIC_TASKS ({đường dẫn import: số giây}) định kỳ,
+VD cập nhật bảng tổng hợp doanh số (core/analytics.py).
+"""
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import idempotency
+from . import outbox
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(handler, payload=None, run_at=None, max_attempts=None):
+    """
+    Thêm job gọi `handler(**payload)`; handler là đường dẫn import của hàm.
+    """
+    payload = payload or {}
+    if not getattr(settings, 'JOB_QUEUE_ASYNC', True):
+        import_string(handler)(**payload)
+        return None
+    return Job.objects.create(
+        handler=handler, payload=payload, run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or getattr(settings, 'JOB_MAX_ATTEMPTS', 5),
+    )
+
+
+def enqueue_on_commit(handler, payload=None, **kwargs):
+    # robust: lỗi khi ghi job không làm hỏng response của transaction đã commit
+    transaction.on_commit(lambda: enqueue(handler, payload, **kwargs), robust=True)
+
+
+def backoff(attempts):
+    delay = getattr(settings, 'JOB_RETRY_BACKOFF', 5) * 2 ** (attempts - 1)
+    return min(delay, getattr(settings, 'JOB_RETRY_MAX_BACKOFF', 600))
+
+
+def claim(limit):
+    """
+    Lấy tối đa `limit` job đến hạn và đánh dấu running (mỗi job một lần thử).
+    """
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('run_at', 'id')
+    running = {'status': Job.RUNNING, 'locked_at': now, 'attempts': F('attempts') + 1}
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            jobs = list(due.select_for_update(skip_locked=True)[:limit])
+            if jobs:
+                Job.objects.filter(pk__in=[job.pk for job in jobs]).update(**running)
+    else:
+        # SQLite (dev/test) không có FOR UPDATE: chỉ nhận job tự chuyển được từ queued sang running
+        jobs = [job for job in due[:limit] if Job.objects.filter(pk=job.pk, status=Job.QUEUED).update(**running)]
+    for job in jobs:
+        job.status, job.locked_at, job.attempts = Job.RUNNING, now, job.attempts + 1
+    return jobs
+
+
+def run(job):
+    """
+    Chạy một job đã claim và ghi kết quả. Trả về True nếu thành công.
+    """
+    try:
+        import_string(job.handler)(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        now = timezone.now()
+        if job.attempts < job.max_attempts:
+            delay = backoff(job.attempts)
+            logger.warning('Job %s lỗi (lần %s), thử lại sau %s giây:\n%s', job, job.attempts, delay, error)
+            fields = {'status': Job.QUEUED, 'run_at': now + timedelta(seconds=delay)}
+        else:
+            logger.error('Job %s lỗi sau %s lần thử:\n%s', job, job.attempts, error)
+            fields = {'status': Job.FAILED, 'finished_at': now}
+        Job.objects.filter(pk=job.pk).update(locked_at=None, last_error=error, **fields)
+        return False
+    Job.objects.filter(pk=job.pk).update(status=Job.DONE, locked_at=None, finished_at=timezone.now())
+    return True
+
+
+def requeue_stale():
+    """
+    Job running quá JOB_LOCK_TIMEOUT giây (worker bị dừng giữa chừng) được đưa lại
+    hàng đợi, hoặc chuyển sang failed nếu đã hết số lần thử.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status=Job.RUNNING, locked_at__lt=now - timedelta(seconds=getattr(settings, 'JOB_LOCK_TIMEOUT', 300)),
+    )
+    error = 'Worker bị dừng khi đang chạy job.'
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, locked_at=None, finished_at=now, last_error=error,
+    )
+    requeued = stale.update(status=Job.QUEUED, locked_at=None, run_at=now, last_error=error)
+    return requeued, failed
+
+
+def purge_finished():
+    """
+    Xóa job đã xong quá JOB_RETENTION_DAYS ngày (job failed được giữ lại để kiểm tra).
+    """
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'JOB_RETENTION_DAYS', 7))
+    deleted, _ = Job.objects.filter(status=Job.DONE, finished_at__lt=cutoff).delete()
+    return deleted
+
+
+class Worker:
+    """
+    Vòng lặp lấy và chạy job. concurrency=0 chạy job ngay trong thread hiện tại.
+    """
+
+    def __init__(self, concurrency=4, poll_interval=1.0, maintenance_interval=60):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.maintenance_interval = maintenance_interval
+        self.stopping = threading.Event()
+        self.periodic = {handler: 0 for handler in getattr(settings, 'PERIODIC_TASKS', {})}
+        self.processed = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    def stop(self):
+        self.stopping.set()
+
+    def maintenance(self):
+        requeued, failed = requeue_stale()
+        if requeued or failed:
+            logger.warning('Đưa lại hàng đợi %s job bị bỏ dở, %s job hết số lần thử.', requeued, failed)
+        purge_finished()
+        outbox.purge_expired()
+        idempotency.purge_expired()
+
+    def run_periodic(self):
+        """
+        Gọi các hàm trong PERIODIC_TASKS đã tới lượt; lỗi chỉ được ghi log.
+        """
+        intervals = getattr(settings, 'PERIODIC_TASKS', {})
+        for handler, next_run in self.periodic.items():
+            if time.monotonic() < next_run:
+                continue
+            try:
+                import_string(handler)()
+            except Exception:
+                logger.exception('Tác vụ định kỳ %s lỗi.', handler)
+            self.periodic[handler] = time.monotonic() + intervals[handler]
+
+    def execute(self, job):
+        ok = run(job)
+        with self.lock:
+            self.processed += 1
+            self.failed += not ok
+
+    def execute_in_thread(self, job):
+        # Như một request: bỏ kết nối hỏng / quá CONN_MAX_AGE của thread trong pool
+        close_old_connections()
+        try:
+            self.execute(job)
+        finally:
+            close_old_connections()
+
+    def run(self, once=False):
+        """
+        Chạy tới khi stop() được gọi; với once=True dừng khi không còn job đến hạn.
+        Trả về (số job đã chạy, số job lỗi).
+        """
+        if not self.concurrency:
+            return self.run_inline(once)
+        in_flight = set()
+        next_maintenance = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='job') as executor:
+            while not self.stopping.is_set():
+                if time.monotonic() >= next_maintenance:
+                    self.maintenance()
+                    next_maintenance = time.monotonic() + self.maintenance_interval
+                self.run_periodic()
+                jobs = claim(self.concurrency - len(in_flight)) if len(in_flight) < self.concurrency else []
+                in_flight.update(executor.submit(self.execute_in_thread, job) for job in jobs)
+                if not in_flight:
+                    if once:
+                        break
+                    self.stopping.wait(self.poll_interval)
+                    continue
+                # Chờ một job xong (có chỗ trống) hoặc tới lượt poll tiếp theo
+                done, in_flight = wait(in_flight, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+            wait(in_flight)
+        return self.processed, self.failed
+
+    def run_inline(self, once):
+        self.maintenance()
+        while not self.stopping.is_set():
+            self.run_periodic()
+            jobs = claim(1)
+            if not jobs:
+                if once:
+                    break
+                self.stopping.wait(self.poll_interval)
+                continue
+            self.execute(jobs[0])
+        return self.processed, self.failed
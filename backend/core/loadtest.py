@@ -0,0 +1,110 @@
+"""
+Client tải HTTP/1.1 keep-alive viết bằng asyncio (chỉ dùng thư viện chuẩn), dùng
+cho `python manage.py loadtest` để so sánh server WSGI và ASGI.
+
+Mỗi client ảo giữ một kết nối và gửi request liên tục trong `duration` giây;
+kết quả gồm số request, lỗi, req/s và độ trễ p50/p95/p99.
+"""
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from .benchmarks import percentile
+
+
+class LoadResult:
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.statuses = {}
+
+    def as_row(self, elapsed):
+        latencies = sorted(self.latencies)
+        row = {
+            'requests': len(latencies),
+            'errors': self.errors,
+            'req_per_s': round(len(latencies) / elapsed, 1),
+            'p50_ms': '-', 'p95_ms': '-', 'p99_ms': '-',
+        }
+        if latencies:
+            row.update(
+                p50_ms=round(percentile(latencies, 0.50), 2),
+                p95_ms=round(percentile(latencies, 0.95), 2),
+                p99_ms=round(percentile(latencies, 0.99), 2),
+            )
+        return row
+
+
+async def fetch(reader, writer, request):
+    """
+    Gửi một request trên kết nối keep-alive, trả về status (body được đọc hết và bỏ đi).
+    """
+    writer.write(request)
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ', 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.read()
+    return status
+
+
+async def virtual_client(url, deadline, result, record_after):
+    parts = urlsplit(url)
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    request = (
+        f'GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nAccept: application/json\r\n'
+        'Connection: keep-alive\r\n\r\n'
+    ).encode('latin-1')
+    connection = None
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection(parts.hostname, parts.port or 80)
+            status = await fetch(*connection, request)
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+            result.errors += started >= record_after
+            if connection is not None:
+                connection[1].close()
+            connection = None
+            await asyncio.sleep(0.05)
+            continue
+        if started < record_after:
+            continue  # warmup
+        result.latencies.append((time.monotonic() - started) * 1000)
+        result.statuses[status] = result.statuses.get(status, 0) + 1
+        if status >= 400:
+            result.errors += 1
+    if connection is not None:
+        connection[1].close()
+
+
+async def run(url, concurrency, duration, warmup=0.0):
+    """
+    Chạy `concurrency` client ảo vào `url` trong warmup + duration giây.
+    Trả về dict kết quả (request, lỗi, req/s, p50/p95/p99 ms).
+    """
+    result = LoadResult()
+    record_after = time.monotonic() + warmup
+    deadline = record_after + duration
+    await asyncio.gather(*(virtual_client(url, deadline, result, record_after) for _ in range(concurrency)))
+    return result.as_row(duration)
+
+
+def load_test(url, concurrency, duration, warmup=0.0):
+    return asyncio.run(run(url, concurrency, duration, warmup))
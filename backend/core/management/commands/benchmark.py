@@ -0,0 +1,61 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks import SCENARIOS, compare, format_table
+
+
+class Command(BaseCommand):
+    help = 'Chạy các kịch bản benchmark trong core/benchmarks.py trên database hiện tại.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help='Tên kịch bản, bỏ trống để chạy tất cả.')
+        parser.add_argument('--repeat', type=int, default=20, help='Số lần lặp mỗi phép đo.')
+        parser.add_argument('--rows', type=int, default=100_000, help='Số dòng sinh ra cho kịch bản import.')
+        parser.add_argument('--objects', type=int, default=500, help='Số object mỗi serializer cho kịch bản serializers.')
+        parser.add_argument(
+            '--base-url', help='Kịch bản api gọi server đang chạy thay cho test client, VD: http://127.0.0.1:8000/api/',
+        )
+        parser.add_argument('--json', action='store_true', help='In kết quả dạng JSON.')
+        parser.add_argument('--output', help='Ghi kết quả JSON vào file (dùng làm baseline cho lần sau).')
+        parser.add_argument('--baseline', help='File JSON của một lần chạy trước để so sánh.')
+        parser.add_argument(
+            '--max-regression', type=float,
+            help='Báo lỗi (exit code khác 0) nếu một số đo xấu đi quá số phần trăm này so với baseline.',
+        )
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or sorted(SCENARIOS)
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            raise CommandError(f"Không có kịch bản: {', '.join(unknown)}. Có: {', '.join(sorted(SCENARIOS))}")
+        if options['base_url'] and not options['base_url'].endswith('/'):
+            options['base_url'] += '/'
+
+        results = {name: SCENARIOS[name](options) for name in names}
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(results, output, indent=2, ensure_ascii=False)
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2, ensure_ascii=False))
+        else:
+            for name, rows in results.items():
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+                for line in format_table(rows):
+                    self.stdout.write(line)
+        if options['baseline']:
+            self.compare_baseline(results, options)
+
+    def compare_baseline(self, results, options):
+        with open(options['baseline'], encoding='utf-8') as baseline:
+            threshold = options['max_regression']
+            rows = compare(results, json.load(baseline), threshold)
+        # Chỉ in các số đo thay đổi đáng kể (mặc định từ 10%)
+        shown = [row for row in rows if abs(row['change_%']) >= (threshold if threshold is not None else 10)]
+        self.stderr.write(self.style.MIGRATE_HEADING(f'So với baseline ({len(shown)}/{len(rows)} số đo thay đổi)'))
+        for line in format_table(shown):
+            self.stderr.write(line)
+        regressions = [row for row in rows if row['regression']]
+        if regressions:
+            raise CommandError(f'{len(regressions)} số đo xấu đi quá {threshold}% so với baseline.')
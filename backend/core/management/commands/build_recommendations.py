@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Tính lại gợi ý sản phẩm mua / yêu thích cùng (top-K theo cosine) từ đơn hàng và yêu thích.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=None, help='Số gợi ý mỗi sản phẩm, mặc định RECOMMENDATION_TOP_K.')
+        parser.add_argument('--block-size', type=int, default=None, help='Số sản phẩm tính cùng lúc, mặc định RECOMMENDATION_BLOCK_SIZE.')
+
+    def handle(self, *args, **options):
+        def progress(processed):
+            self.stdout.write(f'{processed} sản phẩm', ending='\r')
+
+        processed = recommendations.build(
+            top_k_count=options['top_k'], block_size=options['block_size'], progress=progress,
+        )
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f'Đã tính gợi ý cho {processed} sản phẩm.'))
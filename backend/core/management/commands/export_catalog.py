@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from core import catalog_io
+
+
+class Command(BaseCommand):
+    help = 'Xuất danh mục hoặc sản phẩm ra CSV/JSONL theo lô (không nạp cả bảng vào bộ nhớ).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=catalog_io.KINDS, default=catalog_io.PRODUCTS)
+        parser.add_argument('--format', dest='file_format', choices=catalog_io.FORMATS, default='csv')
+        parser.add_argument('--output', '-o', help='File đích, mặc định là stdout.')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        chunks = catalog_io.export_catalog(options['kind'], options['file_format'], options['batch_size'])
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            for chunk in chunks:
+                output.write(chunk)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from core import images
+
+
+class Command(BaseCommand):
+    help = 'Tạo ảnh thu nhỏ WebP cho các sản phẩm đã có ảnh, song song trên nhiều process.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Số process, mặc định bằng số CPU; 0 để chạy tuần tự.')
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--force', action='store_true', help='Tạo lại cả các ảnh đã có biến thể.')
+
+    def handle(self, *args, **options):
+        def progress(processed, failed):
+            self.stdout.write(f'{processed} ảnh, {failed} lỗi', ending='\r')
+
+        processed, failed = images.backfill(
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            force=options['force'],
+            progress=progress,
+        )
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f'Đã tạo ảnh thu nhỏ cho {processed} sản phẩm, {failed} ảnh lỗi.'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import catalog_io
+
+
+class Command(BaseCommand):
+    help = 'Nhập (upsert theo slug) danh mục hoặc sản phẩm từ file CSV/JSONL theo lô.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Đường dẫn file, '-' để đọc từ stdin.")
+        parser.add_argument('--kind', choices=catalog_io.KINDS, default=catalog_io.PRODUCTS)
+        parser.add_argument('--format', dest='file_format', choices=catalog_io.FORMATS, help='Mặc định theo đuôi file.')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['file_format'] or path.rsplit('.', 1)[-1].lower()
+        if file_format not in catalog_io.FORMATS:
+            raise CommandError(f"Không xác định được định dạng của '{path}', dùng --format.")
+
+        def progress(row, result):
+            self.stdout.write(f'{row} dòng, {result.created_or_updated} đã nhập, {result.invalid} lỗi', ending='\r')
+
+        if path == '-':
+            result = catalog_io.import_catalog(self.stdin, options['kind'], file_format, options['batch_size'], progress)
+        else:
+            with open(path, encoding='utf-8', newline='') as stream:
+                result = catalog_io.import_catalog(stream, options['kind'], file_format, options['batch_size'], progress)
+
+        self.stdout.write('')
+        for error in result.errors:
+            self.stderr.write(f"Dòng {error['row']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(f'Đã nhập {result.created_or_updated} bản ghi, bỏ qua {result.invalid} dòng lỗi.'))
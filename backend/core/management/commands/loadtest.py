@@ -0,0 +1,101 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks import format_table
+from core.loadtest import load_test
+from core.models import Product
+
+# Thư mục chứa manage.py (settings.BASE_DIR là thư mục gốc của repo)
+PROJECT_DIR = Path(__file__).resolve().parents[3]
+
+DEFAULT_PATHS = ['categories/', 'products/', 'products/{slug}/', 'products/{slug}/reviews/']
+
+# --serve: mỗi server một worker uvicorn; WSGI chạy view đồng bộ trong thread pool của uvicorn
+SERVERS = {
+    'wsgi': (['TITShop.wsgi:application', '--interface', 'wsgi'], 8100, 'api/'),
+    'asgi': (['TITShop.asgi:application'], 8101, 'api/async/'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Đo req/s và độ trễ p50/p95/p99 của các endpoint đọc catalog với nhiều client đồng thời, '
+        'để so sánh server WSGI (/api/) và ASGI (/api/async/) trên cùng database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', action='append', default=[], metavar='NAME=URL',
+            help='Tiền tố API của một server, VD: wsgi=http://127.0.0.1:8000/api/ (lặp lại cho nhiều server).',
+        )
+        parser.add_argument(
+            '--serve', action='store_true',
+            help='Tự chạy một worker WSGI (cổng 8100) và một worker ASGI (cổng 8101) bằng uvicorn, tắt cache catalog.',
+        )
+        parser.add_argument('--path', action='append', default=[], help='Đường dẫn tương đối, {slug} là một sản phẩm có sẵn.')
+        parser.add_argument('--concurrency', type=int, default=100, help='Số client đồng thời.')
+        parser.add_argument('--duration', type=float, default=15.0, help='Số giây đo cho mỗi endpoint.')
+        parser.add_argument('--warmup', type=float, default=2.0)
+        parser.add_argument('--json', action='store_true', help='In kết quả dạng JSON.')
+
+    def handle(self, *args, **options):
+        targets = dict(target.split('=', 1) for target in options['target'])
+        if not targets and not options['serve']:
+            raise CommandError('Cần --target NAME=URL hoặc --serve.')
+        slug = Product.objects.filter(is_available=True).order_by('-rating_count').values_list('slug', flat=True).first()
+        if slug is None:
+            raise CommandError('Database chưa có sản phẩm, chạy seed_catalog trước.')
+
+        processes = []
+        try:
+            if options['serve']:
+                self.start_servers(targets, processes)
+            rows = []
+            for name, prefix in targets.items():
+                for path in options['path'] or DEFAULT_PATHS:
+                    url = prefix.rstrip('/') + '/' + path.format(slug=slug)
+                    row = {'target': name, 'path': path}
+                    row.update(load_test(url, options['concurrency'], options['duration'], options['warmup']))
+                    rows.append(row)
+                    if not options['json']:
+                        self.stdout.write(f"{name} {path}: {row['req_per_s']} req/s, p99 {row['p99_ms']} ms")
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2))
+            return
+        for line in format_table(rows):
+            self.stdout.write(line)
+
+    def start_servers(self, targets, processes):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE, CATALOG_CACHE_TIMEOUT='0')
+        for name, (app, port, prefix) in SERVERS.items():
+            command = [
+                sys.executable, '-m', 'uvicorn', *app, '--port', str(port),
+                '--workers', '1', '--no-access-log', '--log-level', 'warning',
+            ]
+            processes.append(subprocess.Popen(command, env=env, cwd=PROJECT_DIR))
+            targets.setdefault(name, f'http://127.0.0.1:{port}/{prefix}')
+        for _, port, _ in SERVERS.values():
+            self.wait_for_port(port)
+
+    def wait_for_port(self, port, timeout=20):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f'Server ở cổng {port} không khởi động được (đã cài uvicorn chưa?).')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core import ratings
+
+
+class Command(BaseCommand):
+    help = 'Tính lại rating_count / rating_sum / rating_average của sản phẩm từ ProductReview theo lô.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        processed = ratings.rebuild(batch_size=options['batch_size'], stdout=self.stdout)
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f'Đã tính lại đánh giá cho {processed} sản phẩm.'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from core import analytics
+
+
+class Command(BaseCommand):
+    help = 'Tính lại các bảng tổng hợp doanh số từ đơn hàng theo từng khoảng ngày, song song trên nhiều process.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Số process, mặc định bằng số CPU (chỉ PostgreSQL chạy song song); 0 để chạy tuần tự.',
+        )
+        parser.add_argument('--chunk-days', type=int, default=30, help='Số ngày trong một lô.')
+
+    def handle(self, *args, **options):
+        def progress(done, total):
+            self.stdout.write(f'{done}/{total} lô', ending='\r')
+
+        orders = analytics.rebuild(workers=options['workers'], chunk_days=options['chunk_days'], progress=progress)
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f'Đã tính lại doanh số của {orders} đơn hàng.'))
@@ -0,0 +1,30 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from core import jobs
+
+
+class Command(BaseCommand):
+    help = 'Chạy các job trong hàng đợi (core/jobs.py) trên một thread pool; có thể chạy nhiều worker song song.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Số thread chạy job; 0 để chạy tuần tự.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Số giây chờ giữa hai lần kiểm tra khi hết job.')
+        parser.add_argument('--once', action='store_true', help='Dừng khi không còn job đến hạn (dùng với cron).')
+
+    def handle(self, *args, **options):
+        worker = jobs.Worker(concurrency=options['concurrency'], poll_interval=options['poll_interval'])
+
+        # Ctrl+C / SIGTERM: không lấy job mới, chờ các job đang chạy xong rồi thoát
+        def stop(signum, frame):
+            self.stdout.write('Đang dừng worker...')
+            worker.stop()
+
+        previous = {signum: signal.signal(signum, stop) for signum in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            processed, failed = worker.run(once=options['once'])
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(f'Đã chạy {processed} job, {failed} job lỗi.'))
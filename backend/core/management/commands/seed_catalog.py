@@ -0,0 +1,199 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core import analytics, ratings
+from core.models import Cart, CartItem, Category, Favorite, Order, OrderItem, Product, ProductReview
+
+BRANDS = ['Dell', 'Asus', 'Lenovo', 'Apple', 'Samsung', 'Xiaomi', 'Sony', 'Logitech', 'Acer', 'Oppo']
+NOUNS = ['laptop', 'điện thoại', 'tai nghe', 'bàn phím', 'chuột', 'màn hình', 'loa', 'máy tính bảng', 'sạc', 'ốp lưng']
+WORDS = ['gaming', 'không dây', 'chính hãng', 'mỏng nhẹ', 'pin trâu', 'chống nước', 'cao cấp', 'giá rẻ', 'bluetooth', 'màu đen']
+CITIES = ['HCM', 'Hà Nội', 'Đà Nẵng', 'Cần Thơ', 'Hải Phòng']
+COMMENTS = ['Tốt', 'Giao hàng nhanh', 'Đúng mô tả', 'Tạm được', 'Không như mong đợi', '']
+# Trạng thái đơn hàng và tỉ lệ tương ứng
+STATUS_WEIGHTS = {'pending': 10, 'shipped': 15, 'delivered': 65, 'cancelled': 10}
+
+
+class Command(BaseCommand):
+    help = (
+        'Tạo dữ liệu giả lập bằng bulk_create theo lô (dùng cho benchmark): danh mục, sản phẩm, '
+        'người dùng, đơn hàng kèm sản phẩm, giỏ hàng, đánh giá và yêu thích. Chạy lại sẽ chỉ tạo phần còn thiếu.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1_000_000)
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--users', type=int, default=0)
+        parser.add_argument('--orders', type=int, default=0)
+        parser.add_argument('--max-items', type=int, default=5, help='Số sản phẩm tối đa trong một đơn / giỏ hàng.')
+        parser.add_argument('--days', type=int, default=365, help='Đơn hàng được rải đều trong số ngày gần nhất.')
+        parser.add_argument('--carts', type=int, default=0, help='Số người dùng có giỏ hàng.')
+        parser.add_argument('--reviews', type=int, default=0)
+        parser.add_argument('--favorites', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='seed', help='Tiền tố cho slug / username để không trùng dữ liệu thật.')
+        parser.add_argument('--seed', type=int, default=42, help='Seed cho bộ sinh số ngẫu nhiên.')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.prefix = options['prefix']
+        self.batch_size = options['batch_size']
+        self.options = options
+
+        categories = self.seed_categories(options['categories'])
+        self.seed_products(options['products'], categories)
+        self.stdout.write(self.style.SUCCESS(f"Đã có {options['products']} sản phẩm trong {len(categories)} danh mục."))
+        if not any(options[name] for name in ('users', 'orders', 'carts', 'reviews', 'favorites')):
+            return
+
+        # Sản phẩm được chọn lệch về đầu danh sách (vài sản phẩm bán chạy, phần lớn ít người mua)
+        self.product_ids = list(
+            Product.objects.filter(slug__startswith=f'{self.prefix}-product-').order_by('pk').values_list('pk', flat=True)
+        )
+        self.user_ids = self.seed_users(options['users'])
+        if not self.product_ids or not self.user_ids:
+            self.stdout.write(self.style.WARNING('Cần có sản phẩm và người dùng để tạo đơn hàng, giỏ hàng, đánh giá.'))
+            return
+        self.seed_orders(options['orders'])
+        self.seed_carts(options['carts'])
+        self.seed_reviews(options['reviews'])
+        self.seed_favorites(options['favorites'])
+
+    def progress(self, done, total, label):
+        self.stdout.write(f'{done}/{total} {label}', ending='\r')
+
+    def batches(self, start, total, label):
+        for offset in range(start, total, self.batch_size):
+            end = min(offset + self.batch_size, total)
+            yield offset, end
+            self.progress(end, total, label)
+        if start < total:
+            self.stdout.write('')
+
+    def pick_product(self):
+        return self.product_ids[int(len(self.product_ids) * self.rng.random() ** 3)]
+
+    def pick_products(self):
+        count = min(self.rng.randint(1, self.options['max_items']), len(self.product_ids))
+        picked = set()
+        while len(picked) < count:
+            picked.add(self.pick_product())
+        return sorted(picked)
+
+    def seed_categories(self, total):
+        categories = [
+            Category(name=f'{self.prefix} category {i}', slug=f'{self.prefix}-category-{i}')
+            for i in range(total)
+        ]
+        Category.objects.bulk_create(categories, ignore_conflicts=True)
+        return list(Category.objects.filter(slug__startswith=f'{self.prefix}-category-'))
+
+    def seed_products(self, total, categories):
+        rng = self.rng
+        start = Product.objects.filter(slug__startswith=f'{self.prefix}-product-').count()
+        for offset, end in self.batches(start, total, 'sản phẩm'):
+            batch = [
+                Product(
+                    category=rng.choice(categories),
+                    name=f'{rng.choice(BRANDS)} {rng.choice(NOUNS)} {rng.choice(WORDS)} {i}',
+                    slug=f'{self.prefix}-product-{i}',
+                    description=' '.join(rng.choice(WORDS) for _ in range(12)),
+                    price=Decimal(rng.randint(100, 10_000_000)) / 100,
+                    stock=rng.randint(0, 500),
+                )
+                for i in range(offset, end)
+            ]
+            with transaction.atomic():
+                Product.objects.bulk_create(batch)
+
+    def seed_users(self, total):
+        users = User.objects.filter(username__startswith=f'{self.prefix}-user-')
+        for offset, end in self.batches(users.count(), total, 'người dùng'):
+            # Mật khẩu '!' là mật khẩu không dùng được (không đăng nhập bằng mật khẩu)
+            User.objects.bulk_create([
+                User(username=f'{self.prefix}-user-{i}', email=f'{self.prefix}-user-{i}@example.com', password='!')
+                for i in range(offset, end)
+            ])
+        return list(users.order_by('pk').values_list('pk', flat=True))
+
+    def seed_orders(self, total):
+        rng = self.rng
+        seeded = Order.objects.filter(user__username__startswith=f'{self.prefix}-user-')
+        statuses, weights = zip(*STATUS_WEIGHTS.items())
+        now = timezone.now()
+        start = seeded.count()
+        for offset, end in self.batches(start, total, 'đơn hàng'):
+            lines = [
+                [(product_id, rng.randint(1, 3)) for product_id in self.pick_products()]
+                for _ in range(offset, end)
+            ]
+            prices = dict(
+                Product.objects.filter(pk__in={product_id for items in lines for product_id, _ in items})
+                .values_list('pk', 'price')
+            )
+            orders = []
+            for items in lines:
+                status = rng.choices(statuses, weights)[0]
+                orders.append(Order(
+                    user_id=rng.choice(self.user_ids), first_name='Nguyễn', last_name='Văn A',
+                    email='buyer@example.com', address=f'{rng.randint(1, 500)} Lê Lợi',
+                    postal_code='70000', city=rng.choice(CITIES), status=status, paid=status != 'pending',
+                    total_price=sum(prices[product_id] * quantity for product_id, quantity in items),
+                ))
+            with transaction.atomic():
+                Order.objects.bulk_create(orders)
+                OrderItem.objects.bulk_create([
+                    OrderItem(order=order, product_id=product_id, price=prices[product_id], quantity=quantity)
+                    for order, items in zip(orders, lines)
+                    for product_id, quantity in items
+                ])
+                # created_at là auto_now_add nên được ghi lại sau: mỗi lô một thời điểm, cũ trước mới sau
+                created_at = now - timedelta(days=self.options['days']) * (1 - offset / total)
+                Order.objects.filter(pk__in=[order.pk for order in orders]).update(created_at=created_at)
+        if start < total:
+            # bulk_create không ghi sự kiện vào outbox nên tính lại bảng tổng hợp doanh số
+            analytics.rebuild()
+
+    def seed_carts(self, total):
+        # Giỏ hàng không kèm StockReservation (như giỏ đã hết hạn giữ hàng)
+        carts = Cart.objects.filter(user__username__startswith=f'{self.prefix}-user-')
+        total = min(total, len(self.user_ids))
+        for offset, end in self.batches(carts.count(), total, 'giỏ hàng'):
+            with transaction.atomic():
+                batch = Cart.objects.bulk_create([Cart(user_id=self.user_ids[i]) for i in range(offset, end)])
+                CartItem.objects.bulk_create([
+                    CartItem(cart=cart, product_id=product_id, quantity=self.rng.randint(1, 3))
+                    for cart in batch
+                    for product_id in self.pick_products()
+                ])
+
+    def seed_reviews(self, total):
+        rng = self.rng
+        reviews = ProductReview.objects.filter(user__username__startswith=f'{self.prefix}-user-')
+        start = reviews.count()
+        for offset, end in self.batches(start, total, 'đánh giá'):
+            ProductReview.objects.bulk_create([
+                ProductReview(
+                    user_id=self.user_ids[i % len(self.user_ids)], product_id=self.pick_product(),
+                    rating=rng.choices((1, 2, 3, 4, 5), (5, 5, 15, 35, 40))[0], comment=rng.choice(COMMENTS),
+                )
+                for i in range(offset, end)
+            ])
+        if start < total:
+            # bulk_create không đi qua signal nên tính lại rating của sản phẩm
+            ratings.rebuild(stdout=self.stdout)
+            self.stdout.write('')
+
+    def seed_favorites(self, total):
+        favorites = Favorite.objects.filter(user__username__startswith=f'{self.prefix}-user-')
+        for offset, end in self.batches(favorites.count(), total, 'yêu thích'):
+            # Cặp (user, product) trùng bị bỏ qua nên số bản ghi có thể ít hơn một chút
+            Favorite.objects.bulk_create([
+                Favorite(user_id=self.user_ids[i % len(self.user_ids)], product_id=self.pick_product())
+                for i in range(offset, end)
+            ], ignore_conflicts=True)
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import inventory
+
+
+class Command(BaseCommand):
+    help = 'Xóa các StockReservation đã hết hạn (chạy định kỳ bằng cron hoặc --loop).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--loop', type=int, default=0, metavar='SECONDS', help='Chạy lặp lại sau mỗi SECONDS giây.')
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = inventory.sweep_expired(batch_size=options['batch_size'])
+            self.stdout.write(f'Đã xóa {deleted} reservation hết hạn.')
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
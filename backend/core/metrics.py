@@ -0,0 +1,298 @@
+"""
+Đo hiệu năng theo từng request (bật bằng settings.PERF_METRICS).
+
+PerformanceMiddleware ghi lại cho mỗi request: thời gian xử lý, số query và thời
+gian database, thời gian serializer và kích thước response. Kết quả được:
+- trả về trong header `Server-Timing` (xem được trong DevTools của trình duyệt);
+- cộng vào các histogram trong bộ nhớ của process, xuất dạng text của Prometheus
+  ở /api/metrics/ (mỗi worker có số liệu riêng);
+- ghi log kèm danh sách SQL khi request chậm hơn PERF_SLOW_REQUEST_MS.
+Registry cũng đếm các request bị core/throttling.py từ chối.
+
+Query được đo bằng một execute wrapper gắn vào mọi kết nối database, số liệu của
+request hiện tại nằm trong ContextVar nên đúng cả với view async (ORM chạy trong
+thread khác qua sync_to_async). Khi không có request đang đo, wrapper chỉ tốn một
+lần đọc ContextVar.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger(__name__)
+
+current = ContextVar('request_metrics', default=None)
+
+# Cận trên của các bucket (giây / số query / byte)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class RequestMetrics:
+    __slots__ = ('started', 'db_time', 'db_queries', 'serialize_time', 'queries', 'max_queries')
+
+    def __init__(self, max_queries):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.db_queries = 0
+        self.serialize_time = 0.0
+        # (SQL, giây) để ghi log khi request chậm, tối đa max_queries câu
+        self.queries = []
+        self.max_queries = max_queries
+
+    def add_query(self, sql, duration):
+        self.db_queries += 1
+        self.db_time += duration
+        if len(self.queries) < self.max_queries:
+            self.queries.append((sql, duration))
+
+
+class Histogram:
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # nhãn -> [số lần theo bucket..., +Inf, tổng]
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def expose(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, series in sorted(self.series.items()):
+            label_text = format_labels(labels)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), series):
+                cumulative += count
+                yield f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}'
+            yield f'{self.name}_sum{{{label_text}}} {series[-1]}'
+            yield f'{self.name}_count{{{label_text}}} {cumulative}'
+
+
+class Counter:
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.series = {}
+
+    def inc(self, labels):
+        self.series[labels] = self.series.get(labels, 0) + 1
+
+    def expose(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in sorted(self.series.items()):
+            yield f'{self.name}{{{format_labels(labels)}}} {value}'
+
+
+def format_labels(labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels)
+
+
+class Registry:
+    """
+    Các metric của process, cập nhật dưới một lock (vài phép cộng cho mỗi request).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter('titshop_requests_total', 'Số request theo view, method và status.')
+        self.slow_requests = Counter('titshop_slow_requests_total', 'Số request chậm hơn PERF_SLOW_REQUEST_MS.')
+        self.duration = Histogram(
+            'titshop_request_duration_seconds', 'Thời gian xử lý request.', DURATION_BUCKETS,
+        )
+        self.db_duration = Histogram(
+            'titshop_request_db_duration_seconds', 'Tổng thời gian query database của request.', DURATION_BUCKETS,
+        )
+        self.db_queries = Histogram('titshop_request_db_queries', 'Số query database của request.', QUERY_BUCKETS)
+        self.serialize_duration = Histogram(
+            'titshop_request_serialize_duration_seconds', 'Thời gian serializer của request.', DURATION_BUCKETS,
+        )
+        self.response_size = Histogram('titshop_response_size_bytes', 'Kích thước body của response.', SIZE_BUCKETS)
+        self.rejections = Counter(
+            'titshop_rejected_requests_total', 'Số request bị từ chối theo lý do (throttle, giới hạn đồng thời) và scope.',
+        )
+        self.admission_wait = Histogram(
+            'titshop_admission_wait_seconds', 'Thời gian xếp hàng chờ chỗ trong giới hạn đồng thời theo sản phẩm.',
+            DURATION_BUCKETS,
+        )
+        self.metrics = (
+            self.requests, self.slow_requests, self.duration, self.db_duration,
+            self.db_queries, self.serialize_duration, self.response_size,
+            self.rejections, self.admission_wait,
+        )
+
+    def observe(self, labels, status, duration, metrics, size, slow):
+        with self.lock:
+            self.requests.inc((*labels, ('status', status)))
+            if slow:
+                self.slow_requests.inc(labels)
+            self.duration.observe(labels, duration)
+            self.db_duration.observe(labels, metrics.db_time)
+            self.db_queries.observe(labels, metrics.db_queries)
+            self.serialize_duration.observe(labels, metrics.serialize_time)
+            if size is not None:
+                self.response_size.observe(labels, size)
+
+    def reject(self, labels):
+        with self.lock:
+            self.rejections.inc(labels)
+
+    def observe_admission_wait(self, labels, seconds):
+        with self.lock:
+            self.admission_wait.observe(labels, seconds)
+
+    def expose(self):
+        with self.lock:
+            lines = [line for metric in self.metrics for line in metric.expose()]
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self.lock:
+            for metric in self.metrics:
+                metric.series.clear()
+
+
+registry = Registry()
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, time.perf_counter() - started)
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def serializing():
+    """
+    Cộng thời gian của khối lệnh vào thời gian serializer của request hiện tại.
+    """
+    metrics = current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serialize_time += time.perf_counter() - started
+
+
+def timed_data(data):
+    # BaseSerializer.data chỉ chạy ở serializer ngoài cùng (serializer lồng nhau
+    # dùng to_representation) nên thời gian không bị cộng hai lần
+    def getter(self):
+        with serializing():
+            return data.fget(self)
+    getter.timed = True
+    return property(getter)
+
+
+def install():
+    """
+    Gọi trong AppConfig.ready(): gắn wrapper đo query cho mọi kết nối và đo thời
+    gian BaseSerializer.data của DRF.
+    """
+    connection_created.connect(install_query_wrapper, dispatch_uid='core.metrics')
+    if not getattr(BaseSerializer.data.fget, 'timed', False):
+        BaseSerializer.data = timed_data(BaseSerializer.data)
+
+
+def server_timing(duration, metrics):
+    return (
+        f'app;dur={duration * 1000:.1f}, '
+        f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.db_queries} queries", '
+        f'serialize;dur={metrics.serialize_time * 1000:.1f}'
+    )
+
+
+def view_name(request):
+    # Tên view (VD: product-list) thay vì path để số nhãn không tăng theo URL
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unmatched'
+
+
+class PerformanceMiddleware:
+    """
+    Đặt đầu tiên trong MIDDLEWARE để đo toàn bộ thời gian xử lý request.
+    Chạy được cả dưới WSGI và ASGI (không phải chuyển sync/async khi có view async).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_seconds = getattr(settings, 'PERF_SLOW_REQUEST_MS', 500) / 1000
+        self.max_queries = getattr(settings, 'PERF_SLOW_REQUEST_MAX_QUERIES', 50)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = RequestMetrics(self.max_queries)
+        token = current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        self.finish(request, response, metrics)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics(self.max_queries)
+        token = current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        self.finish(request, response, metrics)
+        return response
+
+    def finish(self, request, response, metrics):
+        duration = time.perf_counter() - metrics.started
+        size = None if response.streaming else len(response.content)
+        slow = duration >= self.slow_seconds
+        labels = (('view', view_name(request)), ('method', request.method))
+        registry.observe(labels, response.status_code, duration, metrics, size, slow)
+        response['Server-Timing'] = server_timing(duration, metrics)
+        if slow:
+            self.log_slow_request(request, response, duration, metrics)
+
+    def log_slow_request(self, request, response, duration, metrics):
+        lines = [
+            f'Request chậm: {request.method} {request.get_full_path()} -> {response.status_code} '
+            f'trong {duration * 1000:.1f} ms ({metrics.db_queries} query, DB {metrics.db_time * 1000:.1f} ms, '
+            f'serializer {metrics.serialize_time * 1000:.1f} ms)'
+        ]
+        lines.extend(f'  [{seconds * 1000:.1f} ms] {sql}' for sql, seconds in metrics.queries)
+        if metrics.db_queries > len(metrics.queries):
+            lines.append(f'  ... và {metrics.db_queries - len(metrics.queries)} query khác')
+        logger.warning('\n'.join(lines))
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.2 on 2026-10-18 16:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def release_cart_stock(apps, schema_editor):
+    """
+    Trước đây giỏ hàng trừ thẳng Product.stock; trả lại số lượng đó vì giờ
+    giỏ hàng chỉ giữ hàng bằng StockReservation.
+    """
+    CartItem = apps.get_model('core', 'CartItem')
+    Product = apps.get_model('core', 'Product')
+    held = CartItem.objects.values('product_id').annotate(quantity=Sum('quantity'))
+    for row in held.iterator():
+        Product.objects.filter(pk=row['product_id']).update(stock=F('stock') + row['quantity'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('cart_item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reservation', to='core.cartitem')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='core.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'expires_at'], name='reservation_product_exp_idx'), models.Index(fields=['expires_at'], name='reservation_expires_idx')],
+            },
+        ),
+        migrations.RunPython(release_cart_stock, migrations.RunPython.noop),
+    ]
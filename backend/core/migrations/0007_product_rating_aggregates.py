@@ -0,0 +1,32 @@
+# Generated by Django 5.2.2 on 2026-10-18 16:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_average',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['rating_average', 'id'], name='product_rating_id_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.2 on 2026-10-18 16:09
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Trigger giữ search_vector đồng bộ với name/description, kể cả khi ghi bằng
+# bulk_create hoặc queryset.update(). Chỉ chạy trên PostgreSQL.
+CREATE_SEARCH_SQL = [
+    """
+    CREATE OR REPLACE FUNCTION core_product_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    CREATE TRIGGER core_product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description ON core_product
+    FOR EACH ROW EXECUTE FUNCTION core_product_search_vector_update();
+    """,
+    "UPDATE core_product SET name = name;",
+    "CREATE INDEX core_product_search_vector_gin ON core_product USING gin (search_vector);",
+    "CREATE INDEX core_product_name_trgm_gin ON core_product USING gin (name gin_trgm_ops);",
+]
+
+DROP_SEARCH_SQL = [
+    "DROP INDEX IF EXISTS core_product_name_trgm_gin;",
+    "DROP INDEX IF EXISTS core_product_search_vector_gin;",
+    "DROP TRIGGER IF EXISTS core_product_search_vector_trigger ON core_product;",
+    "DROP FUNCTION IF EXISTS core_product_search_vector_update();",
+]
+
+
+def run_on_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_product_rating_aggregates'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(run_on_postgresql(CREATE_SEARCH_SQL), run_on_postgresql(DROP_SEARCH_SQL)),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.2 on 2026-10-18 16:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_product_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_created_id_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_price_id_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_rating_id_idx',
+        ),
+        migrations.AddIndex(
+            model_name='cartitem',
+            index=models.Index(fields=['cart', 'product'], name='cartitem_cart_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', '-added_at'], name='favorite_user_added_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['created_at', 'id'], name='product_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['price', 'id'], name='product_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['rating_average', 'id'], name='product_rating_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['category', 'created_at', 'id'], name='product_cat_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['category', 'price', 'id'], name='product_cat_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['category', 'rating_average', 'id'], name='product_cat_rating_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productreview',
+            index=models.Index(fields=['user', '-created_at'], name='review_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productreview',
+            index=models.Index(fields=['product', '-created_at'], name='review_product_created_idx'),
+        ),
+    ]
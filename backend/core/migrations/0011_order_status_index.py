@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_product_image_variants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'status', '-created_at', '-id'], name='order_user_status_created_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:56
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(max_length=50)),
+                ('object_id', models.BigIntegerField()),
+                ('payload', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['event_type', 'id'], name='outbox_type_id_idx'), models.Index(fields=['created_at'], name='outbox_created_idx')],
+            },
+        ),
+    ]
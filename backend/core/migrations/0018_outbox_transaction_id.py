@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:22
+
+from django.db import migrations, models
+
+# Trigger ghi id của transaction (top-level, xid8) vào mỗi sự kiện, kể cả khi ghi
+# bằng bulk_create. Chỉ chạy trên PostgreSQL.
+CREATE_TRIGGER_SQL = [
+    """
+    CREATE OR REPLACE FUNCTION core_outboxevent_transaction_id() RETURNS trigger AS $$
+    BEGIN
+        NEW.transaction_id := pg_current_xact_id()::text::bigint;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    CREATE TRIGGER core_outboxevent_transaction_id_trigger
+    BEFORE INSERT ON core_outboxevent
+    FOR EACH ROW EXECUTE FUNCTION core_outboxevent_transaction_id();
+    """,
+]
+
+DROP_TRIGGER_SQL = [
+    "DROP TRIGGER IF EXISTS core_outboxevent_transaction_id_trigger ON core_outboxevent;",
+    "DROP FUNCTION IF EXISTS core_outboxevent_transaction_id();",
+]
+
+
+def run_on_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='outboxevent',
+            name='outbox_type_id_idx',
+        ),
+        migrations.AddField(
+            model_name='outboxevent',
+            name='transaction_id',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='outboxevent',
+            index=models.Index(fields=['transaction_id', 'id'], name='outbox_position_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='outboxevent',
+            index=models.Index(fields=['event_type', 'transaction_id', 'id'], name='outbox_type_position_idx'),
+        ),
+        # Sự kiện đã có (transaction_id = 0) đứng trước mọi sự kiện mới trong feed
+        migrations.RunPython(run_on_postgresql(CREATE_TRIGGER_SQL), run_on_postgresql(DROP_TRIGGER_SQL)),
+    ]
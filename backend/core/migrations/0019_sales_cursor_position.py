@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_outbox_transaction_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='salescursor',
+            name='counted_transactions',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='salescursor',
+            name='last_transaction_id',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -1,7 +1,8 @@
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, models
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import User
-from django.contrib.contenttypes.fields import GenericForeignKey
-from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 
 # Model cho Danh mục sản phẩm (Category)
 class Category(models.Model):
@@ -26,10 +27,48 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
     image = models.ImageField(upload_to='products/%Y/%m/%d/', blank=True, null=True)
+    # Ảnh thu nhỏ WebP {'<w>w': tên file} tạo sẵn từ image (xem core/images.py)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     is_available = models.BooleanField(default=True)
+    # Tổng hợp đánh giá, cập nhật dần khi thêm/sửa/xóa ProductReview (xem core/ratings.py)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_average = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    # tsvector của name (trọng số A) + description (B), do trigger PostgreSQL duy trì (xem core/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # ProductViewSet chỉ đọc sản phẩm is_available=True nên dùng partial index.
+        # Mỗi thứ tự keyset (field, id) có một index chung và một index theo danh mục
+        # (?category=).
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='product_created_id_idx', condition=models.Q(is_available=True)),
+            models.Index(fields=['price', 'id'], name='product_price_id_idx', condition=models.Q(is_available=True)),
+            models.Index(fields=['rating_average', 'id'], name='product_rating_id_idx', condition=models.Q(is_available=True)),
+            models.Index(fields=['category', 'created_at', 'id'], name='product_cat_created_id_idx', condition=models.Q(is_available=True)),
+            models.Index(fields=['category', 'price', 'id'], name='product_cat_price_id_idx', condition=models.Q(is_available=True)),
+            models.Index(fields=['category', 'rating_average', 'id'], name='product_cat_rating_id_idx', condition=models.Q(is_available=True)),
+        ]
+
+    # Các field mà signal pre_save cần giá trị cũ (xem core/signals.py)
+    TRACKED_FIELDS = ('slug', 'image')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Giá trị vừa đọc từ database, để pre_save không phải query lại
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values) if name in cls.TRACKED_FIELDS
+        }
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        # Giá trị ghi nhớ có thể đã cũ; lần lưu sau đọc lại từ database
+        self.__dict__.pop('_loaded_values', None)
+        super().refresh_from_db(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
@@ -56,6 +95,12 @@ class Order(models.Model):
 
     class Meta:
         ordering = ('-created_at',)
+        indexes = [
+            # Danh sách đơn hàng của user, mới nhất trước (phân trang keyset)
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+            # Danh sách đơn hàng lọc theo trạng thái
+            models.Index(fields=['user', 'status', '-created_at', '-id'], name='order_user_status_created_idx'),
+        ]
 
     def __str__(self):
         return f'Order {self.id} by {self.user.username}'
@@ -86,13 +131,33 @@ class CartItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     added_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['cart', 'product'], name='cartitem_cart_product_idx'),
+        ]
+
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
 
     def get_cost(self):
         return self.product.price * self.quantity
-    
-    
+
+
+# Model giữ hàng cho sản phẩm trong giỏ (hết hạn sau CART_RESERVATION_TTL)
+class StockReservation(models.Model):
+    cart_item = models.OneToOneField(CartItem, related_name='reservation', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='reservations', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'expires_at'], name='reservation_product_exp_idx'),
+            models.Index(fields=['expires_at'], name='reservation_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} until {self.expires_at}"
     
     
 # Model cho Đánh giá sản phẩm
@@ -103,6 +168,12 @@ class ProductReview(models.Model):
     comment = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='review_user_created_idx'),
+            models.Index(fields=['product', '-created_at'], name='review_product_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username}'s review for {self.product.name}"
 
@@ -114,6 +185,195 @@ class Favorite(models.Model):
 
     class Meta:
         unique_together = ('user', 'product')
+        indexes = [
+            models.Index(fields=['user', '-added_at'], name='favorite_user_added_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} likes {self.product.name}"
+
+
+# Claim của JWT dùng để dựng ClaimsUser (xem core/authentication.py)
+USER_CLAIMS = ('is_staff', 'is_superuser', 'is_active')
+
+
+class ClaimsUser(User):
+    """
+    User dựng từ claim của access token: chỉ có id và USER_CLAIMS, các field khác là
+    field trì hoãn (deferred) như khi dùng .only().
+    """
+
+    class Meta:
+        proxy = True
+
+    @classmethod
+    def from_claims(cls, user_id, claims):
+        values = dict(claims, **{User._meta.pk.attname: User._meta.pk.to_python(user_id)})
+        # from_db nhận giá trị theo thứ tự field của model
+        names = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+        return cls.from_db(DEFAULT_DB_ALIAS, names, [values[name] for name in names])
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # Lần đầu đọc một field chưa có thì nạp luôn mọi field còn thiếu (một query)
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred.issuperset(fields):
+            fields = deferred
+        super().refresh_from_db(using, fields, from_queryset)
+
+
+# Hàng đợi công việc chạy nền (xem core/jobs.py)
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    # Đường dẫn import của hàm xử lý, VD: core.order_events.order_created
+    handler = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    # Chưa được chạy trước thời điểm này (lần thử lại được lùi dần)
+    run_at = models.DateTimeField()
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Worker lấy job đến hạn theo thứ tự; chỉ index các job đang chờ
+            models.Index(fields=['run_at', 'id'], name='job_queued_run_at_idx', condition=models.Q(status='queued')),
+            # Tìm job đang chạy bị bỏ dở (worker bị dừng)
+            models.Index(fields=['locked_at'], name='job_running_locked_idx', condition=models.Q(status='running')),
+        ]
+
+    def __str__(self):
+        return f'{self.handler} #{self.pk} ({self.status})'
+
+
+# Sự kiện thay đổi (outbox) cho hệ thống khác đọc qua /api/events/ (xem core/outbox.py)
+class OutboxEvent(models.Model):
+    # VD: order.created, order.status_changed, product.stock_changed
+    event_type = models.CharField(max_length=50)
+    # id của Order / Product mà sự kiện nói tới
+    object_id = models.BigIntegerField()
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    # id của transaction đã ghi sự kiện, do trigger PostgreSQL điền (xem core/outbox.py); 0 với database khác
+    transaction_id = models.BigIntegerField(default=0, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Change feed đọc tiếp theo vị trí (transaction_id, id), có thể lọc theo loại sự kiện (?type=)
+            models.Index(fields=['transaction_id', 'id'], name='outbox_position_idx'),
+            models.Index(fields=['event_type', 'transaction_id', 'id'], name='outbox_type_position_idx'),
+            models.Index(fields=['created_at'], name='outbox_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.event_type} #{self.pk} ({self.object_id})'
+
+
+# Bảng tổng hợp doanh số (xem core/analytics.py). Đơn hàng đã hủy không được tính;
+# ngày là ngày tạo đơn hàng theo TIME_ZONE.
+SALES_AMOUNT = {'max_digits': 14, 'decimal_places': 2, 'default': 0}
+
+
+class DailySales(models.Model):
+    date = models.DateField(unique=True)
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(**SALES_AMOUNT)
+
+
+class DailyCategorySales(models.Model):
+    date = models.DateField()
+    # Không ràng buộc khóa ngoại: doanh số của danh mục đã xóa vẫn giữ id cũ
+    category = models.ForeignKey(Category, on_delete=models.DO_NOTHING, null=True, db_constraint=False, related_name='+')
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(**SALES_AMOUNT)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'category'], name='daily_category_sales_uniq', nulls_distinct=False),
+        ]
+
+
+class DailyProductSales(models.Model):
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(**SALES_AMOUNT)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='daily_product_sales_uniq'),
+        ]
+
+
+class ProductSales(models.Model):
+    # Tổng từ trước tới nay: sản phẩm bán chạy nhất không cần GROUP BY
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='sales')
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(**SALES_AMOUNT)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-units'], name='product_sales_units_idx'),
+            models.Index(fields=['-revenue'], name='product_sales_revenue_idx'),
+        ]
+
+
+class SalesCursor(models.Model):
+    # Vị trí (transaction_id, id) của OutboxEvent cuối cùng đã cộng vào các bảng tổng hợp (một dòng duy nhất)
+    last_transaction_id = models.BigIntegerField(default=0)
+    last_event_id = models.BigIntegerField(default=0)
+    # transaction_id sau vị trí trên mà rebuild đã tính từ Order (sync bỏ qua sự kiện của chúng)
+    counted_transactions = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class RelatedProduct(models.Model):
+    # Top-K sản phẩm hay được mua / yêu thích cùng nhau (core/recommendations.py)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_products')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            # Cũng là index cho /api/products/<slug>/related/ (product_id = ? ORDER BY rank)
+            models.UniqueConstraint(fields=['product', 'rank'], name='related_product_rank_uniq'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    # Header Idempotency-Key của request ghi và response đã trả về (core/idempotency.py)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    # sha256 của method, path và body: cùng key nhưng request khác bị từ chối
+    fingerprint = models.CharField(max_length=64)
+    created_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(default=timezone.now)
+    # None khi request đầu tiên còn đang chạy
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_user_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='idempotency_created_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.user.username} likes {self.product.name}"
\ No newline at end of file
+        return f'{self.key} ({self.response_status or "đang xử lý"})'
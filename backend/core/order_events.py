@@ -0,0 +1,58 @@
+"""
+Việc phụ khi có đơn hàng mới hoặc đơn hàng đổi trạng thái, chạy trong worker
+(core/jobs.py) thay vì trong request đặt hàng.
+
+Job có thể chạy lại (thử lại sau lỗi, worker bị dừng) nên mỗi hàm phải chạy lại
+được nhiều lần; email có thể bị gửi lặp trong trường hợp hiếm đó.
+"""
+import logging
+
+from django.conf import settings
+from django.core.mail import send_mail
+
+from .models import Order, OrderItem
+
+logger = logging.getLogger(__name__)
+
+ORDER_CREATED = 'core.order_events.order_created'
+ORDER_STATUS_CHANGED = 'core.order_events.order_status_changed'
+
+
+def low_stock_alert(order):
+    """
+    Ghi log các sản phẩm của đơn hàng còn không quá LOW_STOCK_THRESHOLD.
+    """
+    threshold = getattr(settings, 'LOW_STOCK_THRESHOLD', 5)
+    rows = (
+        OrderItem.objects.filter(order=order, product__stock__lte=threshold)
+        .values_list('product_id', 'product__name', 'product__stock')
+        .distinct()
+    )
+    for product_id, name, stock in rows:
+        logger.warning('Sản phẩm %s (%s) sắp hết hàng: còn %s.', product_id, name, stock)
+    return len(rows)
+
+
+def order_created(order_id):
+    order = Order.objects.filter(pk=order_id).first()
+    if order is None:
+        return
+    low_stock_alert(order)
+    if getattr(settings, 'ORDER_EMAILS', False):
+        send_mail(
+            f'Xác nhận đơn hàng #{order.pk}',
+            f'Cảm ơn {order.first_name} đã đặt hàng. Tổng tiền: {order.total_price}.',
+            None, [order.email],
+        )
+
+
+def order_status_changed(order_id, old_status, new_status):
+    order = Order.objects.filter(pk=order_id).only('pk', 'email').first()
+    if order is None:
+        return
+    if getattr(settings, 'ORDER_EMAILS', False):
+        send_mail(
+            f'Đơn hàng #{order.pk}: {new_status}',
+            f'Trạng thái đơn hàng #{order.pk} đã đổi từ {old_status} sang {new_status}.',
+            None, [order.email],
+        )
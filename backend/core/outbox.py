@@ -0,0 +1,152 @@
+"""
+Transactional outbox: sự kiện thay đổi Order / Product cho hệ thống khác (báo cáo,
+index tìm kiếm...) đọc dần qua /api/events/?after=<cursor>.
+
+Sự kiện được ghi vào bảng OutboxEvent trong cùng transaction với thay đổi (gọi
+record() bên trong transaction.atomic), nên có sự kiện khi và chỉ khi thay đổi đã
+commit. Consumer lưu id của sự kiện cuối cùng đã xử lý và đọc tiếp từ đó thay vì
+quét lại cả bảng.
+
+id tăng dần theo thứ tự INSERT, không phải thứ tự commit: transaction ghi trước có
+thể commit sau một transaction ghi sau, nên đọc tiếp theo id có thể bỏ sót sự kiện.
+Vì vậy feed đọc theo vị trí (transaction_id, id):
+- trên PostgreSQL transaction_id là id của transaction ghi sự kiện (trigger trong
+  migration 0018) và feed chỉ trả về sự kiện của các transaction có id nhỏ hơn
+  pg_snapshot_xmin, tức là đã kết thúc; transaction bắt đầu sau đó luôn có id lớn
+  hơn nên không có sự kiện nào xuất hiện phía sau vị trí mà consumer đã đọc qua.
+  Một transaction chạy lâu (kể cả không ghi outbox) làm feed chậm lại chứ không mất
+  sự kiện;
+- database khác (SQLite) chỉ cho một transaction ghi tại một thời điểm nên id đã
+  theo thứ tự commit, transaction_id luôn là 0.
+
+Các loại sự kiện:
+- order.created, order.status_changed (object_id là id của Order);
+- product.stock_changed (tồn kho mới sau khi đặt hàng), product.changed /
+  product.deleted (admin sửa hoặc nhập catalog), stock.reserved / stock.released
+  (giữ hàng trong giỏ; object_id là id của Product).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BigIntegerField, Max, Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .models import OutboxEvent
+
+ORDER_CREATED = 'order.created'
+ORDER_STATUS_CHANGED = 'order.status_changed'
+PRODUCT_STOCK_CHANGED = 'product.stock_changed'
+PRODUCT_CHANGED = 'product.changed'
+PRODUCT_DELETED = 'product.deleted'
+STOCK_RESERVED = 'stock.reserved'
+STOCK_RELEASED = 'stock.released'
+
+FEED_FIELDS = ('id', 'transaction_id', 'event_type', 'object_id', 'payload', 'created_at')
+START = (0, 0)
+
+
+def event(event_type, object_id, payload):
+    return OutboxEvent(event_type=event_type, object_id=object_id, payload=payload)
+
+
+def record(*events):
+    """
+    Ghi các sự kiện bằng một câu INSERT. Gọi trong transaction của thay đổi.
+    """
+    return OutboxEvent.objects.bulk_create(events)
+
+
+def order_created(order, items):
+    return event(ORDER_CREATED, order.pk, {
+        'user_id': order.user_id, 'status': order.status, 'total_price': order.total_price,
+        'created_at': order.created_at,
+        'items': [
+            {'product_id': item.product_id, 'quantity': item.quantity, 'price': item.price}
+            for item in items
+        ],
+    })
+
+
+def product_changed(product):
+    return event(PRODUCT_CHANGED, product.pk, {'slug': product.slug})
+
+
+# Transaction đang chạy cũ nhất; mọi transaction có id nhỏ hơn đã commit hoặc rollback
+SNAPSHOT_XMIN_SQL = 'pg_snapshot_xmin(pg_current_snapshot())::text::bigint'
+
+
+def snapshot_xmin():
+    return RawSQL(SNAPSHOT_XMIN_SQL, [], output_field=BigIntegerField())
+
+
+def position(event):
+    return event['transaction_id'], event['id']
+
+
+def event_position(event_id):
+    """
+    Vị trí của sự kiện có id event_id (id của sự kiện là cursor cũ của feed).
+    """
+    transaction_id = OutboxEvent.objects.filter(pk=event_id).values_list('transaction_id', flat=True).first()
+    return transaction_id or 0, event_id
+
+
+def parse_position(value):
+    """
+    Giá trị `after` của feed: '<transaction_id>-<id>' hoặc id của sự kiện. ValueError nếu không hợp lệ.
+    """
+    transaction_id, _, event_id = value.rpartition('-')
+    if not transaction_id:
+        return event_position(max(0, int(event_id)))
+    return max(0, int(transaction_id)), max(0, int(event_id))
+
+
+def format_position(after):
+    return '%d-%d' % after
+
+
+def snapshot_position(event_types=None):
+    """
+    Vị trí trong feed tương ứng với snapshot của transaction hiện tại, trả về
+    (vị trí, các transaction_id sau vị trí đó đã thấy trong snapshot). Sự kiện tới vị
+    trí này hoặc của các transaction đó đã nằm trong dữ liệu đọc bằng snapshot, các
+    sự kiện khác thì chưa. Gọi trong transaction REPEATABLE READ (hoặc SQLite).
+    """
+    events = OutboxEvent.objects.all()
+    if event_types:
+        events = events.filter(event_type__in=event_types)
+    if connection.vendor != 'postgresql':
+        return (0, events.aggregate(last=Max('id'))['last'] or 0), []
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {SNAPSHOT_XMIN_SQL}')
+        xmin = cursor.fetchone()[0]
+    seen = events.filter(transaction_id__gte=xmin).order_by('transaction_id').values_list('transaction_id', flat=True).distinct()
+    return (xmin, 0), list(seen)
+
+
+def read(after=START, limit=500, event_types=None):
+    """
+    Tối đa `limit` sự kiện sau vị trí after = (transaction_id, id) theo thứ tự vị trí,
+    trả về (events, has_more). Vị trí của sự kiện cuối là `after` của lần đọc tiếp theo.
+    """
+    transaction_id, event_id = after
+    events = OutboxEvent.objects.filter(
+        Q(transaction_id__gt=transaction_id) | Q(transaction_id=transaction_id, id__gt=event_id),
+    )
+    if connection.vendor == 'postgresql':
+        events = events.filter(transaction_id__lt=snapshot_xmin())
+    if event_types:
+        events = events.filter(event_type__in=event_types)
+    rows = list(events.order_by('transaction_id', 'id').values(*FEED_FIELDS)[:limit + 1])
+    return rows[:limit], len(rows) > limit
+
+
+def purge_expired():
+    """
+    Xóa sự kiện cũ hơn OUTBOX_RETENTION_DAYS ngày (consumer phải đọc kịp trong thời gian này).
+    """
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'OUTBOX_RETENTION_DAYS', 30))
+    deleted, _ = OutboxEvent.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,201 @@
+import base64
+import json
+from collections.abc import Mapping
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Page
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    """
+    Phân trang offset (?page=) có tổng số bản ghi, dùng cho admin và các danh sách nhỏ.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class KeysetPagination(BasePagination):
+    """
+    Phân trang keyset (cursor) theo cặp (trường sắp xếp, id).
+
+    Trang sau được lọc bằng điều kiện `(field, id) > (giá trị, id)` của bản ghi
+    cuối trang trước, nên trang sâu tốn chi phí như trang đầu (cần index trên
+    (field, id)). Chỉ hỗ trợ đi tới, không trả về tổng số bản ghi.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering_param = 'ordering'
+    invalid_cursor_message = 'Cursor không hợp lệ.'
+
+    # Các thứ tự được hỗ trợ, phần tử đầu tiên là mặc định
+    keyset_orderings = ('-created_at',)
+    # Thứ tự theo annotation (VD: độ liên quan khi tìm kiếm), được dùng làm mặc định
+    # khi queryset có annotation đó và client không chỉ định ordering
+    annotation_orderings = ()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.get_page(list(self.get_page_queryset(queryset, request)))
+
+    def get_page_queryset(self, queryset, request):
+        """
+        Queryset (chưa thực thi) của trang hiện tại kèm một bản ghi thừa để biết còn
+        trang sau; view async dùng hàm này rồi tự đọc bằng `async for`.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset)
+        self.base_url = request.build_absolute_uri()
+        self.pk_name = queryset.model._meta.pk.name
+
+        field = self.ordering.lstrip('-')
+        descending = self.ordering.startswith('-')
+        queryset = queryset.order_by(self.ordering, '-id' if descending else 'id')
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            value, pk = position
+            try:
+                value = self.get_output_field(queryset, field).to_python(value)
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+            op = 'lt' if descending else 'gt'
+            # Điều kiện lte/gte thừa giúp planner dùng index range scan trên (field, id)
+            queryset = queryset.filter(**{f'{field}__{op}e': value}).filter(
+                Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'id__{op}': pk})
+            )
+        return queryset[:self.page_size + 1]
+
+    def get_page(self, results):
+        """
+        Cắt bản ghi thừa của get_page_queryset() và ghi nhớ vị trí cho link trang sau.
+        """
+        field = self.ordering.lstrip('-')
+        self.has_next = len(results) > self.page_size
+        results = results[:self.page_size]
+        self.next_position = None
+        if self.has_next:
+            last = results[-1]
+            if isinstance(last, Mapping):
+                # queryset.values() (xem core/fast_serializers.py)
+                position = (last[field], last[self.pk_name])
+            else:
+                position = (getattr(last, field), last.pk)
+            self.next_position = (self.serialize_value(position[0]), position[1])
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, request, queryset):
+        params = request.query_params.get(self.ordering_param, '')
+        requested = params.split(',')[0].strip()
+        if requested in self.keyset_orderings:
+            return requested
+        for ordering in self.annotation_orderings:
+            if ordering.lstrip('-') in queryset.query.annotations:
+                return ordering
+        return self.keyset_orderings[0]
+
+    def get_output_field(self, queryset, field):
+        if field in queryset.query.annotations:
+            return queryset.query.annotations[field].output_field
+        return queryset.model._meta.get_field(field)
+
+    def serialize_value(self, value):
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return str(value)
+
+    def encode_cursor(self, position):
+        payload = json.dumps([self.ordering, position[0], position[1]])
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            ordering, value, pk = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        # Cursor phải được tạo với cùng thứ tự sắp xếp; giá trị là chuỗi / số do serialize_value tạo
+        # (None, object, list... không dùng được trong điều kiện lọc)
+        if ordering != self.ordering or isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_first_link(self):
+        return remove_query_param(self.base_url, self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'first': self.get_first_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'first': {'type': 'string', 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ProductKeysetPagination(KeysetPagination):
+    keyset_orderings = ('-created_at', 'created_at', 'price', '-price', '-rating_average', 'rating_average')
+    annotation_orderings = ('-search_rank',)
+
+
+class OrderKeysetPagination(KeysetPagination):
+    keyset_orderings = ('-created_at',)
+
+
+class ReviewKeysetPagination(KeysetPagination):
+    keyset_orderings = ('-created_at',)
+
+
+class AsyncPageNumberPagination(StandardResultsSetPagination):
+    """
+    StandardResultsSetPagination cho view async: đếm và đọc trang bằng async ORM.
+    """
+
+    async def apaginate_queryset(self, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Paginator.count là cached_property: gán sẵn để không gọi count() đồng bộ
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            number = paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        bottom = (number - 1) * page_size
+        results = [obj async for obj in queryset[bottom:bottom + page_size]]
+        self.page = Page(results, number, paginator)
+        return results
@@ -0,0 +1,89 @@
+"""
+Duy trì rating_count / rating_sum / rating_average trên Product.
+
+Mỗi thay đổi ProductReview chỉ chạy một câu UPDATE với F() trên hàng Product
+tương ứng, nên trang catalog không phải tổng hợp bảng review khi đọc.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, FloatField, Sum, Value, When
+from django.db.models.functions import Cast
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+
+from . import cache as catalog_cache
+from .models import Product, ProductReview
+
+AVERAGE_FIELD = DecimalField(max_digits=3, decimal_places=2)
+
+
+def average_expression(rating_sum, rating_count):
+    return Case(
+        When(GreaterThan(rating_count, 0), then=Cast(Cast(rating_sum, FloatField()) / rating_count, AVERAGE_FIELD)),
+        default=Value(0),
+        output_field=AVERAGE_FIELD,
+    )
+
+
+def apply_rating_change(product, count_delta, sum_delta):
+    """
+    Cộng count_delta / sum_delta vào tổng hợp đánh giá của product (nguyên tử).
+    """
+    rating_count = F('rating_count') + count_delta
+    rating_sum = F('rating_sum') + sum_delta
+    Product.objects.filter(pk=product.pk).update(
+        rating_count=rating_count,
+        rating_sum=rating_sum,
+        rating_average=average_expression(rating_sum, rating_count),
+        # update() bỏ qua auto_now; cập nhật updated_at để ETag / Last-Modified của catalog thay đổi
+        updated_at=timezone.now(),
+    )
+    transaction.on_commit(lambda: catalog_cache.invalidate_products([product.slug]))
+
+
+def review_created(review):
+    apply_rating_change(review.product, 1, review.rating)
+
+
+def review_updated(review, old_product, old_rating):
+    if old_product.pk != review.product_id:
+        apply_rating_change(old_product, -1, -old_rating)
+        apply_rating_change(review.product, 1, review.rating)
+    elif old_rating != review.rating:
+        apply_rating_change(review.product, 0, review.rating - old_rating)
+
+
+def review_deleted(review):
+    apply_rating_change(review.product, -1, -review.rating)
+
+
+def rebuild(batch_size=1000, stdout=None):
+    """
+    Tính lại tổng hợp đánh giá cho toàn bộ sản phẩm theo lô id (dùng để backfill).
+    """
+    last_id = 0
+    processed = 0
+    now = timezone.now()
+    while True:
+        products = list(Product.objects.filter(pk__gt=last_id).order_by('pk').only('pk', 'slug')[:batch_size])
+        if not products:
+            return processed
+        last_id = products[-1].pk
+        totals = {
+            row['product_id']: row
+            for row in ProductReview.objects.filter(product_id__in=[p.pk for p in products])
+            .values('product_id').annotate(count=Count('id'), total=Sum('rating'))
+        }
+        for product in products:
+            row = totals.get(product.pk, {'count': 0, 'total': 0})
+            product.rating_count = row['count']
+            product.rating_sum = row['total']
+            product.rating_average = (Decimal(row['total']) / row['count']).quantize(Decimal('0.01')) if row['count'] else 0
+            product.updated_at = now
+        with transaction.atomic():
+            Product.objects.bulk_update(products, ['rating_count', 'rating_sum', 'rating_average', 'updated_at'])
+        catalog_cache.invalidate_products([product.slug for product in products])
+        processed += len(products)
+        if stdout is not None:
+            stdout.write(f'{processed} sản phẩm', ending='\r')
@@ -0,0 +1,151 @@
+"""
+Gợi ý "hay được mua / yêu thích cùng" cho /api/products/<slug>/related/, tính offline
+bằng `manage.py build_recommendations` (chạy định kỳ bằng cron).
+
+Mỗi người dùng là một vector thưa trên các sản phẩm: RECOMMENDATION_PURCHASE_WEIGHT
+nếu đã mua (đơn hàng không bị hủy) cộng RECOMMENDATION_FAVORITE_WEIGHT nếu đã yêu
+thích. Độ tương đồng của hai sản phẩm là cosine của hai cột tương ứng của ma trận
+người dùng x sản phẩm M, nên sản phẩm bán chạy không xuất hiện trong gợi ý của mọi
+sản phẩm khác.
+
+Mᵀ·M (sản phẩm x sản phẩm) không được dựng toàn bộ: mỗi lần chỉ tính một khối
+RECOMMENDATION_BLOCK_SIZE sản phẩm rồi giữ top-K và ghi vào RelatedProduct, nên bộ
+nhớ chỉ phụ thuộc vào M (các cặp người dùng - sản phẩm đọc theo lô thành mảng
+NumPy) và kích thước khối. Endpoint chỉ đọc RelatedProduct theo index (product, rank).
+"""
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from scipy import sparse
+
+from .models import Favorite, OrderItem, Product, RelatedProduct
+
+CANCELLED = 'cancelled'
+
+
+def read_pairs(queryset, chunk_size):
+    """
+    Các cặp (user_id, product_id) của queryset.values_list thành mảng int64 (n, 2),
+    đọc theo lô để không giữ hàng triệu tuple Python cùng lúc.
+    """
+    chunks = []
+    batch = []
+    for pair in queryset.iterator(chunk_size=chunk_size):
+        batch.append(pair)
+        if len(batch) >= chunk_size:
+            chunks.append(np.array(batch, dtype=np.int64))
+            batch = []
+    if batch:
+        chunks.append(np.array(batch, dtype=np.int64))
+    return np.concatenate(chunks) if chunks else np.empty((0, 2), dtype=np.int64)
+
+
+def interaction_matrix(purchases, favorites, purchase_weight, favorite_weight):
+    """
+    Ma trận CSR người dùng x sản phẩm và mảng id sản phẩm tương ứng với các cột.
+    """
+    pairs = np.concatenate([purchases, favorites])
+    user_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+    product_ids, columns = np.unique(pairs[:, 1], return_inverse=True)
+    shape = (len(user_ids), len(product_ids))
+    matrix = sparse.csr_matrix(shape, dtype=np.float64)
+    offset = 0
+    for part, weight in ((purchases, purchase_weight), (favorites, favorite_weight)):
+        end = offset + len(part)
+        # Mua nhiều lần / nhiều đơn vẫn chỉ tính một lần
+        seen = sparse.csr_matrix((np.ones(end - offset), (rows[offset:end], columns[offset:end])), shape=shape)
+        seen.data[:] = weight
+        matrix = matrix + seen
+        offset = end
+    matrix.eliminate_zeros()
+    return matrix, product_ids
+
+
+def top_k(row_scores, row_columns, k):
+    if len(row_scores) > k:
+        keep = np.argpartition(-row_scores, k - 1)[:k]
+        row_scores, row_columns = row_scores[keep], row_columns[keep]
+    order = np.lexsort((row_columns, -row_scores))
+    return row_scores[order], row_columns[order]
+
+
+def neighbours(matrix, k, block_size, candidates=None):
+    """
+    Sinh (cột, [(cột láng giềng, điểm)]) cho mọi cột của matrix, tối đa k láng giềng
+    theo cosine giảm dần. candidates: mảng bool theo cột, chỉ các cột True được gợi ý.
+    """
+    matrix = matrix.tocsc()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    inverse = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    normalized = (matrix @ sparse.diags(inverse)).tocsc()
+    target = normalized if candidates is None else (normalized @ sparse.diags(candidates.astype(np.float64))).tocsc()
+    for start in range(0, matrix.shape[1], block_size):
+        end = min(start + block_size, matrix.shape[1])
+        scores = (normalized[:, start:end].T @ target).tocsr()
+        scores.eliminate_zeros()
+        for offset in range(end - start):
+            lo, hi = scores.indptr[offset], scores.indptr[offset + 1]
+            row_scores, row_columns = scores.data[lo:hi], scores.indices[lo:hi]
+            # Bỏ chính nó
+            others = row_columns != start + offset
+            if not others.any():
+                continue
+            row_scores, row_columns = top_k(row_scores[others], row_columns[others], k)
+            yield start + offset, list(zip(row_columns.tolist(), row_scores.tolist()))
+
+
+def save_block(block, computed_at):
+    with transaction.atomic():
+        RelatedProduct.objects.filter(product_id__in=[product_id for product_id, _ in block]).delete()
+        RelatedProduct.objects.bulk_create([
+            RelatedProduct(product_id=product_id, related_id=related_id, rank=rank, score=score, computed_at=computed_at)
+            for product_id, related in block
+            for rank, (related_id, score) in enumerate(related, 1)
+        ], batch_size=2000)
+
+
+def build(top_k_count=None, block_size=None, chunk_size=None, progress=None):
+    """
+    Tính lại RelatedProduct cho mọi sản phẩm có người mua / yêu thích. Gợi ý cũ vẫn
+    được phục vụ trong lúc tính; sản phẩm không còn gợi ý nào bị xóa ở cuối.
+    Trả về số sản phẩm có gợi ý.
+    """
+    k = top_k_count or getattr(settings, 'RECOMMENDATION_TOP_K', 10)
+    block_size = block_size or getattr(settings, 'RECOMMENDATION_BLOCK_SIZE', 1000)
+    chunk_size = chunk_size or getattr(settings, 'RECOMMENDATION_READ_CHUNK', 50_000)
+    computed_at = timezone.now()
+
+    purchases = read_pairs(
+        OrderItem.objects.exclude(order__status=CANCELLED).order_by().values_list('order__user_id', 'product_id').distinct(),
+        chunk_size,
+    )
+    favorites = read_pairs(Favorite.objects.values_list('user_id', 'product_id'), chunk_size)
+    processed = 0
+    if len(purchases) or len(favorites):
+        matrix, product_ids = interaction_matrix(
+            purchases, favorites,
+            getattr(settings, 'RECOMMENDATION_PURCHASE_WEIGHT', 1.0),
+            getattr(settings, 'RECOMMENDATION_FAVORITE_WEIGHT', 0.5),
+        )
+        del purchases, favorites
+        # Chỉ gợi ý sản phẩm đang bán
+        available = set(Product.objects.filter(is_available=True).values_list('pk', flat=True).iterator(chunk_size=chunk_size))
+        candidates = np.fromiter((product_id in available for product_id in product_ids.tolist()), dtype=bool, count=len(product_ids))
+
+        block = []
+        for column, related in neighbours(matrix, k, block_size, candidates):
+            block.append((int(product_ids[column]), [(int(product_ids[other]), score) for other, score in related]))
+            if len(block) >= block_size:
+                save_block(block, computed_at)
+                processed += len(block)
+                block = []
+                if progress is not None:
+                    progress(processed)
+        if block:
+            save_block(block, computed_at)
+            processed += len(block)
+            if progress is not None:
+                progress(processed)
+    RelatedProduct.objects.filter(computed_at__lt=computed_at).delete()
+    return processed
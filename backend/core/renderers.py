@@ -0,0 +1,32 @@
+"""
+JSONRenderer dùng orjson nếu được cài (nhanh hơn nhiều so với module json).
+
+Với dữ liệu của serializer (chuỗi, số nguyên, bool, None, list, dict) kết quả
+giống từng byte JSONRenderer của DRF. Nếu không có orjson, client yêu cầu indent
+hoặc dữ liệu có kiểu orjson không nhận thì dùng JSONRenderer gốc. Lưu ý: số thực
+có thể khác cách viết số mũ (1e-07 / 1e-7); float duy nhất trong API là điểm gợi
+ý (/related/), được làm tròn bằng ScoreField nên không bao giờ ở dạng số mũ.
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or not self.compact or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # datetime, Decimal... được chuyển bằng encoder của DRF để cùng định dạng
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Như DRF: escape U+2028 / U+2029 để nhúng được vào <script>
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
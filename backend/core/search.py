@@ -0,0 +1,64 @@
+"""
+Tìm kiếm sản phẩm.
+
+Trên PostgreSQL dùng full-text search trên cột search_vector (index GIN, do
+trigger trong migration 0008 duy trì) và xếp hạng bằng ts_rank; nếu không có
+kết quả thì thử tìm gần đúng bằng trigram trên name (bắt lỗi gõ sai). Các
+database khác (SQLite khi chạy test) dùng icontains như SearchFilter của DRF.
+"""
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import connections
+from django.db.models import F, Q
+from rest_framework.filters import SearchFilter
+
+SEARCH_CONFIG = 'simple'
+RANK_FIELD = 'search_rank'
+TRIGRAM_THRESHOLD = 0.3
+
+
+def supports_full_text(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def full_text_search(queryset, term):
+    query = SearchQuery(term, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.filter(search_vector=query).annotate(**{RANK_FIELD: SearchRank(F('search_vector'), query)})
+
+
+def trigram_search(queryset, term):
+    return queryset.filter(name__trigram_similar=term).annotate(**{RANK_FIELD: TrigramSimilarity('name', term)})
+
+
+def icontains_search(queryset, term):
+    condition = Q()
+    for word in term.split():
+        condition &= Q(name__icontains=word) | Q(description__icontains=word)
+    return queryset.filter(condition)
+
+
+def search_products(queryset, term):
+    """
+    Lọc queryset theo từ khóa. Với PostgreSQL kết quả có annotation search_rank
+    (càng lớn càng liên quan) để phân trang xếp theo độ liên quan.
+    """
+    term = term.strip()
+    if not term:
+        return queryset
+    if not supports_full_text(queryset):
+        return icontains_search(queryset, term)
+    results = full_text_search(queryset, term)
+    if results.exists():
+        return results
+    return trigram_search(queryset, term)
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    SearchFilter dùng search_products thay cho ILIKE trên từng cột.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return search_products(queryset, ' '.join(terms))
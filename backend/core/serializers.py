@@ -1,27 +1,88 @@
+from collections import defaultdict
+from decimal import Decimal
+
 from rest_framework import serializers
-from .models import Category, Product, Order, OrderItem, Cart, CartItem, ProductReview, Favorite
+from .models import Category, Product, Order, OrderItem, Cart, CartItem, ProductReview, Favorite, RelatedProduct
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from django.db import models
+from django.db.models import Case, ExpressionWrapper, F, OuterRef, Prefetch, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from . import cache as catalog_cache
+from . import inventory
+from . import images
+from . import outbox
+
+
+class EagerLoadingMixin:
+    """
+    Khai báo các quan hệ serializer cần đọc để view nạp trước (tránh N+1 query).
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+    only_fields = ()
+    defer_fields = ()
+
+    @classmethod
+    def get_prefetch_related(cls):
+        return cls.prefetch_related_fields
 
+    @classmethod
+    def get_annotations(cls):
+        return {}
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        annotations = cls.get_annotations()
+        if annotations:
+            queryset = queryset.annotate(**annotations)
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        prefetch_related = cls.get_prefetch_related()
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        if cls.only_fields:
+            queryset = queryset.only(*cls.only_fields)
+        if cls.defer_fields:
+            queryset = queryset.defer(*cls.defer_fields)
+        return queryset
+
+
+class CategorySerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    only_fields = ('id', 'name', 'slug')
 
-class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'slug']
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('category',)
+    defer_fields = ('search_vector',)
+
     category_name = serializers.CharField(source='category.name', read_only=True)
+    image_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
         fields = [
             'id', 'name', 'slug', 'description', 'price',
-            'stock', 'image', 'is_available', 'category', 'category_name'
+            'stock', 'image', 'image_srcset', 'is_available', 'category', 'category_name',
+            'rating_count', 'rating_average'
         ]
+        read_only_fields = ['rating_count', 'rating_average']
         extra_kwargs = {
             'category': {'required': True, 'queryset': Category.objects.all()}
         }
 
-class OrderItemSerializer(serializers.ModelSerializer):
+    def get_image_srcset(self, obj):
+        # Ảnh thu nhỏ WebP theo chiều rộng, rỗng khi ảnh chưa được xử lý xong
+        return images.srcset(obj.image_variants, self.context.get('request'))
+
+class OrderItemSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('product__category',)
+    defer_fields = ('product__search_vector',)
+
     product = ProductSerializer(read_only=True)
 
     class Meta:
@@ -29,17 +90,58 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'product', 'price', 'quantity']
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('user',)
+
     items = OrderItemSerializer(many=True, read_only=True)
     user = serializers.StringRelatedField()
 
+    @classmethod
+    def get_prefetch_related(cls):
+        items = OrderItemSerializer.setup_eager_loading(OrderItem.objects.all())
+        return [Prefetch('items', queryset=items)]
+
     class Meta:
         model = Order
         fields = [
             'id', 'user', 'first_name', 'last_name', 'email', 'address',
             'postal_code', 'city', 'created_at', 'paid', 'total_price', 'items', 'status'
         ]
-        
+
+
+class OrderSummarySerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    """
+    Tóm tắt đơn hàng cho danh sách: số sản phẩm và ảnh đại diện được tính bằng
+    subquery trong cùng câu query, kích thước mỗi phần tử không phụ thuộc số dòng
+    của đơn. Chi tiết đầy đủ (OrderSerializer) chỉ trả về ở retrieve.
+    """
+    only_fields = ('id', 'created_at', 'status', 'total_price')
+
+    item_count = serializers.IntegerField(read_only=True)
+    thumbnail = serializers.SerializerMethodField()
+
+    @classmethod
+    def get_annotations(cls):
+        items = OrderItem.objects.filter(order=OuterRef('pk'))
+        # Sản phẩm của dòng đầu tiên trong đơn làm ảnh đại diện
+        first_item = items.order_by('pk')
+        return {
+            # Tổng số lượng sản phẩm (cộng quantity của các dòng)
+            'item_count': Coalesce(
+                Subquery(items.values('order').annotate(total=Sum('quantity')).values('total')),
+                0, output_field=models.IntegerField(),
+            ),
+            'thumbnail_image': Subquery(first_item.values('product__image')[:1]),
+            'thumbnail_variants': Subquery(first_item.values('product__image_variants')[:1], output_field=models.JSONField()),
+        }
+
+    class Meta:
+        model = Order
+        fields = ['id', 'created_at', 'status', 'total_price', 'item_count', 'thumbnail']
+
+    def get_thumbnail(self, obj):
+        return images.thumbnail(obj.thumbnail_image, obj.thumbnail_variants, self.context.get('request'))
+
 
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, style={'input_type': 'password'})
@@ -62,6 +164,7 @@ class RegisterSerializer(serializers.ModelSerializer):
     
 class CreateOrderItemSerializer(serializers.ModelSerializer):
     product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
 
     class Meta:
         model = OrderItem
@@ -78,68 +181,196 @@ class CreateOrderSerializer(serializers.ModelSerializer):
             'postal_code', 'city', 'items'
         ]
 
+    def validate_items(self, value):
+        if not value:
+            raise serializers.ValidationError("Đơn hàng phải có ít nhất một sản phẩm.")
+        return value
+
     def create(self, validated_data):
-        from django.db import transaction
-        
+        """
+        Tạo đơn hàng theo lô: khóa tất cả sản phẩm một lần (theo thứ tự id để
+        tránh deadlock), trừ kho bằng một câu UPDATE có điều kiện và tạo các
+        OrderItem bằng bulk_create.
+        """
         items_data = validated_data.pop('items')
-        
+
+        quantities = defaultdict(int)
+        for item_data in items_data:
+            quantities[item_data['product_id']] += item_data['quantity']
+
         with transaction.atomic():
-            order = Order.objects.create(**validated_data)
-            
-            total_price = 0
-            for item_data in items_data:
-                product = Product.objects.get(id=item_data['product_id'])
-                quantity = item_data['quantity']
-
-                if product.stock < quantity:
+            products = {
+                product.id: product
+                for product in Product.objects.select_for_update().filter(id__in=quantities).order_by('id')
+            }
+            missing = [product_id for product_id in quantities if product_id not in products]
+            if missing:
+                raise serializers.ValidationError(f"Không tìm thấy sản phẩm: {', '.join(map(str, missing))}.")
+            # Hàng đang được giỏ của người khác giữ thì không bán được
+            reserved = inventory.reserved_quantities(list(products), exclude_user=validated_data['user'])
+            for product_id, quantity in quantities.items():
+                product = products[product_id]
+                if product.stock - reserved.get(product_id, 0) < quantity:
                     raise serializers.ValidationError(f"Sản phẩm '{product.name}' không đủ số lượng tồn kho.")
 
-                item = OrderItem.objects.create(
+            # Điều kiện stock >= quantity được kiểm tra lại ngay trong câu UPDATE
+            condition = Q()
+            for product_id, quantity in quantities.items():
+                condition |= Q(id=product_id, stock__gte=quantity)
+            updated = Product.objects.filter(condition).update(stock=Case(
+                *[When(id=product_id, then=F('stock') - quantity) for product_id, quantity in quantities.items()],
+                default=F('stock'),
+                output_field=models.PositiveIntegerField(),
+            ), updated_at=timezone.now())
+            if updated != len(quantities):
+                raise serializers.ValidationError("Số lượng tồn kho không đủ.")
+
+            total_price = sum(
+                (products[item_data['product_id']].price * item_data['quantity'] for item_data in items_data),
+                Decimal('0'),
+            )
+            order = Order.objects.create(total_price=total_price, **validated_data)
+            order_items = OrderItem.objects.bulk_create([
+                OrderItem(
                     order=order,
-                    product=product,
-                    price=product.price,
-                    quantity=quantity
+                    product=products[item_data['product_id']],
+                    price=products[item_data['product_id']].price,
+                    quantity=item_data['quantity'],
                 )
-                
-                total_price += item.get_cost()
-                product.stock -= quantity
-                product.save()
-
-            order.total_price = total_price
-            order.save()
-            
+                for item_data in items_data
+            ])
+
+            # Sự kiện cho change feed, commit cùng đơn hàng (một câu INSERT)
+            outbox.record(outbox.order_created(order, order_items), *[
+                outbox.event(outbox.PRODUCT_STOCK_CHANGED, product_id, {
+                    'slug': products[product_id].slug, 'stock': products[product_id].stock - quantity,
+                })
+                for product_id, quantity in quantities.items()
+            ])
+
+            # Hàng đã giữ trong giỏ của người mua được chuyển thành hàng đã bán
+            inventory.convert_for_user(validated_data['user'], quantities)
+
+            slugs = [product.slug for product in products.values()]
+            transaction.on_commit(lambda: catalog_cache.invalidate_products(slugs))
+
         return order
     
     
-class CartItemSerializer(serializers.ModelSerializer):
+def cart_item_cost():
+    return ExpressionWrapper(
+        F('product__price') * F('quantity'),
+        output_field=models.DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+class CartItemSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('product__category',)
+    defer_fields = ('product__search_vector',)
+
     product = ProductSerializer()
+    # Thành tiền được tính sẵn trong query (annotation line_cost)
+    get_cost = serializers.ReadOnlyField(source='line_cost')
+
+    @classmethod
+    def get_annotations(cls):
+        return {'line_cost': cart_item_cost()}
 
     class Meta:
         model = CartItem
         fields = ['id', 'product', 'quantity', 'added_at', 'get_cost']
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    item_serializer_class = CartItemSerializer
+
     items = CartItemSerializer(many=True, read_only=True)
     total = serializers.SerializerMethodField()
 
+    @classmethod
+    def get_annotations(cls):
+        # Tổng tiền giỏ hàng tính bằng một subquery SUM trong cùng câu SELECT giỏ hàng
+        totals = (
+            CartItem.objects.filter(cart=OuterRef('pk'))
+            .values('cart')
+            .annotate(total=Sum(cart_item_cost()))
+            .values('total')
+        )
+        return {'total_cost': Subquery(totals, output_field=models.DecimalField(max_digits=12, decimal_places=2))}
+
+    @classmethod
+    def get_prefetch_related(cls):
+        items = cls.item_serializer_class.setup_eager_loading(CartItem.objects.all())
+        return [Prefetch('items', queryset=items)]
+
     class Meta:
         model = Cart
         fields = ['id', 'user', 'created_at', 'items', 'total']
 
     def get_total(self, obj):
+        if hasattr(obj, 'total_cost'):
+            return obj.total_cost or 0
         return sum(item.get_cost() for item in obj.items.all())
+
+
+# Payload gọn cho giỏ hàng (?compact=1): sản phẩm chỉ gồm id, name, price, image
+class CompactProductSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'price', 'image']
+
+
+class CompactCartItemSerializer(CartItemSerializer):
+    select_related_fields = ('product',)
+    only_fields = (
+        'id', 'cart_id', 'quantity', 'added_at',
+        'product__id', 'product__name', 'product__price', 'product__image',
+    )
+    defer_fields = ()
+
+    product = CompactProductSerializer()
+
+
+class CompactCartSerializer(CartSerializer):
+    item_serializer_class = CompactCartItemSerializer
+
+    items = CompactCartItemSerializer(many=True, read_only=True)
     
     
-class ProductReviewSerializer(serializers.ModelSerializer):
+class ProductReviewSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('user',)
+
     user = serializers.StringRelatedField(read_only=True)
 
     class Meta:
         model = ProductReview
-        fields = ['id', 'user', 'rating', 'comment', 'created_at']
+        fields = ['id', 'user', 'product', 'rating', 'comment', 'created_at']
+
+class FavoriteSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('product__category',)
+    defer_fields = ('product__search_vector',)
 
-class FavoriteSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
 
     class Meta:
         model = Favorite
-        fields = ['id', 'product', 'added_at']
\ No newline at end of file
+        fields = ['id', 'product', 'added_at']
+
+
+class ScoreField(serializers.FloatField):
+    """
+    Điểm làm tròn 4 chữ số thập phân: số thực nhỏ hơn 1e-4 được viết dạng số mũ
+    và khác nhau giữa orjson (1e-7) và json (1e-07), xem core/renderers.py.
+    """
+
+    def to_representation(self, value):
+        return round(float(value), 4)
+
+
+class RelatedProductSerializer(serializers.ModelSerializer):
+    # Chỉ đọc, dùng qua RelatedProductValuesSerializer (core/fast_serializers.py)
+    product = ProductSerializer(source='related', read_only=True)
+    score = ScoreField(read_only=True)
+
+    class Meta:
+        model = RelatedProduct
+        fields = ['product', 'score']
@@ -0,0 +1,87 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import cache as catalog_cache
+from . import images
+from .models import Category, Product
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_slug(sender, instance, update_fields=None, **kwargs):
+    # Ghi nhớ slug cũ để vô hiệu hóa cache của URL cũ khi đổi slug
+    instance._cached_old_slug = None
+    instance._image_changed = False
+    instance._stale_variants = None
+    if update_fields is not None and not set(update_fields) & set(Product.TRACKED_FIELDS):
+        return
+    old_image = None
+    if instance.pk is not None:
+        loaded = getattr(instance, '_loaded_values', {})
+        if all(name in loaded for name in Product.TRACKED_FIELDS):
+            # Instance đọc từ database: dùng giá trị lúc đọc, không cần SELECT
+            instance._cached_old_slug, old_image = loaded['slug'], loaded['image']
+        else:
+            old = sender.objects.filter(pk=instance.pk).values_list('slug', 'image').first()
+            if old is not None:
+                instance._cached_old_slug, old_image = old
+    # Ảnh mới (chưa lưu lên storage) hoặc đổi ảnh: bỏ các biến thể của ảnh cũ
+    instance._image_changed = (old_image or '') != (instance.image.name or '') or not instance.image._committed
+    if instance._image_changed:
+        if old_image:
+            # Đọc lại từ database: biến thể có thể được ghi sau khi instance được đọc
+            stored = sender.objects.filter(pk=instance.pk).values_list('image_variants', flat=True).first()
+            names = {*(stored or {}).values(), *instance.image_variants.values()}
+            instance._stale_variants = (old_image, names)
+        instance.image_variants = {}
+
+
+@receiver(post_save, sender=Product)
+def delete_stale_variants(sender, instance, **kwargs):
+    # Đăng ký trước khi tạo biến thể cho ảnh mới nên cũng chạy trước sau khi commit
+    stale = getattr(instance, '_stale_variants', None)
+    if stale:
+        images.delete_variants_on_commit(*stale)
+
+
+@receiver(post_save, sender=Product)
+def generate_product_images(sender, instance, **kwargs):
+    if getattr(instance, '_image_changed', False) and instance.image:
+        images.schedule_on_commit(instance)
+
+
+@receiver(post_delete, sender=Product)
+def delete_product_variants(sender, instance, **kwargs):
+    if instance.image and instance.image_variants:
+        images.delete_variants_on_commit(instance.image.name, instance.image_variants.values())
+
+
+@receiver(post_save, sender=Product)
+def remember_saved_values(sender, instance, update_fields=None, **kwargs):
+    # Lần lưu sau của cùng instance so sánh với giá trị vừa ghi
+    loaded = instance.__dict__.setdefault('_loaded_values', {})
+    if update_fields is None or 'slug' in update_fields:
+        loaded['slug'] = instance.slug
+    if update_fields is None or 'image' in update_fields:
+        loaded['image'] = instance.image.name
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    slugs = {instance.slug}
+    old_slug = getattr(instance, '_cached_old_slug', None)
+    if old_slug:
+        slugs.add(old_slug)
+    # Bump sau commit: bump trong transaction thì request khác có thể đọc dữ liệu cũ
+    # (chưa commit) và ghi lại vào cache với version mới
+    transaction.on_commit(lambda: catalog_cache.invalidate_products(slugs))
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_cache(sender, instance, **kwargs):
+    # Sản phẩm hiển thị category_name nên cache sản phẩm cũng phụ thuộc version này
+    keys = [
+        catalog_cache.version_key(catalog_cache.CATEGORY),
+        catalog_cache.version_key(catalog_cache.CATEGORY, instance.pk),
+    ]
+    transaction.on_commit(lambda: catalog_cache.bump(*keys))
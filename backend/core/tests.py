@@ -1,3 +1,2242 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls.resolvers import URLResolver
+from django.utils import timezone
+from PIL import Image
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework import serializers
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import analytics
+from . import benchmarks
+from .authentication import FastJWTAuthentication, token_cache
+from . import cache as catalog_cache
+from . import catalog_io
+from . import images
+from . import inventory
+from . import jobs
+from . import metrics
+from . import order_events
+from . import outbox
+from . import ratings
+from . import recommendations
+from . import search
+from . import throttling
+from . import urls as core_urls
+from .models import Category, ClaimsUser, DailyCategorySales, DailyProductSales, DailySales, IdempotencyKey, Job, OutboxEvent, Product, Order, OrderItem, Cart, CartItem, Favorite, ProductReview, ProductSales, RelatedProduct, SalesCursor, StockReservation
+from .pagination import ProductKeysetPagination
+from .renderers import FastJSONRenderer
+from .serializers import CreateOrderSerializer
+from .views import FavoriteViewSet, OrderViewSet, ProductViewSet
+from rest_framework.renderers import JSONRenderer
+
+
+class QueryCountTestCase(TestCase):
+    """
+    Kiểm tra số query của mỗi endpoint không tăng theo số bản ghi trả về.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='buyer', password='secret')
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.order = Order.objects.create(
+            user=self.user, first_name='A', last_name='B', email='a@b.com',
+            address='1 Street', postal_code='70000', city='HCM',
+        )
+        self.counter = 0
+
+    def make_product(self):
+        self.counter += 1
+        category = Category.objects.create(name=f'Category {self.counter}', slug=f'category-{self.counter}')
+        return Product.objects.create(
+            category=category, name=f'Product {self.counter}', slug=f'product-{self.counter}',
+            description='...', price=Decimal('10.00'), stock=100,
+        )
+
+    def add_rows(self, count=1):
+        # Cache catalog được vô hiệu hóa sau commit
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(count):
+                product = self.make_product()
+                OrderItem.objects.create(order=self.order, product=product, price=product.price, quantity=1)
+                CartItem.objects.create(cart=self.cart, product=product, quantity=1)
+                Favorite.objects.create(user=self.user, product=product)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(context)
+
+    def assertConstantQueries(self, url_factory):
+        self.add_rows(1)
+        expected = self.count_queries(url_factory())
+        self.add_rows(5)
+        self.assertEqual(self.count_queries(url_factory()), expected)
+
+    def test_product_list(self):
+        self.assertConstantQueries(lambda: '/api/products/')
+
+    def test_product_retrieve(self):
+        self.add_rows(1)
+        self.assertEqual(self.count_queries('/api/products/product-1/'), 1)
+
+    def test_category_list(self):
+        self.assertConstantQueries(lambda: '/api/categories/')
+
+    def test_order_list(self):
+        self.assertConstantQueries(lambda: '/api/orders/')
+
+    def test_order_retrieve(self):
+        self.assertConstantQueries(lambda: f'/api/orders/{self.order.pk}/')
+
+    def test_cart_list(self):
+        self.assertConstantQueries(lambda: '/api/carts/')
+
+    def test_cart_retrieve(self):
+        self.assertConstantQueries(lambda: f'/api/carts/{self.cart.pk}/')
+
+    def test_favorite_list(self):
+        self.assertConstantQueries(lambda: '/api/favorites/')
+
+
+class KeysetPaginationTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        category = Category.objects.create(name='Laptop', slug='laptop')
+        # Nhiều sản phẩm cùng giá để kiểm tra phần so sánh theo id
+        for i in range(7):
+            Product.objects.create(
+                category=category, name=f'Product {i}', slug=f'product-{i}',
+                description='...', price=Decimal('5.00') if i % 2 else Decimal(i), stock=1,
+            )
+
+    def walk(self, url):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            seen.extend(item['slug'] for item in response.data['results'])
+            url = response.data['next']
+        return seen
+
+    def test_walks_every_product_once_in_order(self):
+        for ordering in ('price', '-price', 'created_at', '-created_at'):
+            tiebreak = '-id' if ordering.startswith('-') else 'id'
+            expected = list(Product.objects.order_by(ordering, tiebreak).values_list('slug', flat=True))
+            self.assertEqual(self.walk(f'/api/products/?ordering={ordering}&page_size=2'), expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/products/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def test_malformed_cursor_values(self):
+        for ordering, value in (('-created_at', {}), ('-created_at', None), ('price', None), ('price', [1]),
+                                ('price', True), ('price', 'abc'), ('-created_at', '2024-13-45')):
+            cursor = base64.urlsafe_b64encode(json.dumps([ordering, value, 1]).encode()).decode()
+            response = self.client.get(f'/api/products/?ordering={ordering}&cursor={cursor}')
+            self.assertEqual(response.status_code, 404, (ordering, value))
+
+    def test_cursor_from_other_ordering_is_rejected(self):
+        next_url = self.client.get('/api/products/?ordering=price&page_size=2').data['next']
+        response = self.client.get(next_url.replace('ordering=price', 'ordering=-price'))
+        self.assertEqual(response.status_code, 404)
+
+    def test_admin_gets_offset_pagination(self):
+        self.client.force_authenticate(User.objects.create_user(username='admin', is_staff=True))
+        response = self.client.get('/api/products/?page=2&page_size=5')
+        self.assertEqual(response.data['count'], 7)
+        self.assertEqual(len(response.data['results']), 2)
+
+
+class CatalogCacheTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.stats.reset()
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Laptop', slug='laptop')
+        self.product = Product.objects.create(
+            category=self.category, name='Laptop A', slug='laptop-a',
+            description='...', price=Decimal('10.00'), stock=5,
+        )
+
+    def test_second_request_is_served_from_cache(self):
+        self.assertEqual(self.client.get('/api/products/')['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/products/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(catalog_cache.stats.as_dict(), {'hits': 1, 'misses': 1, 'waits': 0})
+
+    def test_query_params_are_part_of_the_key(self):
+        self.client.get('/api/products/?ordering=price')
+        self.assertEqual(self.client.get('/api/products/?ordering=-price')['X-Cache'], 'MISS')
+
+    def test_product_save_invalidates_list_and_detail(self):
+        self.client.get('/api/products/')
+        self.client.get('/api/products/laptop-a/')
+        self.product.price = Decimal('20.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        response = self.client.get('/api/products/laptop-a/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['price'], '20.00')
+        self.assertEqual(self.client.get('/api/products/')['X-Cache'], 'MISS')
+
+    def test_product_save_keeps_other_details_cached(self):
+        Product.objects.create(
+            category=self.category, name='Laptop B', slug='laptop-b',
+            description='...', price=Decimal('10.00'), stock=5,
+        )
+        self.client.get('/api/products/laptop-a/')
+        Product.objects.get(slug='laptop-b').save()
+        self.assertEqual(self.client.get('/api/products/laptop-a/')['X-Cache'], 'HIT')
+
+    def test_renamed_slug_is_not_served_from_cache(self):
+        self.client.get('/api/products/laptop-a/')
+        self.product.slug = 'laptop-a-2024'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertEqual(self.client.get('/api/products/laptop-a/').status_code, 404)
+
+    def test_product_save_does_not_reread_old_values(self):
+        self.client.get('/api/products/laptop-a/')
+        product = Product.objects.get(pk=self.product.pk)
+        for save in (lambda: product.save(update_fields=['stock']), product.save):
+            with CaptureQueriesContext(connection) as context:
+                save()
+            self.assertEqual([query['sql'] for query in context.captured_queries if query['sql'].startswith('SELECT')], [])
+        product.slug = 'laptop-a-2024'
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertEqual(self.client.get('/api/products/laptop-a/').status_code, 404)
+
+    def test_category_save_invalidates_products(self):
+        self.client.get('/api/products/laptop-a/')
+        self.category.name = 'Notebook'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.save()
+        self.assertEqual(self.client.get('/api/products/laptop-a/').data['category_name'], 'Notebook')
+
+    def test_waits_for_entry_being_computed_by_another_request(self):
+        key = 'catalog:test:key'
+        cache.add(f'{key}:lock', 1)
+        compute = mock.Mock(return_value='fresh')
+        with mock.patch('core.cache.time.sleep', side_effect=lambda _: cache.set(key, 'computed elsewhere')):
+            value, hit = catalog_cache.get_or_set(key, compute)
+        self.assertEqual((value, hit), ('computed elsewhere', True))
+        compute.assert_not_called()
+        self.assertEqual(catalog_cache.stats.waits, 1)
+
+
+
+class ConditionalGetTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Laptop', slug='laptop')
+        self.product = Product.objects.create(
+            category=self.category, name='Laptop A', slug='laptop-a',
+            description='...', price=Decimal('10.00'), stock=5,
+        )
+
+    def test_list_not_modified(self):
+        response = self.client.get('/api/products/')
+        self.assertIn('Last-Modified', response)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+        # Tham số khác (trang, thứ tự...) có ETag khác
+        self.assertNotEqual(self.client.get('/api/products/?ordering=price')['ETag'], etag)
+
+    def test_etag_changes_when_catalog_changes(self):
+        etag = self.client.get('/api/products/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(
+                category=self.category, name='Laptop B', slug='laptop-b',
+                description='...', price=Decimal('10.00'), stock=5,
+            )
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_retrieve_if_modified_since(self):
+        last_modified = self.client.get('/api/products/laptop-a/')['Last-Modified']
+        response = self.client.get('/api/products/laptop-a/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get('/api/products/missing/').status_code, 404)
+        self.assertEqual(self.client.get('/api/categories/abc/').status_code, 404)
+
+    def test_updates_without_signals_change_etag(self):
+        # Cập nhật bằng queryset.update() (đánh giá, tồn kho) vẫn làm đổi ETag
+        etag = self.client.get('/api/products/laptop-a/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            ratings.apply_rating_change(self.product, 1, 5)
+        self.assertEqual(self.client.get('/api/products/laptop-a/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_category_rename_changes_product_etag(self):
+        etag = self.client.get('/api/products/laptop-a/')['ETag']
+        self.category.name = 'Notebook'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.save()
+        response = self.client.get('/api/products/laptop-a/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['category_name'], 'Notebook')
+
+
+ORDER_ADDRESS = {
+    'first_name': 'A', 'last_name': 'B', 'email': 'a@b.com',
+    'address': '1 Street', 'postal_code': '70000', 'city': 'HCM',
+}
+
+
+class CreateOrderTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='buyer', password='secret')
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Laptop', slug='laptop')
+        self.products = [
+            Product.objects.create(
+                category=category, name=f'Product {i}', slug=f'product-{i}',
+                description='...', price=Decimal('10.00') * (i + 1), stock=5,
+            )
+            for i in range(4)
+        ]
+
+    def order(self, items):
+        return self.client.post('/api/order/create/', {**ORDER_ADDRESS, 'items': items}, format='json')
+
+    def test_creates_order_and_decrements_stock(self):
+        response = self.order([
+            {'product_id': self.products[0].id, 'quantity': 2},
+            {'product_id': self.products[1].id, 'quantity': 1},
+            {'product_id': self.products[0].id, 'quantity': 1},
+        ])
+        self.assertEqual(response.status_code, 201, response.content)
+        order = Order.objects.get()
+        self.assertEqual(order.total_price, Decimal('50.00'))
+        self.assertEqual(order.items.count(), 3)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock, 2)
+        self.assertEqual(Product.objects.get(pk=self.products[1].pk).stock, 4)
+
+    def test_insufficient_stock_rolls_back(self):
+        response = self.order([
+            {'product_id': self.products[0].id, 'quantity': 1},
+            {'product_id': self.products[1].id, 'quantity': 6},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock, 5)
+
+    def test_unknown_product(self):
+        self.assertEqual(self.order([{'product_id': 999, 'quantity': 1}]).status_code, 400)
+        self.assertEqual(self.order([]).status_code, 400)
+
+    def test_query_count_does_not_depend_on_line_count(self):
+        with CaptureQueriesContext(connection) as one_line:
+            self.order([{'product_id': self.products[0].id, 'quantity': 1}])
+        with CaptureQueriesContext(connection) as many_lines:
+            self.order([{'product_id': product.id, 'quantity': 1} for product in self.products])
+        self.assertEqual(len(one_line), len(many_lines))
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Cần PostgreSQL để kiểm tra khóa hàng (row lock).')
+@override_settings(PRODUCT_CONCURRENCY_WAIT=10, THROTTLE_BUCKETS={})
+class ConcurrentCheckoutTestCase(TransactionTestCase):
+    """
+    Nhiều thread cùng đặt mua một sản phẩm tồn kho thấp: không được bán vượt số lượng.
+    """
+    threads = 16
+    attempts_per_thread = 5
+    stock = 20
+
+    def test_no_oversell(self):
+        category = Category.objects.create(name='Flash sale', slug='flash-sale')
+        product = Product.objects.create(
+            category=category, name='Hot item', slug='hot-item',
+            description='...', price=Decimal('1.00'), stock=self.stock,
+        )
+        users = [User.objects.create_user(username=f'buyer-{i}') for i in range(self.threads)]
+        statuses = []
+        lock = threading.Lock()
+
+        def checkout(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                for _ in range(self.attempts_per_thread):
+                    response = client.post(
+                        '/api/order/create/',
+                        {**ORDER_ADDRESS, 'items': [{'product_id': product.id, 'quantity': 1}]},
+                        format='json',
+                    )
+                    with lock:
+                        statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=checkout, args=(user,)) for user in users]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        product.refresh_from_db()
+        self.assertEqual(statuses.count(201), self.stock)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(OrderItem.objects.filter(product=product).count(), self.stock)
+
+    def test_benchmark_scenario(self):
+        # Số checkouts/s được đo bằng `manage.py benchmark checkout`
+        for row in benchmarks.SCENARIOS['checkout']({'repeat': 2}):
+            self.assertEqual((row['sold'], row['busy'], row['errors'], row['oversold']), (row['stock'], 0, 0, False), row)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Product.objects.filter(slug__startswith='bench-checkout-').exists())
+
+
+class CartReservationTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Laptop', slug='laptop')
+        self.product = Product.objects.create(
+            category=category, name='Laptop A', slug='laptop-a',
+            description='...', price=Decimal('10.00'), stock=5,
+        )
+        self.user, self.cart, self.client = self.make_shopper('alice')
+        self.other_user, self.other_cart, self.other_client = self.make_shopper('bob')
+
+    def make_shopper(self, username):
+        user = User.objects.create_user(username=username)
+        client = APIClient()
+        client.force_authenticate(user)
+        return user, Cart.objects.create(user=user), client
+
+    def add(self, client, cart, quantity):
+        return client.post(f'/api/carts/{cart.pk}/add_item/', {'product_id': self.product.pk, 'quantity': quantity}, format='json')
+
+    def test_add_item_reserves_without_touching_stock(self):
+        response = self.add(self.client, self.cart, 2)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.add(self.client, self.cart, 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        self.assertEqual(StockReservation.objects.get().quantity, 3)
+        self.assertEqual(inventory.available_stock(self.product), 2)
+
+    def test_cannot_reserve_more_than_available(self):
+        self.add(self.client, self.cart, 4)
+        self.assertEqual(self.add(self.other_client, self.other_cart, 2).status_code, 400)
+        self.assertEqual(self.add(self.other_client, self.other_cart, 1).status_code, 200)
+
+    def test_invalid_product_id(self):
+        url = f'/api/carts/{self.cart.pk}/add_item/'
+        for product_id in ['abc', None, {'id': 1}]:
+            self.assertEqual(self.client.post(url, {'product_id': product_id}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(url, {'product_id': self.product.pk + 100}, format='json').status_code, 404)
+
+    def test_reserve_checks_current_stock(self):
+        # Kiểm tra theo stock hiện tại trong database, không theo instance (cũ) truyền vào
+        stale = Product.objects.get(pk=self.product.pk)
+        Product.objects.filter(pk=self.product.pk).update(stock=2)
+        with self.assertRaises(serializers.ValidationError):
+            inventory.reserve(self.cart, stale, 3)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_in_stock_filter_subtracts_reservations(self):
+        self.add(self.client, self.cart, 5)
+        slugs = lambda query: [item['slug'] for item in self.client.get(f'/api/products/?{query}').data['results']]
+        self.assertEqual(slugs('in_stock=true'), [])
+        self.assertEqual(slugs('in_stock=false'), ['laptop-a'])
+
+    def test_holds_invalidate_cached_in_stock_listing(self):
+        slugs = lambda: [item['slug'] for item in self.client.get('/api/products/?in_stock=true').data['results']]
+        self.assertEqual(slugs(), ['laptop-a'])
+        with self.captureOnCommitCallbacks(execute=True):
+            item_id = self.add(self.client, self.cart, 5).data['items'][0]['id']
+        self.assertEqual(slugs(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/carts/{self.cart.pk}/remove_item/', {'item_id': item_id}, format='json')
+        self.assertEqual(slugs(), ['laptop-a'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add(self.client, self.cart, 5)
+        self.assertEqual(slugs(), [])
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            inventory.sweep_expired()
+        self.assertEqual(slugs(), ['laptop-a'])
+
+    def test_update_and_remove_item(self):
+        item_id = self.add(self.client, self.cart, 1).data['items'][0]['id']
+        url = f'/api/carts/{self.cart.pk}/'
+        self.assertEqual(self.client.post(url + 'update_item/', {'item_id': item_id, 'quantity': 6}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(url + 'update_item/', {'item_id': item_id, 'quantity': 5}, format='json').status_code, 200)
+        self.assertEqual(StockReservation.objects.get().quantity, 5)
+        self.assertEqual(self.client.delete(url + 'remove_item/', {'item_id': item_id}, format='json').status_code, 200)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_expired_reservations_do_not_hold_stock(self):
+        self.add(self.client, self.cart, 5)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.add(self.other_client, self.other_cart, 5).status_code, 200)
+        self.assertEqual(inventory.sweep_expired(), 1)
+        self.assertEqual(list(StockReservation.objects.values_list('cart_item__cart', flat=True)), [self.other_cart.pk])
+
+    def test_checkout_converts_own_reservation_and_respects_others(self):
+        self.add(self.client, self.cart, 2)
+        self.add(self.other_client, self.other_cart, 2)
+        order = {**ORDER_ADDRESS, 'items': [{'product_id': self.product.pk, 'quantity': 4}]}
+        self.assertEqual(self.client.post('/api/order/create/', order, format='json').status_code, 400)
+        order['items'][0]['quantity'] = 3
+        self.assertEqual(self.client.post('/api/order/create/', order, format='json').status_code, 201)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+        self.assertEqual(list(StockReservation.objects.values_list('cart_item__cart', flat=True)), [self.other_cart.pk])
+
+    def test_partial_checkout_keeps_rest_of_hold(self):
+        self.add(self.client, self.cart, 4)
+        order = {**ORDER_ADDRESS, 'items': [{'product_id': self.product.pk, 'quantity': 1}]}
+        self.assertEqual(self.client.post('/api/order/create/', order, format='json').status_code, 201)
+        self.assertEqual(StockReservation.objects.get().quantity, 3)
+        self.assertEqual(CartItem.objects.get().quantity, 3)
+        self.product.refresh_from_db()
+        self.assertEqual(inventory.available_stock(self.product), 1)
+        self.assertEqual(self.add(self.other_client, self.other_cart, 2).status_code, 400)
+
+
+class RatingAggregateTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Laptop', slug='laptop')
+        self.products = [
+            Product.objects.create(
+                category=category, name=f'Product {i}', slug=f'product-{i}',
+                description='...', price=Decimal('10.00'), stock=5,
+            )
+            for i in range(2)
+        ]
+        self.user = User.objects.create_user(username='reviewer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def rating(self, product):
+        product = Product.objects.get(pk=product.pk)
+        return product.rating_count, product.rating_sum, product.rating_average
+
+    def review(self, product, rating):
+        response = self.client.post('/api/reviews/', {'product': product.pk, 'rating': rating}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.data['id']
+
+    def test_create_update_delete(self):
+        review_id = self.review(self.products[0], 4)
+        other = User.objects.create_user(username='other')
+        ProductReview.objects.create(user=other, product=self.products[0], rating=5)
+        ratings.apply_rating_change(self.products[0], 1, 5)
+        self.assertEqual(self.rating(self.products[0]), (2, 9, Decimal('4.50')))
+
+        self.client.patch(f'/api/reviews/{review_id}/', {'rating': 1}, format='json')
+        self.assertEqual(self.rating(self.products[0]), (2, 6, Decimal('3.00')))
+
+        self.client.patch(f'/api/reviews/{review_id}/', {'product': self.products[1].pk}, format='json')
+        self.assertEqual(self.rating(self.products[0]), (1, 5, Decimal('5.00')))
+        self.assertEqual(self.rating(self.products[1]), (1, 1, Decimal('1.00')))
+
+        self.client.delete(f'/api/reviews/{review_id}/')
+        self.assertEqual(self.rating(self.products[1]), (0, 0, Decimal('0.00')))
+
+    def test_serialized_and_orderable(self):
+        self.review(self.products[0], 3)
+        self.review(self.products[1], 5)
+        response = self.client.get('/api/products/?ordering=-rating_average')
+        self.assertEqual([p['slug'] for p in response.data['results']], ['product-1', 'product-0'])
+        self.assertEqual(response.data['results'][0]['rating_average'], '5.00')
+
+    def test_rebuild(self):
+        ProductReview.objects.create(user=self.user, product=self.products[0], rating=2)
+        ProductReview.objects.create(user=User.objects.create_user(username='x'), product=self.products[0], rating=3)
+        Product.objects.filter(pk=self.products[1].pk).update(rating_count=7, rating_sum=7, rating_average=1)
+        self.assertEqual(ratings.rebuild(batch_size=1), 2)
+        self.assertEqual(self.rating(self.products[0]), (2, 5, Decimal('2.50')))
+        self.assertEqual(self.rating(self.products[1]), (0, 0, Decimal('0.00')))
+
+
+class ProductSearchTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        category = Category.objects.create(name='Laptop', slug='laptop')
+        for i, (name, description) in enumerate([
+            ('Dell XPS laptop', 'Laptop mỏng nhẹ'),
+            ('Asus gaming laptop', 'Card đồ họa rời'),
+            ('Logitech chuột', 'Chuột không dây cho laptop'),
+            ('Sony tai nghe', 'Chống ồn'),
+        ]):
+            Product.objects.create(
+                category=category, name=name, slug=f'product-{i}',
+                description=description, price=Decimal('10.00'), stock=1,
+            )
+
+    def search(self, term):
+        response = self.client.get('/api/products/', {'search': term})
+        self.assertEqual(response.status_code, 200, response.content)
+        return {item['name'] for item in response.data['results']}
+
+    def test_matches_every_word_in_name_or_description(self):
+        self.assertEqual(self.search('laptop'), {'Dell XPS laptop', 'Asus gaming laptop', 'Logitech chuột'})
+        self.assertEqual(self.search('gaming laptop'), {'Asus gaming laptop'})
+        self.assertEqual(self.search('máy ảnh'), set())
+
+    def test_filters_once_per_list_request(self):
+        with mock.patch('core.search.search_products', wraps=search.search_products) as search_products:
+            response = self.client.get('/api/products/', {'search': 'laptop', 'facets': '1'})
+        self.assertEqual(response.data['facets']['categories'][0]['count'], 3)
+        # Aggregate của ETag, trang và facet dùng chung một kết quả lọc
+        self.assertEqual(search_products.call_count, 1)
+
+    def test_keyset_pagination_orders_by_annotation_when_present(self):
+        request = APIRequestFactory().get('/api/products/', {'page_size': 1})
+        queryset = Product.objects.annotate(search_rank=Cast('id', FloatField()))
+        paginator = ProductKeysetPagination()
+        seen = []
+        while True:
+            page = paginator.paginate_queryset(queryset, Request(request))
+            seen.extend(product.pk for product in page)
+            if not paginator.get_next_link():
+                break
+            request = APIRequestFactory().get(paginator.get_next_link())
+        self.assertEqual(seen, list(Product.objects.order_by('-id').values_list('pk', flat=True)))
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Full-text search và trigram cần PostgreSQL.')
+class PostgresProductSearchTestCase(ProductSearchTestCase):
+
+    def test_ranks_name_matches_first(self):
+        response = self.client.get('/api/products/', {'search': 'laptop'})
+        self.assertEqual(response.data['results'][-1]['name'], 'Logitech chuột')
+
+    def test_trigram_fallback_for_typos(self):
+        self.assertIn('Dell XPS laptop', self.search('Dell XPS lapotp'))
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'EXPLAIN chỉ kiểm tra được trên PostgreSQL.')
+class QueryPlanTestCase(TestCase):
+    """
+    Chạy EXPLAIN cho mọi câu SELECT mà endpoint sinh ra, với enable_seqscan=off:
+    planner vẫn chọn Seq Scan nghĩa là không có index nào dùng được. Index được thêm
+    cho endpoint phải xuất hiện trong plan (không chỉ một index bất kỳ).
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='buyer')
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name='Laptop', slug='laptop')
+        self.product = Product.objects.create(
+            category=self.category, name='Dell laptop', slug='dell-laptop',
+            description='Laptop mỏng nhẹ', price=Decimal('10.00'), stock=5,
+        )
+        self.order = Order.objects.create(user=self.user, **ORDER_ADDRESS)
+        OrderItem.objects.create(order=self.order, product=self.product, price=self.product.price)
+        self.cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=self.cart, product=self.product)
+        Favorite.objects.create(user=self.user, product=self.product)
+        ProductReview.objects.create(user=self.user, product=self.product, rating=5)
+
+    def scans(self, plan, node_types):
+        # Giá trị của các node trong plan: tên bảng với Seq Scan, tên index với các loại Index Scan
+        found = []
+        if plan.get('Node Type') in node_types:
+            found.append(plan.get('Relation Name') if plan['Node Type'] == 'Seq Scan' else plan['Index Name'])
+        for child in plan.get('Plans', []):
+            found.extend(self.scans(child, node_types))
+        return found
+
+    def explain(self, queries, label):
+        """
+        Tên các index mà các câu SELECT trong `queries` dùng; báo lỗi nếu câu nào quét tuần tự.
+        """
+        used = set()
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+            for query in queries:
+                if not query['sql'].lstrip().upper().startswith('SELECT'):
+                    continue
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + query['sql'])
+                plan = cursor.fetchone()[0][0]['Plan']
+                self.assertEqual(self.scans(plan, {'Seq Scan'}), [], f'{label}: {query["sql"]}')
+                used.update(self.scans(plan, {'Index Scan', 'Index Only Scan', 'Bitmap Index Scan'}))
+            cursor.execute('RESET enable_seqscan')
+        return used
+
+    def assertIndexedPlan(self, url, *indexes):
+        """
+        Không câu SELECT nào của `url` quét tuần tự, và mỗi index trong `indexes` được
+        dùng bởi ít nhất một câu.
+        """
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        used = self.explain(context.captured_queries, url)
+        for index in indexes:
+            self.assertIn(index, used, url)
+
+    def test_product_list(self):
+        suffixes = {'created_at': 'created', 'price': 'price', 'rating_average': 'rating'}
+        for ordering in ProductKeysetPagination.keyset_orderings:
+            suffix = suffixes[ordering.lstrip('-')]
+            self.assertIndexedPlan(f'/api/products/?ordering={ordering}', f'product_{suffix}_id_idx')
+            self.assertIndexedPlan(
+                f'/api/products/?ordering={ordering}&category={self.category.pk}', f'product_cat_{suffix}_id_idx',
+            )
+
+    def test_product_list_next_page(self):
+        Product.objects.create(
+            category=self.category, name='Asus laptop', slug='asus-laptop',
+            description='...', price=Decimal('20.00'), stock=5,
+        )
+        next_url = self.client.get('/api/products/?page_size=1').data['next']
+        self.assertIndexedPlan(next_url, 'product_created_id_idx')
+
+    def test_product_search(self):
+        self.assertIndexedPlan('/api/products/?search=laptop', 'core_product_search_vector_gin')
+
+    def test_product_retrieve(self):
+        self.assertIndexedPlan('/api/products/dell-laptop/')
+
+    def test_categories(self):
+        self.assertIndexedPlan('/api/categories/')
+
+    def test_orders(self):
+        self.assertIndexedPlan('/api/orders/', 'order_user_created_idx')
+        self.assertIndexedPlan('/api/orders/?status=pending', 'order_user_status_created_idx')
+        self.assertIndexedPlan('/api/orders/?created_at__gte=2024-01-01&created_at__lt=2030-01-01', 'order_user_created_idx')
+        self.assertIndexedPlan(f'/api/orders/{self.order.pk}/')
+
+    def test_carts(self):
+        self.assertIndexedPlan('/api/carts/')
+        self.assertIndexedPlan(f'/api/carts/{self.cart.pk}/')
+        # Dòng giỏ hàng của một sản phẩm (add_item, đặt hàng)
+        with CaptureQueriesContext(connection) as context:
+            CartItem.objects.filter(cart=self.cart, product=self.product).values_list('quantity', flat=True).first()
+        self.assertIn('cartitem_cart_product_idx', self.explain(context.captured_queries, 'add_item'))
+
+    def test_favorites_and_reviews(self):
+        self.assertIndexedPlan('/api/favorites/', 'favorite_user_added_idx')
+        self.assertIndexedPlan('/api/reviews/', 'review_user_created_idx')
+
+
+class CartTotalsTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        category = Category.objects.create(name='Laptop', slug='laptop')
+        for i in range(3):
+            product = Product.objects.create(
+                category=category, name=f'Product {i}', slug=f'product-{i}',
+                description='...', price=Decimal('1.50') * (i + 1), stock=10,
+            )
+            CartItem.objects.create(cart=self.cart, product=product, quantity=i + 1)
+
+    def test_totals_are_computed_in_the_database(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/carts/{self.cart.pk}/')
+        self.assertEqual(Decimal(str(response.data['total'])), Decimal('21.00'))
+        self.assertEqual([Decimal(str(item['get_cost'])) for item in response.data['items']], [Decimal('1.50'), Decimal('6.00'), Decimal('13.50')])
+
+    def test_empty_cart_total(self):
+        CartItem.objects.all().delete()
+        self.assertEqual(self.client.get(f'/api/carts/{self.cart.pk}/').data['total'], 0)
+
+    def test_compact_payload(self):
+        response = self.client.get(f'/api/carts/{self.cart.pk}/?compact=1')
+        self.assertEqual(set(response.data['items'][0]['product']), {'id', 'name', 'price', 'image'})
+        self.assertEqual(Decimal(str(response.data['total'])), Decimal('21.00'))
+
+    def test_mutation_response_honours_compact(self):
+        product = Product.objects.get(slug='product-0')
+        response = self.client.post(
+            f'/api/carts/{self.cart.pk}/add_item/?compact=1', {'product_id': product.pk, 'quantity': 1}, format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertNotIn('description', response.data['items'][0]['product'])
+        self.assertEqual(Decimal(str(response.data['total'])), Decimal('22.50'))
+
+
+class CatalogImportExportTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Laptop', slug='laptop')
+        Product.objects.create(
+            category=self.category, name='Old name', slug='dell-xps',
+            description='...', price=Decimal('10.00'), stock=1,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='admin', is_staff=True))
+
+    def test_csv_upsert_by_slug(self):
+        data = (
+            'slug,name,description,price,stock,is_available,category\n'
+            'dell-xps,Dell XPS 13,Laptop,1999.00,5,True,laptop\n'
+            'asus-rog,Asus ROG,Gaming,2599.50,2,,laptop\n'
+            'bad-price,Bad,Bad,abc,1,True,laptop\n'
+            'no-category,No category,...,1.00,1,True,missing\n'
+        )
+        result = catalog_io.import_catalog(io.StringIO(data), batch_size=2)
+        self.assertEqual((result.created_or_updated, result.invalid), (2, 2))
+        self.assertEqual([error['row'] for error in result.errors], [3, 4])
+        self.assertEqual(Product.objects.get(slug='dell-xps').name, 'Dell XPS 13')
+        self.assertTrue(Product.objects.get(slug='asus-rog').is_available)
+
+    def test_export_round_trip(self):
+        for file_format in catalog_io.FORMATS:
+            exported = ''.join(catalog_io.export_catalog(file_format=file_format, batch_size=1))
+            Product.objects.update(name='Changed')
+            result = catalog_io.import_catalog(io.StringIO(exported), file_format=file_format)
+            self.assertEqual(result.created_or_updated, 1, result.errors)
+            self.assertEqual(Product.objects.get().name, 'Old name')
+
+    def test_categories(self):
+        result = catalog_io.import_catalog(io.StringIO('{"slug": "phone", "name": "Phone"}\n'), catalog_io.CATEGORIES, 'jsonl')
+        self.assertEqual(result.created_or_updated, 1)
+        self.assertIn('phone,Phone', ''.join(catalog_io.export_catalog(catalog_io.CATEGORIES)))
+
+    def test_malformed_jsonl_rows_are_reported(self):
+        data = (
+            '[1, 2]\n"abc"\n{"slug": "x", "name": "X", "description": "...", "price": "1.00", "category": ["laptop"]}\n'
+            '{"slug": "asus-rog", "name": "Asus ROG", "description": "...", "price": "1.00", "category": "laptop"}\n'
+        )
+        result = catalog_io.import_catalog(io.StringIO(data), file_format='jsonl')
+        self.assertEqual((result.created_or_updated, result.invalid), (1, 3))
+        self.assertEqual([error['row'] for error in result.errors], [1, 2, 3])
+        self.assertTrue(Product.objects.filter(slug='asus-rog').exists())
+
+    def test_integrity_error_skips_only_bad_rows(self):
+        # Tên danh mục là unique: dòng 3 trùng tên với danh mục 'laptop' đã có
+        data = ''.join(f'{{"slug": "{slug}", "name": "{name}"}}\n' for slug, name in [
+            ('phone', 'Phone'), ('tablet', 'Tablet'), ('notebook', 'Laptop'), ('watch', 'Watch'), ('tv', 'TV'),
+        ])
+        progress = []
+        result = catalog_io.import_catalog(
+            io.StringIO(data), catalog_io.CATEGORIES, 'jsonl', batch_size=4,
+            progress=lambda row, result: progress.append(row),
+        )
+        self.assertEqual((result.created_or_updated, result.invalid), (4, 1))
+        self.assertEqual([error['row'] for error in result.errors], [3])
+        self.assertEqual(progress, [4, 5])
+        self.assertEqual(
+            sorted(Category.objects.values_list('slug', flat=True)),
+            ['laptop', 'phone', 'tablet', 'tv', 'watch'],
+        )
+
+    def test_endpoints_are_admin_only(self):
+        anonymous = APIClient()
+        self.assertEqual(anonymous.get('/api/catalog/export/').status_code, 401)
+        response = self.client.get('/api/catalog/export/?file_format=jsonl')
+        self.assertEqual(response.status_code, 200)
+        exported = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(json.loads(exported)['slug'], 'dell-xps')
+
+        upload = SimpleUploadedFile('products.jsonl', exported.replace('Old name', 'New name').encode('utf-8'))
+        response = self.client.post('/api/catalog/import/?file_format=jsonl', {'file': upload}, format='multipart')
+        self.assertEqual(response.data['imported'], 1)
+        self.assertEqual(Product.objects.get().name, 'New name')
+
+
+def make_image(name='photo.png', size=(800, 600)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+@override_settings(PRODUCT_IMAGE_ASYNC=False, PRODUCT_IMAGE_WIDTHS=(160, 320, 1280))
+class ProductImageTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.category = Category.objects.create(name='Laptop', slug='laptop')
+
+    def create_product(self, slug='dell-xps', image=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(
+                category=self.category, name=slug, slug=slug, description='...',
+                price=Decimal('10.00'), stock=1, image=image or make_image(),
+            )
+
+    def test_variants_generated_after_save(self):
+        product = self.create_product()
+        product.refresh_from_db()
+        self.assertEqual(list(product.image_variants), ['160w', '320w'])
+        name = product.image_variants['320w']
+        self.assertEqual(name, images.variant_name(product.image.name, 320))
+        with images.default_storage.open(name) as stored:
+            self.assertEqual(Image.open(stored).format, 'WEBP')
+            self.assertEqual(Image.open(stored).size, (320, 240))
+
+        response = APIClient().get(f'/api/products/{product.slug}/')
+        self.assertEqual(list(response.data['image_srcset']), ['160w', '320w'])
+        self.assertTrue(response.data['image_srcset']['160w'].startswith('http://testserver/media/'))
+
+    def test_replacing_image_regenerates_variants(self):
+        product = self.create_product()
+        with self.captureOnCommitCallbacks(execute=True):
+            product.image = make_image('small.png', size=(100, 50))
+            product.save()
+        product.refresh_from_db()
+        self.assertEqual(list(product.image_variants), ['100w'])
+
+        # Lưu lại mà không đổi ảnh thì không xử lý lại
+        with mock.patch('core.images.schedule_on_commit') as schedule:
+            product.save()
+        schedule.assert_not_called()
+
+    def test_old_variants_are_deleted(self):
+        product = self.create_product()
+        old_image, old_variants = product.image.name, Product.objects.get(pk=product.pk).image_variants
+        with self.captureOnCommitCallbacks(execute=True):
+            product.image = make_image('small.png', size=(100, 50))
+            product.save()
+        self.assertFalse(any(images.default_storage.exists(name) for name in old_variants.values()))
+
+        # Biến thể của ảnh cũ xử lý xong sau khi ảnh đã bị thay cũng bị bỏ
+        self.assertIsNone(images.process(product.pk, old_image))
+        self.assertFalse(any(images.default_storage.exists(name) for name in old_variants.values()))
+
+        new_variants = Product.objects.get(pk=product.pk).image_variants
+        self.assertTrue(all(images.default_storage.exists(name) for name in new_variants.values()))
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=product.pk).delete()
+        self.assertFalse(any(images.default_storage.exists(name) for name in new_variants.values()))
+
+    def test_shared_image_variants_are_kept(self):
+        product = self.create_product()
+        variants = Product.objects.get(pk=product.pk).image_variants
+        Product.objects.create(
+            category=self.category, name='copy', slug='copy', description='...',
+            price=Decimal('10.00'), stock=1, image=product.image.name, image_variants=variants,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(pk=product.pk).delete()
+        self.assertTrue(all(images.default_storage.exists(name) for name in variants.values()))
+
+    def test_backfill(self):
+        product = self.create_product()
+        broken = self.create_product('broken')
+        Product.objects.update(image_variants={})
+        with images.default_storage.open(broken.image.name, 'wb') as stored:
+            stored.write(b'not an image')
+
+        with self.assertLogs('core.images', 'ERROR'):
+            self.assertEqual(images.backfill(workers=0, batch_size=1), (1, 1))
+        product.refresh_from_db()
+        self.assertEqual(list(product.image_variants), ['160w', '320w'])
+        with self.assertLogs('core.images', 'ERROR'):
+            self.assertEqual(images.backfill(workers=0), (0, 1))
+
+
+class ValuesSerializerTestCase(TestCase):
+    """
+    Đường đọc bằng values() + orjson phải cho ra đúng từng byte như ModelSerializer + JSONRenderer.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Điện thoại', slug='phone')
+        products = [
+            Product.objects.create(
+                category=category if i % 2 else None, name=f'Sản phẩm “{i}” \u2028', slug=f'product-{i}',
+                description='...', price=Decimal(f'{i}.5'), stock=i, image=f'products/{i}.png' if i % 3 else None,
+                image_variants={'320w': f'products/{i}_320w.webp', '160w': f'products/{i}_160w.webp'} if i % 3 else {},
+                rating_average=Decimal('4.5'),
+            )
+            for i in range(5)
+        ]
+        for i in range(3):
+            order = Order.objects.create(user=self.user, total_price=Decimal('1.00'), **ORDER_ADDRESS)
+            for product in products[i:i + 2]:
+                OrderItem.objects.create(order=order, product=product, price=product.price, quantity=i + 1)
+        Order.objects.create(user=self.user, total_price=Decimal('0'), **ORDER_ADDRESS)
+        for product in products[:3]:
+            Favorite.objects.create(user=self.user, product=product)
+
+    def assertSameOutput(self, viewset, url):
+        with mock.patch.object(viewset, 'values_serializer_classes', {}), \
+                mock.patch.object(viewset, 'renderer_classes', [JSONRenderer]):
+            expected = self.client.get(url)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, expected.content)
+        return len(queries)
+
+    def test_products(self):
+        self.assertSameOutput(ProductViewSet, '/api/products/')
+        self.assertSameOutput(ProductViewSet, '/api/products/?ordering=price&page_size=2')
+        next_url = self.client.get('/api/products/?ordering=price&page_size=2').data['next']
+        self.assertSameOutput(ProductViewSet, next_url)
+
+    def test_products_admin(self):
+        self.client.force_authenticate(User.objects.create_user(username='admin', is_staff=True))
+        self.assertSameOutput(ProductViewSet, '/api/products/?page=2&page_size=2')
+
+    def test_orders(self):
+        queries = self.assertSameOutput(OrderViewSet, '/api/orders/')
+        self.assertSameOutput(OrderViewSet, '/api/orders/?page_size=2')
+        # Tóm tắt đơn hàng (số sản phẩm, ảnh đại diện) chỉ trong một query
+        self.assertEqual(queries, 1)
+
+    def test_favorites(self):
+        self.assertSameOutput(FavoriteViewSet, '/api/favorites/')
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            'text': 'Tiếng Việt \u2028 \u2029 "quoted"', 'price': Decimal('1.50'), 'when': timezone.now(),
+            'list': [1, True, None, {'nested': 'x'}],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'),
+        )
+
+
+class AsyncCatalogTestCase(TestCase):
+    """
+    Endpoint async (/api/async/...) trả về đúng payload của endpoint đồng bộ cho người dùng ẩn danh.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        categories = [Category.objects.create(name=f'Danh mục {i}', slug=f'cat-{i}') for i in range(3)]
+        self.products = [
+            Product.objects.create(
+                category=categories[i % 3], name=f'Sản phẩm {i}', slug=f'product-{i}',
+                description='...', price=Decimal(f'{i}.25'), stock=i,
+            )
+            for i in range(5)
+        ]
+        for i in range(4):
+            user = User.objects.create_user(username=f'reviewer-{i}')
+            ProductReview.objects.create(user=user, product=self.products[0], rating=i + 1, comment=f'Bình luận {i}')
+
+    def assertSameResponse(self, path):
+        expected = self.client.get(f'/api/{path}')
+        response = self.client.get(f'/api/async/{path}')
+        self.assertEqual(response.status_code, expected.status_code)
+        # Link phân trang trỏ về chính tiền tố /api/async/
+        self.assertEqual(response.content.replace(b'/api/async/', b'/api/'), expected.content)
+        return response
+
+    def test_categories(self):
+        self.assertSameResponse('categories/')
+        self.assertSameResponse('categories/?page=2&page_size=2')
+        self.assertSameResponse('categories/?page=last&page_size=2')
+        self.assertEqual(self.assertSameResponse('categories/?page=9').status_code, 404)
+
+    def test_products(self):
+        self.assertSameResponse('products/')
+        self.assertSameResponse('products/?ordering=price&page_size=2')
+        self.assertSameResponse(f'products/?category={self.products[1].category_id}')
+        self.assertSameResponse('products/?search=phẩm 3')
+        self.assertEqual(self.assertSameResponse('products/?category=999').status_code, 400)
+        self.assertEqual(self.assertSameResponse('products/?cursor=bad').status_code, 404)
+
+        next_url = self.client.get('/api/products/?page_size=2').data['next']
+        cursor = next_url.split('cursor=')[1]
+        self.assertSameResponse(f'products/?page_size=2&cursor={cursor}')
+
+    def test_product_detail_and_reviews(self):
+        self.assertSameResponse('products/product-0/')
+        self.assertEqual(self.assertSameResponse('products/missing/').status_code, 404)
+        response = self.assertSameResponse('products/product-0/reviews/?page_size=3')
+        self.assertEqual([review['rating'] for review in response.json()['results']], [4, 3, 2])
+        self.assertEqual(self.assertSameResponse('products/missing/reviews/').status_code, 404)
+
+    def test_read_only(self):
+        self.assertEqual(self.client.post('/api/async/products/').status_code, 405)
+
+
+class OrderSummaryTestCase(TestCase):
+    """
+    Danh sách đơn hàng trả về bản tóm tắt có kích thước cố định, chi tiết chỉ ở retrieve.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.products = [
+            Product.objects.create(
+                name=f'Sản phẩm {i}', slug=f'product-{i}', description='...', price=Decimal('5.00'), stock=100,
+                image=f'products/{i}.png' if i else None,
+            )
+            for i in range(3)
+        ]
+        # Đổi ảnh khi lưu sẽ xóa image_variants nên ghi bằng update()
+        Product.objects.filter(pk=self.products[1].pk).update(
+            image_variants={'320w': 'products/1_320w.webp', '160w': 'products/1_160w.webp'},
+        )
+        self.order = Order.objects.create(user=self.user, total_price=Decimal('50.00'), **ORDER_ADDRESS)
+        OrderItem.objects.create(order=self.order, product=self.products[1], price=Decimal('5.00'), quantity=10)
+        self.empty = Order.objects.create(user=self.user, status='shipped', **ORDER_ADDRESS)
+        Order.objects.filter(pk=self.empty.pk).update(created_at=timezone.now() - timedelta(days=30))
+
+    def get_results(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['results']
+
+    def test_list_is_summary(self):
+        summary, empty = self.get_results('/api/orders/')
+        self.assertEqual(
+            list(summary), ['id', 'created_at', 'status', 'total_price', 'item_count', 'thumbnail'],
+        )
+        self.assertEqual(summary['item_count'], 10)
+        self.assertEqual(summary['thumbnail'], 'http://testserver/media/products/1_160w.webp')
+        self.assertEqual((empty['item_count'], empty['thumbnail']), (0, None))
+
+        # Chưa có ảnh thu nhỏ thì dùng ảnh gốc của sản phẩm dòng đầu tiên
+        OrderItem.objects.create(order=self.empty, product=self.products[2], price=Decimal('5.00'))
+        OrderItem.objects.create(order=self.empty, product=self.products[0], price=Decimal('5.00'), quantity=2)
+        empty = self.get_results('/api/orders/')[1]
+        self.assertEqual((empty['item_count'], empty['thumbnail']), (3, 'http://testserver/media/products/2.png'))
+
+    def test_size_independent_of_items(self):
+        with CaptureQueriesContext(connection) as before:
+            size = len(self.client.get('/api/orders/').content)
+        for _ in range(40):
+            OrderItem.objects.create(order=self.order, product=self.products[2], price=Decimal('5.00'))
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get('/api/orders/')
+        self.assertEqual(response.json()['results'][0]['item_count'], 50)
+        self.assertEqual(len(response.content), size)
+        self.assertEqual(len(after), len(before))
+
+    def test_filters(self):
+        def ids(query):
+            return [order['id'] for order in self.get_results(f'/api/orders/?{query}')]
+
+        self.assertEqual(ids('status=shipped'), [self.empty.pk])
+        self.assertEqual(ids('status__in=pending,shipped'), [self.order.pk, self.empty.pk])
+        since = (timezone.now() - timedelta(days=7)).date().isoformat()
+        self.assertEqual(ids(f'created_at__gte={since}'), [self.order.pk])
+        self.assertEqual(ids(f'created_at__lt={since}'), [self.empty.pk])
+        self.assertEqual(ids(f'created_at__gte={since}&status=shipped'), [])
+        self.assertEqual(self.client.get('/api/orders/?status=unknown').status_code, 400)
+
+    def test_retrieve_is_full_detail(self):
+        response = self.client.get(f'/api/orders/{self.order.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['items'][0]['product']['slug'], 'product-1')
+        self.assertIn('address', response.data)
+
+
+class PerformanceMetricsTestCase(TestCase):
+    """
+    PerformanceMiddleware: header Server-Timing, /api/metrics/ và log request chậm.
+    """
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.client = APIClient()
+        category = Category.objects.create(name='Laptop', slug='laptop')
+        for i in range(3):
+            Product.objects.create(
+                category=category, name=f'Laptop {i}', slug=f'laptop-{i}', description='...',
+                price=Decimal('10.00'), stock=5,
+            )
+
+    def server_timing(self, response):
+        return dict(
+            (part.split(';')[0].strip(), part) for part in response['Server-Timing'].split(',')
+        )
+
+    def assertCountsQueries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        timing = self.server_timing(response)
+        self.assertEqual(set(timing), {'app', 'db', 'serialize'})
+        self.assertIn(f'desc="{len(context)} queries"', timing['db'])
+        return response
+
+    def test_server_timing(self):
+        self.assertCountsQueries('/api/products/')
+        self.assertCountsQueries('/api/products/laptop-0/')
+
+    def test_server_timing_async_view(self):
+        # Query của view async chạy trong thread khác vẫn được tính cho request
+        self.assertCountsQueries('/api/async/products/')
+
+    async def test_asgi_handler(self):
+        # Dưới ASGI middleware chạy bản async (__acall__)
+        response = await self.async_client.get('/api/async/products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+    @override_settings(PERF_METRICS_TOKEN='scrape-secret')
+    def test_prometheus_endpoint(self):
+        self.client.get('/api/products/')
+        self.client.get('/api/products/')
+        self.client.get('/api/products/missing/')
+        response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('titshop_requests_total{view="product-list",method="GET",status="200"} 2', text)
+        self.assertIn('titshop_requests_total{view="product-detail",method="GET",status="404"} 1', text)
+        self.assertIn('titshop_request_duration_seconds_count{view="product-list",method="GET"} 2', text)
+        self.assertIn('titshop_request_db_queries_bucket{view="product-list",method="GET",le="+Inf"} 2', text)
+        serialize_sum = next(
+            line for line in text.splitlines()
+            if line.startswith('titshop_request_serialize_duration_seconds_sum{view="product-list"')
+        )
+        self.assertGreater(float(serialize_sum.split()[-1]), 0)
+
+        # Không có IP nào được mở mặc định, kể cả localhost (request qua reverse proxy)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        self.assertEqual(self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        with override_settings(PERF_METRICS_ALLOWED_IPS=('10.0.0.1',)):
+            self.assertEqual(self.client.get('/api/metrics/', REMOTE_ADDR='10.0.0.1').status_code, 200)
+        self.client.force_login(User.objects.create_user(username='admin', is_staff=True))
+        self.assertEqual(self.client.get('/api/metrics/', REMOTE_ADDR='10.0.0.1').status_code, 200)
+
+    @override_settings(PERF_SLOW_REQUEST_MS=0)
+    def test_slow_request_logged_with_sql(self):
+        client = APIClient()
+        with self.assertLogs('core.metrics', 'WARNING') as logs:
+            client.get('/api/products/?search=laptop')
+        self.assertIn('GET /api/products/?search=laptop -> 200', logs.output[0])
+        self.assertIn('FROM "core_product"', logs.output[0])
+        self.assertIn('titshop_slow_requests_total{view="product-list",method="GET"} 1', metrics.registry.expose())
+
+
+class BenchmarkSuiteTestCase(TestCase):
+    """
+    seed_catalog tạo đủ bộ dữ liệu, kịch bản benchmark `api` gọi được mọi route của core/urls.py.
+    """
+
+    def seed(self):
+        call_command(
+            'seed_catalog', products=40, categories=3, users=6, orders=15, carts=4, reviews=20, favorites=12,
+            batch_size=7, stdout=io.StringIO(),
+        )
+
+    def test_seed_catalog(self):
+        self.seed()
+        counts = [
+            Product.objects.count(), User.objects.count(), Order.objects.count(), Cart.objects.count(),
+            ProductReview.objects.count(),
+        ]
+        self.assertEqual(counts, [40, 6, 15, 4, 20])
+        self.assertTrue(1 <= Favorite.objects.count() <= 12)
+        self.assertFalse(Order.objects.filter(items__isnull=True).exists())
+        self.assertFalse(CartItem.objects.filter(cart__isnull=True).exists())
+        # Tổng đơn khớp các dòng, rating được tính lại sau bulk_create
+        for order in Order.objects.prefetch_related('items'):
+            self.assertEqual(order.total_price, sum(item.get_cost() for item in order.items.all()))
+        self.assertEqual(sum(Product.objects.values_list('rating_count', flat=True)), 20)
+        # Đơn hàng được rải theo thời gian
+        self.assertGreater(Order.objects.values('created_at').distinct().count(), 1)
+
+        # Chạy lại chỉ tạo phần còn thiếu
+        self.seed()
+        self.assertEqual(Order.objects.count(), 15)
+        self.assertEqual(ProductReview.objects.count(), 20)
+
+    def test_api_routes_cover_urls(self):
+        def names(patterns):
+            for pattern in patterns:
+                if isinstance(pattern, URLResolver):
+                    yield from names(pattern.url_patterns)
+                elif pattern.name:
+                    yield pattern.name
+
+        self.assertEqual(set(names(core_urls.urlpatterns)), {route[0] for route in benchmarks.API_ROUTES})
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], ALLOWED_HOSTS=['localhost'])
+    def test_api_scenario(self):
+        self.seed()
+        rows = benchmarks.SCENARIOS['api']({'repeat': 2})
+        self.assertEqual(len(rows), len(benchmarks.API_ROUTES))
+        for row in rows:
+            self.assertLess(row['status'], 400, row)
+            self.assertEqual(row['requests'], 2)
+        # Request ghi đã được rollback
+        self.assertFalse(User.objects.filter(username='benchmark-new').exists())
+        self.assertEqual(Order.objects.filter(user__username='benchmark-user').count(), 1)
+
+    def test_compare_with_baseline(self):
+        baseline = {'api': [
+            {'route': 'product-list', 'method': 'GET', 'path': 'products/', 'status': 200,
+             'req_per_s': 100.0, 'p95_ms': 10.0, 'queries': 2},
+        ]}
+        results = {'api': [
+            {'route': 'product-list', 'method': 'GET', 'path': 'products/', 'status': 200,
+             'req_per_s': 50.0, 'p95_ms': 10.5, 'queries': 3},
+            {'route': 'order-list', 'method': 'GET', 'path': 'orders/', 'status': 200,
+             'req_per_s': 1.0, 'p95_ms': 1.0, 'queries': 1},
+        ]}
+        rows = {row['metric']: row for row in benchmarks.compare(results, baseline, threshold=20)}
+        self.assertEqual(set(rows), {'req_per_s', 'p95_ms', 'queries'})
+        self.assertEqual(rows['req_per_s']['change_%'], -50.0)
+        self.assertTrue(rows['req_per_s']['regression'])
+        self.assertFalse(rows['p95_ms']['regression'])
+        self.assertTrue(rows['queries']['regression'])
+
+
+class FastJWTAuthenticationTestCase(TestCase):
+    """
+    JWT do /api/token/ cấp mang claim của user, xác thực không cần đọc bảng User.
+    """
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username='buyer', password='secret', email='buyer@example.com')
+        self.client = APIClient()
+
+    def obtain(self, username='buyer', password='secret'):
+        response = self.client.post('/api/token/', {'username': username, 'password': password}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def get(self, url, access):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {access}')
+        user_queries = [query for query in context.captured_queries if 'FROM "auth_user"' in query['sql']]
+        return response, user_queries
+
+    def test_claims_skip_user_lookup(self):
+        access = self.obtain()['access']
+        Order.objects.create(user=self.user, **ORDER_ADDRESS)
+        response, user_queries = self.get('/api/orders/', access)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(user_queries, [])
+
+    def test_full_user_loaded_once_when_needed(self):
+        access = self.obtain()['access']
+        response, user_queries = self.get('/api/profile/', access)
+        self.assertEqual(response.data['username'], 'buyer')
+        self.assertEqual(response.data['email'], 'buyer@example.com')
+        self.assertEqual(len(user_queries), 1)
+
+    def test_token_without_claims_reads_user(self):
+        response, user_queries = self.get('/api/orders/', AccessToken.for_user(self.user))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(user_queries), 1)
+
+    def test_staff_claim_and_refresh(self):
+        User.objects.create_user(username='admin', password='secret', is_staff=True)
+        refresh = self.obtain('admin')['refresh']
+        response = self.client.post('/api/token/refresh/', {'refresh': refresh}, format='json')
+        access = response.data['access']
+        self.assertTrue(AccessToken(access)['is_staff'])
+        # Admin dùng phân trang offset (có count)
+        response, user_queries = self.get('/api/products/', access)
+        self.assertIn('count', response.data)
+        self.assertEqual(user_queries, [])
+
+    def test_claims_user(self):
+        user = ClaimsUser.from_claims(str(self.user.pk), {'is_staff': True, 'is_superuser': False, 'is_active': True})
+        self.assertEqual((user.pk, user.is_staff, user.is_superuser, user.is_active), (self.user.pk, True, False, True))
+        self.assertEqual(user.get_deferred_fields(), {
+            'password', 'last_login', 'username', 'first_name', 'last_name', 'email', 'date_joined',
+        })
+
+    def test_validated_token_cached(self):
+        access = self.obtain()['access']
+        with mock.patch.object(
+            FastJWTAuthentication, 'get_validated_token', wraps=FastJWTAuthentication().get_validated_token,
+        ) as validate:
+            self.get('/api/orders/', access)
+            self.get('/api/carts/', access)
+        self.assertEqual(validate.call_count, 1)
+
+    def test_invalid_token_rejected(self):
+        access = self.obtain()['access']
+        response, _ = self.get('/api/orders/', access[:-2] + 'xx')
+        self.assertEqual(response.status_code, 401)
+
+
+class ThrottlingTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        category = Category.objects.create(name='Laptop', slug='laptop')
+        self.product = Product.objects.create(
+            category=category, name='Laptop A', slug='laptop-a',
+            description='...', price=Decimal('10.00'), stock=100,
+        )
+        self.user = User.objects.create_user(username='buyer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def order(self, client=None):
+        return (client or self.client).post(
+            '/api/order/create/', {**ORDER_ADDRESS, 'items': [{'product_id': self.product.id, 'quantity': 1}]},
+            format='json',
+        )
+
+    def rejections(self):
+        return dict(metrics.registry.rejections.series)
+
+    @override_settings(THROTTLE_BUCKETS={'checkout': {'user': ('1/min', 2)}})
+    def test_user_bucket_returns_429(self):
+        self.assertEqual([self.order().status_code for _ in range(3)], [201, 201, 429])
+        response = self.order()
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(self.rejections(), {(('reason', 'throttle_user'), ('scope', 'checkout')): 2})
+
+        # Bucket riêng cho từng user
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username='other'))
+        self.assertEqual(self.order(other).status_code, 201)
+
+    @override_settings(THROTTLE_BUCKETS={'cart': {'global': ('1/s', 1)}})
+    def test_global_bucket_returns_503_and_ignores_reads(self):
+        cart = Cart.objects.create(user=self.user)
+        url = f'/api/carts/{cart.pk}/add_item/'
+        self.assertEqual(self.client.post(url, {'product_id': self.product.pk}, format='json').status_code, 200)
+        response = self.client.post(url, {'product_id': self.product.pk}, format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.client.get('/api/carts/').status_code, 200)
+        self.assertIn(
+            'titshop_rejected_requests_total{reason="throttle_global",scope="cart"} 1', metrics.registry.expose(),
+        )
+
+    @override_settings(THROTTLE_BUCKETS={}, PRODUCT_CONCURRENCY_LIMIT=1, PRODUCT_CONCURRENCY_WAIT=0)
+    def test_product_hotspot_rejects_fast(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with throttling.product_slots([self.product.pk], 'test'):
+                started = time.monotonic()
+                response = self.order()
+                self.assertLess(time.monotonic() - started, 1)
+            # Khóa hàng Product được giữ tới khi transaction commit nên chỗ cũng vậy
+            self.assertEqual(self.order().status_code, 503)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.rejections(), {(('reason', 'concurrency'), ('scope', 'checkout')): 2})
+        # Chỗ được trả lại khi transaction commit
+        self.assertEqual(self.order().status_code, 201)
+
+    @override_settings(PRODUCT_CONCURRENCY_LIMIT=2, PRODUCT_CONCURRENCY_WAIT=5)
+    def test_product_hotspot_queues(self):
+        inside = []
+        active = []
+        lock = threading.Lock()
+
+        def work():
+            with throttling.product_slots([self.product.pk, self.product.pk + 1], 'test'):
+                with lock:
+                    active.append(1)
+                    inside.append(len(active))
+                time.sleep(0.02)
+                with lock:
+                    active.pop()
+
+        workers = [threading.Thread(target=work) for _ in range(6)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(len(inside), 6)
+        self.assertLessEqual(max(inside), 2)
+        self.assertEqual(self.rejections(), {})
+        self.assertIn('titshop_admission_wait_seconds_count{scope="test"} 6', metrics.registry.expose())
+
+
+@override_settings(PRODUCT_PRICE_BUCKETS=(100, 1000))
+class ProductFacetTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        laptop = Category.objects.create(name='Laptop', slug='laptop')
+        phone = Category.objects.create(name='Phone', slug='phone')
+        rows = [(laptop, '50.00', 0), (laptop, '500.00', 3), (laptop, '5000.00', 1), (phone, '100.00', 2), (phone, '999.99', 0)]
+        self.products = [
+            Product.objects.create(
+                category=category, name=f'Product {i}', slug=f'product-{i}',
+                description='...', price=Decimal(price), stock=stock,
+            )
+            for i, (category, price, stock) in enumerate(rows)
+        ]
+        self.laptop, self.phone = laptop, phone
+
+    def slugs(self, query):
+        response = self.client.get(f'/api/products/?{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return sorted(item['slug'] for item in response.data['results'])
+
+    def test_range_and_stock_filters(self):
+        self.assertEqual(self.slugs('price_min=100&price_max=999.99'), ['product-1', 'product-3', 'product-4'])
+        self.assertEqual(self.slugs('in_stock=true'), ['product-1', 'product-2', 'product-3'])
+        self.assertEqual(self.slugs('in_stock=false'), ['product-0', 'product-4'])
+        self.assertEqual(self.slugs(f'category={self.laptop.pk}&price_max=1000&in_stock=true'), ['product-1'])
+        self.assertEqual(self.slugs('price=50.00'), ['product-0'])
+        self.assertEqual(self.client.get('/api/products/?price_min=abc').status_code, 400)
+
+    def test_facets(self):
+        with CaptureQueriesContext(connection) as plain:
+            self.client.get('/api/products/?in_stock=true')
+        with CaptureQueriesContext(connection) as faceted:
+            response = self.client.get('/api/products/?in_stock=true&facets=1')
+        # Một query GROUP BY cho cả hai facet
+        self.assertEqual(len(faceted), len(plain) + 1)
+        self.assertEqual(response.data['facets'], {
+            'categories': [
+                {'id': self.laptop.pk, 'name': 'Laptop', 'slug': 'laptop', 'count': 2},
+                {'id': self.phone.pk, 'name': 'Phone', 'slug': 'phone', 'count': 1},
+            ],
+            'price': [
+                {'min': None, 'max': 100, 'count': 0},
+                {'min': 100, 'max': 1000, 'count': 2},
+                {'min': 1000, 'max': None, 'count': 1},
+            ],
+        })
+        self.assertNotIn('facets', self.client.get('/api/products/?in_stock=true').data)
+
+    def test_facets_cached_across_pages_and_invalidated(self):
+        self.client.get('/api/products/?facets=1')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/products/?facets=1&ordering=price&page_size=2')
+        self.assertFalse(any('GROUP BY' in query['sql'] for query in context.captured_queries))
+        self.assertEqual(sum(item['count'] for item in response.data['facets']['categories']), 5)
+
+        product = self.products[0]
+        product.price = Decimal('2000.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        response = self.client.get('/api/products/?facets=1')
+        self.assertEqual([bucket['count'] for bucket in response.data['facets']['price']], [0, 3, 2])
+
+
+# Hàm xử lý job dùng trong JobQueueTestCase
+executed_jobs = []
+
+
+def record_job(key):
+    executed_jobs.append(key)
+
+
+def failing_job():
+    raise ValueError('boom')
+
+
+class JobQueueTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        executed_jobs.clear()
+        self.user = User.objects.create_user(username='buyer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Laptop', slug='laptop')
+        self.product = Product.objects.create(
+            category=category, name='Laptop A', slug='laptop-a',
+            description='...', price=Decimal('10.00'), stock=3,
+        )
+
+    def checkout(self):
+        return self.client.post(
+            '/api/order/create/', {**ORDER_ADDRESS, 'items': [{'product_id': self.product.id, 'quantity': 1}]},
+            format='json',
+        )
+
+    def test_checkout_enqueues_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.checkout()
+            self.assertEqual(response.status_code, 201)
+            self.assertFalse(Job.objects.exists())
+        for callback in callbacks:
+            callback()
+        job = Job.objects.get()
+        order_id = Order.objects.get().pk
+        self.assertEqual((job.handler, job.payload, job.status), (order_events.ORDER_CREATED, {'order_id': order_id}, Job.QUEUED))
+
+    @override_settings(ORDER_EMAILS=True, LOW_STOCK_THRESHOLD=2)
+    def test_worker_runs_order_side_effects(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.checkout()
+        order_id = Order.objects.get().pk
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/order/{order_id}/status/', {'status': 'cancelled'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+
+        with self.assertLogs('core.order_events', 'WARNING') as logs:
+            call_command('runworker', '--once', '--concurrency', '0', stdout=io.StringIO())
+        self.assertIn('sắp hết hàng: còn 2', logs.output[0])
+        self.assertEqual([message.subject for message in mail.outbox], [
+            f'Xác nhận đơn hàng #{order_id}', f'Đơn hàng #{order_id}: cancelled',
+        ])
+        self.assertEqual(set(Job.objects.values_list('status', flat=True)), {Job.DONE})
+
+    def test_update_status_validation_and_unchanged_status(self):
+        order = Order.objects.create(user=self.user, **ORDER_ADDRESS)
+        url = f'/api/order/{order.pk}/status/'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.patch(url, {'status': 'lost'}, format='json').status_code, 400)
+            self.assertEqual(self.client.patch(url, {'status': 'pending'}, format='json').status_code, 200)
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOB_RETRY_BACKOFF=5)
+    def test_retry_with_backoff_then_fail(self):
+        job = jobs.enqueue('core.tests.failing_job', max_attempts=2)
+        worker = jobs.Worker(concurrency=0)
+        with self.assertLogs('core.jobs', 'WARNING'):
+            self.assertEqual(worker.run(once=True), (1, 1))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn('ValueError: boom', job.last_error)
+        self.assertAlmostEqual((job.run_at - timezone.now()).total_seconds(), 5, delta=1)
+        # Chưa tới hạn thử lại
+        self.assertEqual(jobs.Worker(concurrency=0).run(once=True), (0, 0))
+
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs('core.jobs', 'ERROR'):
+            jobs.Worker(concurrency=0).run(once=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertEqual(jobs.backoff(3), 20)
+
+    def test_stale_running_jobs_requeued(self):
+        stale = jobs.enqueue('core.tests.record_job', {'key': 'stale'})
+        exhausted = jobs.enqueue('core.tests.record_job', {'key': 'exhausted'}, max_attempts=1)
+        jobs.claim(10)
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        with self.assertLogs('core.jobs', 'WARNING'):
+            self.assertEqual(jobs.Worker(concurrency=0).run(once=True), (1, 0))
+        self.assertEqual(executed_jobs, ['stale'])
+        self.assertEqual(Job.objects.get(pk=exhausted.pk).status, Job.FAILED)
+        self.assertEqual(Job.objects.get(pk=stale.pk).attempts, 2)
+
+    @override_settings(JOB_QUEUE_ASYNC=False)
+    def test_in_process_queue(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.enqueue_on_commit('core.tests.record_job', {'key': 'now'})
+            self.assertEqual(executed_jobs, [])
+        self.assertEqual(executed_jobs, ['now'])
+        self.assertFalse(Job.objects.exists())
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Cần PostgreSQL để kiểm tra SKIP LOCKED.')
+class ConcurrentWorkerTestCase(TransactionTestCase):
+
+    def test_each_job_runs_once(self):
+        executed_jobs.clear()
+        for i in range(40):
+            jobs.enqueue('core.tests.record_job', {'key': i})
+        workers = [jobs.Worker(concurrency=4) for _ in range(3)]
+        threads = [threading.Thread(target=worker.run, kwargs={'once': True}) for worker in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(executed_jobs), list(range(40)))
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 40)
+
+
+class OutboxTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.admin = APIClient()
+        self.admin.force_authenticate(User.objects.create_user(username='admin', is_staff=True))
+        category = Category.objects.create(name='Laptop', slug='laptop')
+        self.product = Product.objects.create(
+            category=category, name='Laptop A', slug='laptop-a',
+            description='...', price=Decimal('10.00'), stock=3,
+        )
+
+    def checkout(self, quantity=1):
+        return self.client.post(
+            '/api/order/create/', {**ORDER_ADDRESS, 'items': [{'product_id': self.product.id, 'quantity': quantity}]},
+            format='json',
+        )
+
+    def events(self):
+        return list(OutboxEvent.objects.order_by('id').values_list('event_type', 'object_id'))
+
+    def test_changes_recorded_in_same_transaction(self):
+        self.assertEqual(self.checkout(5).status_code, 400)
+        self.assertEqual(self.events(), [])
+
+        self.assertEqual(self.checkout(2).status_code, 201)
+        order = Order.objects.get()
+        self.client.patch(f'/api/order/{order.pk}/status/', {'status': 'cancelled'}, format='json')
+        self.assertEqual(self.events(), [
+            ('order.created', order.pk), ('product.stock_changed', self.product.pk), ('order.status_changed', order.pk),
+        ])
+        created, stock, status_changed = OutboxEvent.objects.order_by('id')
+        self.assertEqual(created.payload['items'], [{'product_id': self.product.pk, 'quantity': 2, 'price': '10.00'}])
+        self.assertEqual(stock.payload, {'slug': 'laptop-a', 'stock': 1})
+        self.assertEqual(status_changed.payload['new_status'], 'cancelled')
+
+    def test_cart_and_admin_changes(self):
+        cart = Cart.objects.create(user=self.user)
+        response = self.client.post(f'/api/carts/{cart.pk}/add_item/', {'product_id': self.product.pk}, format='json')
+        item_id = response.data['items'][0]['id']
+        self.client.delete(f'/api/carts/{cart.pk}/remove_item/', {'item_id': item_id}, format='json')
+        self.admin.patch('/api/products/laptop-a/', {'price': '12.00'}, format='json')
+        self.admin.delete('/api/products/laptop-a/')
+        self.assertEqual([event_type for event_type, _ in self.events()], [
+            'stock.reserved', 'stock.released', 'product.changed', 'product.deleted',
+        ])
+
+    def test_feed_reads_incrementally(self):
+        for _ in range(3):
+            self.checkout()
+        self.assertEqual(self.client.get('/api/events/').status_code, 403)
+
+        response = self.admin.get('/api/events/?limit=4')
+        self.assertEqual(response.status_code, 200)
+        ids = [event['id'] for event in response.data['results']]
+        self.assertEqual(len(ids), 4)
+        self.assertTrue(response.data['has_more'])
+        self.assertEqual(response.data['after'], outbox.format_position(outbox.position(response.data['results'][-1])))
+
+        response = self.admin.get(f"/api/events/?after={response.data['after']}&limit=4")
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertFalse(response.data['has_more'])
+        self.assertGreater(response.data['results'][0]['id'], ids[-1])
+        # Cursor cũ (id của sự kiện) vẫn đọc tiếp đúng chỗ
+        self.assertEqual(self.admin.get(f'/api/events/?after={ids[-1]}').data['results'], response.data['results'])
+        self.assertEqual(self.admin.get(f"/api/events/?after={response.data['after']}").data['results'], [])
+
+        response = self.admin.get('/api/events/?type=order.created')
+        self.assertEqual([event['event_type'] for event in response.data['results']], ['order.created'] * 3)
+        for after in ('x', '1-x', '1-2-3'):
+            self.assertEqual(self.admin.get(f'/api/events/?after={after}').status_code, 400)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Cần PostgreSQL để kiểm tra transaction commit xen kẽ.')
+class ConcurrentOutboxTestCase(TransactionTestCase):
+    """
+    Transaction ghi sự kiện trước nhưng commit sau: feed không được đọc vượt qua sự kiện của nó.
+    """
+
+    def test_feed_waits_for_transactions_in_progress(self):
+        recorded, release = threading.Event(), threading.Event()
+
+        def slow_writer():
+            try:
+                with transaction.atomic():
+                    outbox.record(outbox.event(outbox.PRODUCT_CHANGED, 1, {}))
+                    recorded.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        writer = threading.Thread(target=slow_writer)
+        writer.start()
+        try:
+            self.assertTrue(recorded.wait(10))
+            outbox.record(outbox.event(outbox.PRODUCT_CHANGED, 2, {}))
+            self.assertEqual(outbox.read()[0], [])
+        finally:
+            release.set()
+            writer.join()
+        events, _ = outbox.read()
+        self.assertEqual([event['object_id'] for event in events], [1, 2])
+        self.assertEqual(outbox.read(outbox.position(events[-1]))[0], [])
+
+
+class SalesAnalyticsTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.admin = APIClient()
+        self.admin.force_authenticate(User.objects.create_user(username='admin', is_staff=True))
+        self.laptops = Category.objects.create(name='Laptop', slug='laptop')
+        self.phones = Category.objects.create(name='Điện thoại', slug='dien-thoai')
+        self.laptop = Product.objects.create(
+            category=self.laptops, name='Laptop A', slug='laptop-a', description='...', price=Decimal('100.00'), stock=50,
+        )
+        self.phone = Product.objects.create(
+            category=self.phones, name='Phone B', slug='phone-b', description='...', price=Decimal('30.00'), stock=50,
+        )
+
+    def checkout(self, *items):
+        response = self.client.post('/api/order/create/', {
+            **ORDER_ADDRESS, 'items': [{'product_id': product.pk, 'quantity': quantity} for product, quantity in items],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Order.objects.latest('id')
+
+    def set_status(self, order, new_status):
+        self.client.patch(f'/api/order/{order.pk}/status/', {'status': new_status}, format='json')
+
+    def snapshot(self):
+        return (
+            list(DailySales.objects.order_by('date').values_list('date', 'orders', 'units', 'revenue')),
+            sorted(DailyCategorySales.objects.values_list('date', 'category_id', 'units', 'revenue')),
+            sorted(DailyProductSales.objects.values_list('date', 'product_id', 'units', 'revenue')),
+            sorted(ProductSales.objects.values_list('product_id', 'units', 'revenue')),
+        )
+
+    def test_incremental_create_and_cancel(self):
+        self.checkout((self.laptop, 2), (self.phone, 1))
+        cancelled = self.checkout((self.phone, 3))
+        self.set_status(cancelled, 'cancelled')
+        self.assertEqual(analytics.sync(), 3)
+        self.assertEqual(analytics.sync(), 0)
+
+        response = self.admin.get('/api/analytics/summary/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['orders'], response.data['units'], response.data['revenue']), (1, 3, '230.00'))
+
+        today = timezone.localdate()
+        response = self.admin.get('/api/analytics/revenue/')
+        self.assertEqual(response.data['results'], [{'date': today, 'orders': 1, 'units': 3, 'revenue': '230.00'}])
+        response = self.admin.get('/api/analytics/revenue/?group=category')
+        self.assertEqual([(row['category_name'], row['revenue']) for row in response.data['results']], [
+            ('Laptop', '200.00'), ('Điện thoại', '30.00'),
+        ])
+
+        # Khôi phục đơn hàng đã hủy: cộng lại
+        self.set_status(cancelled, 'pending')
+        self.set_status(cancelled, 'shipped')
+        analytics.sync()
+        response = self.admin.get('/api/analytics/top-products/?by=units')
+        self.assertEqual([(row['slug'], row['units'], row['revenue']) for row in response.data['results']], [
+            ('phone-b', 4, '120.00'), ('laptop-a', 2, '200.00'),
+        ])
+        response = self.admin.get('/api/analytics/top-products/?by=revenue&limit=1')
+        self.assertEqual([row['slug'] for row in response.data['results']], ['laptop-a'])
+
+    def test_rebuild_matches_incremental(self):
+        for _ in range(3):
+            self.checkout((self.laptop, 1), (self.phone, 2))
+        self.set_status(Order.objects.earliest('id'), 'cancelled')
+        # Lịch sử không có sự kiện trong outbox (VD dữ liệu trước khi có bảng tổng hợp)
+        old = self.checkout((self.laptop, 4))
+        OutboxEvent.objects.filter(object_id=old.pk, event_type='order.created').delete()
+        Order.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=40))
+        analytics.sync()
+        incremental = self.snapshot()
+
+        self.assertEqual(analytics.rebuild(workers=0, chunk_days=7), 3)
+        rebuilt = self.snapshot()
+        self.assertEqual(len(rebuilt[0]), 2)
+        self.assertEqual(rebuilt[0][1], incremental[0][0])
+        self.assertEqual(rebuilt[0][0][1:], (1, 4, Decimal('400.00')))
+        # Con trỏ đã qua các sự kiện được tính trong rebuild
+        self.assertEqual(analytics.sync(), 0)
+        self.assertEqual(self.snapshot(), rebuilt)
+
+        call_command('rebuild_sales_rollups', workers=0, stdout=io.StringIO())
+        self.assertEqual(self.snapshot(), rebuilt)
+        response = self.admin.get('/api/analytics/top-products/')
+        self.assertEqual([(row['slug'], row['units']) for row in response.data['results']], [
+            ('laptop-a', 6), ('phone-b', 4),
+        ])
+
+    def test_queries_do_not_depend_on_order_count(self):
+        for _ in range(5):
+            self.checkout((self.laptop, 1), (self.phone, 1))
+        analytics.sync()
+        week_ago = timezone.localdate() - timedelta(days=7)
+        for url in ('/api/analytics/summary/', '/api/analytics/revenue/', '/api/analytics/revenue/?group=category',
+                    '/api/analytics/top-products/', f'/api/analytics/top-products/?from={week_ago}'):
+            with self.assertNumQueries(1):
+                self.assertEqual(self.admin.get(url).status_code, 200)
+
+    def test_permissions_and_validation(self):
+        self.assertEqual(self.client.get('/api/analytics/summary/').status_code, 403)
+        for url in ('/api/analytics/revenue/?from=2024-13-01', '/api/analytics/revenue/?from=2024-02-01&to=2024-01-01',
+                    '/api/analytics/revenue/?group=week', '/api/analytics/top-products/?by=name',
+                    '/api/analytics/summary/?from=2000-01-01&to=2024-01-01'):
+            self.assertEqual(self.admin.get(url).status_code, 400, url)
+
+    def test_worker_runs_periodic_sync(self):
+        self.checkout((self.laptop, 1))
+        with override_settings(PERIODIC_TASKS={'core.analytics.sync': 60}):
+            jobs.Worker(concurrency=0).run(once=True)
+        self.assertEqual(DailySales.objects.get().orders, 1)
+
+    def test_sync_skips_transactions_counted_by_rebuild(self):
+        self.checkout((self.laptop, 1))
+        event = OutboxEvent.objects.get(event_type='order.created')
+        # Như rebuild trên PostgreSQL: transaction của đơn hàng đã được tính từ Order
+        SalesCursor.objects.create(pk=1, counted_transactions=[event.transaction_id])
+        self.assertEqual(analytics.sync(), 1)
+        self.assertFalse(DailySales.objects.exists())
+        cursor = SalesCursor.objects.get()
+        self.assertEqual((cursor.last_transaction_id, cursor.last_event_id), outbox.event_position(event.pk))
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Cần PostgreSQL để kiểm tra snapshot của rebuild.')
+@override_settings(THROTTLE_BUCKETS={})
+class ConcurrentSalesRebuildTestCase(TransactionTestCase):
+    """
+    Đơn hàng commit trong lúc rebuild: được sync() cộng sau đúng một lần.
+    """
+
+    def test_orders_committed_during_rebuild(self):
+        user = User.objects.create_user(username='buyer')
+        product = Product.objects.create(name='Laptop A', slug='laptop-a', description='...', price=Decimal('100.00'), stock=50)
+
+        def checkout():
+            try:
+                client = APIClient()
+                client.force_authenticate(user)
+                response = client.post('/api/order/create/', {
+                    **ORDER_ADDRESS, 'items': [{'product_id': product.pk, 'quantity': 1}],
+                }, format='json')
+                self.assertEqual(response.status_code, 201)
+            finally:
+                connection.close()
+
+        checkout()
+
+        def progress(done, total):
+            # Đơn hàng commit sau khi rebuild đã lấy snapshot
+            thread = threading.Thread(target=checkout)
+            thread.start()
+            thread.join()
+
+        self.assertEqual(analytics.rebuild(workers=0, progress=progress), 1)
+        self.assertEqual(DailySales.objects.get().orders, 1)
+        self.assertEqual(analytics.sync(), 1)
+        self.assertEqual(DailySales.objects.get().orders, 2)
+        self.assertEqual(ProductSales.objects.get().units, 2)
+
+
+class RecommendationTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Laptop', slug='laptop')
+        self.products = {
+            slug: Product.objects.create(
+                category=category, name=slug.upper(), slug=slug, description='...', price=Decimal('10.00'), stock=10,
+                is_available=slug != 'e',
+            )
+            for slug in 'abcde'
+        }
+        self.users = [User.objects.create_user(username=f'user{i}') for i in range(5)]
+
+    def buy(self, user, slugs, status='delivered'):
+        order = Order.objects.create(user=user, status=status, **ORDER_ADDRESS)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=self.products[slug], price=Decimal('10.00')) for slug in slugs
+        ])
+
+    def seed(self):
+        u1, u2, u3, u4, u5 = self.users
+        self.buy(u1, 'abe')
+        self.buy(u1, 'a')  # Mua lại không làm tăng trọng số
+        self.buy(u2, 'ab')
+        self.buy(u3, 'ac')
+        self.buy(u5, 'cd', status='cancelled')
+        for slug in 'ad':
+            Favorite.objects.create(user=u4, product=self.products[slug])
+
+    def related(self):
+        return {
+            product.slug: list(
+                RelatedProduct.objects.filter(product=product).order_by('rank').values_list('related__slug', 'score')
+            )
+            for product in self.products.values()
+        }
+
+    def test_cosine_neighbours(self):
+        self.seed()
+        self.assertEqual(recommendations.build(top_k_count=2), 5)
+        related = self.related()
+        # a: mua bởi 3 người và được yêu thích (0.5); b mua cùng bởi 2 người, c bởi 1, d chỉ cùng yêu thích
+        self.assertEqual([slug for slug, _ in related['a']], ['b', 'c'])
+        self.assertAlmostEqual(related['a'][0][1], 2 / (3.25 ** 0.5 * 2 ** 0.5))
+        self.assertEqual([slug for slug, _ in related['d']], ['a'])
+        # Đơn hàng đã hủy không được tính, sản phẩm ngừng bán không được gợi ý
+        self.assertEqual([slug for slug, _ in related['c']], ['a'])
+        self.assertNotIn('e', {slug for rows in related.values() for slug, _ in rows})
+
+        # Chia khối nhỏ cho cùng kết quả
+        recommendations.build(top_k_count=2, block_size=2, chunk_size=3)
+        self.assertEqual(self.related(), related)
+
+    def test_rebuild_removes_stale_neighbours(self):
+        self.seed()
+        recommendations.build()
+        Favorite.objects.all().delete()
+        call_command('build_recommendations', stdout=io.StringIO())
+        self.assertEqual(self.related()['d'], [])
+        Order.objects.all().delete()
+        self.assertEqual(recommendations.build(), 0)
+        self.assertFalse(RelatedProduct.objects.exists())
+
+    def test_related_endpoint(self):
+        self.seed()
+        recommendations.build(top_k_count=3)
+        client = APIClient()
+        with self.assertNumQueries(1):
+            response = client.get('/api/products/a/related/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['product']['slug'] for row in response.json()], ['b', 'c', 'd'])
+        scores = [row['score'] for row in response.json()]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertEqual(response.json()[0]['product']['name'], 'B')
+
+        # Sản phẩm ngừng bán sau khi tính bị bỏ khỏi kết quả
+        Product.objects.filter(slug='b').update(is_available=False)
+        self.assertEqual([row['product']['slug'] for row in client.get('/api/products/a/related/').json()], ['c', 'd'])
+        self.assertEqual(client.get('/api/products/e/related/').status_code, 404)
+        self.assertEqual(client.get('/api/products/missing/related/').status_code, 404)
+        Product.objects.create(name='F', slug='f', description='...', price=Decimal('1.00'), stock=1)
+        self.assertEqual(client.get('/api/products/f/related/').json(), [])
+
+    def test_related_scores_render_like_json_renderer(self):
+        now = timezone.now()
+        for rank, (slug, score) in enumerate([('b', 0.8164965809277261), ('c', 1.2e-05), ('d', 1e-07)], 1):
+            RelatedProduct.objects.create(
+                product=self.products['a'], related=self.products[slug], rank=rank, score=score, computed_at=now,
+            )
+        client = APIClient()
+        response = client.get('/api/products/a/related/')
+        self.assertEqual([row['score'] for row in response.json()], [0.8165, 0.0, 0.0])
+        with mock.patch.object(ProductViewSet, 'renderer_classes', [JSONRenderer]):
+            self.assertEqual(response.content, client.get('/api/products/a/related/').content)
+
+
+@override_settings(THROTTLE_BUCKETS={})
+class IdempotencyTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Laptop', slug='laptop')
+        self.product = Product.objects.create(
+            category=category, name='Laptop A', slug='laptop-a', description='...', price=Decimal('10.00'), stock=5,
+        )
+
+    def checkout(self, key, quantity=1):
+        return self.client.post(
+            '/api/order/create/', {**ORDER_ADDRESS, 'items': [{'product_id': self.product.pk, 'quantity': quantity}]},
+            format='json', HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_returns_original_response(self):
+        first = self.checkout('order-1')
+        self.assertEqual(first.status_code, 201)
+        retry = self.checkout('order-1')
+        self.assertEqual((retry.status_code, retry.json()), (201, first.json()))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.product.refresh_from_db()
+        self.assertEqual((Order.objects.count(), self.product.stock), (1, 4))
+
+        # Key khác là một đơn hàng mới; cùng key nhưng body khác bị từ chối
+        self.assertEqual(self.checkout('order-2').status_code, 201)
+        self.assertEqual(self.checkout('order-1', quantity=2).status_code, 422)
+        self.assertEqual(self.checkout('x' * 256).status_code, 400)
+        self.assertEqual(Order.objects.count(), 2)
+        # Không có header: như trước
+        self.client.post(
+            '/api/order/create/', {**ORDER_ADDRESS, 'items': [{'product_id': self.product.pk, 'quantity': 1}]},
+            format='json',
+        )
+        self.assertEqual(Order.objects.count(), 3)
+
+    def test_keys_are_per_user(self):
+        self.assertEqual(self.checkout('same-key').status_code, 201)
+        self.client.force_authenticate(User.objects.create_user(username='other'))
+        self.assertEqual(self.checkout('same-key').status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_duplicate_while_first_in_progress(self):
+        duplicates = []
+        original = CreateOrderSerializer.create
+
+        def create_and_retry(serializer, validated_data):
+            order = original(serializer, validated_data)
+            # Client gửi lại trong lúc request đầu chưa trả về
+            duplicates.append(self.checkout('order-1'))
+            return order
+
+        with mock.patch.object(CreateOrderSerializer, 'create', autospec=True, side_effect=create_and_retry):
+            first = self.checkout('order-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(duplicates[0].status_code, 409)
+        self.assertEqual(duplicates[0]['Retry-After'], '1')
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.checkout('order-1').json(), first.json())
+
+    def test_errors_release_key(self):
+        self.assertEqual(self.checkout('order-1', quantity=10).status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        Product.objects.filter(pk=self.product.pk).update(stock=20)
+        self.assertEqual(self.checkout('order-1', quantity=10).status_code, 201)
+
+        # View lỗi giữa chừng: các thay đổi bị rollback cùng key
+        with mock.patch.object(jobs, 'enqueue_on_commit', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.checkout('order-2')
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertFalse(IdempotencyKey.objects.filter(key='order-2').exists())
+
+    def test_abandoned_and_expired_keys(self):
+        self.assertEqual(self.checkout('order-1').status_code, 201)
+        record = IdempotencyKey.objects.get()
+        # Request đầu bị dừng khi chưa xong (không có response) quá IDEMPOTENCY_LOCK_TIMEOUT
+        IdempotencyKey.objects.filter(pk=record.pk).update(
+            response_status=None, response_body=None, locked_at=timezone.now() - timedelta(minutes=5),
+        )
+        self.assertEqual(self.checkout('order-1').status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(self.checkout('order-1').status_code, 201)
+        self.assertEqual(Order.objects.count(), 3)
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        with override_settings(PERIODIC_TASKS={}):
+            jobs.Worker(concurrency=0).run(once=True)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_cart_actions(self):
+        cart = Cart.objects.create(user=self.user)
+        for _ in range(2):
+            response = self.client.post(
+                f'/api/carts/{cart.pk}/add_item/', {'product_id': self.product.pk, 'quantity': 2},
+                format='json', HTTP_IDEMPOTENCY_KEY='add-1',
+            )
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+        item_id = response.data['items'][0]['id']
+
+        for _ in range(2):
+            response = self.client.delete(
+                f'/api/carts/{cart.pk}/remove_item/', {'item_id': item_id}, format='json', HTTP_IDEMPOTENCY_KEY='remove-1',
+            )
+            self.assertEqual(response.status_code, 200)
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(OutboxEvent.objects.filter(event_type='stock.released').count(), 1)
+
+    def test_error_responses_are_not_replayed(self):
+        cart = Cart.objects.create(user=self.user)
+        item = CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        url = f'/api/carts/{cart.pk}/update_item/'
+        response = self.client.post(url, {'item_id': item.pk, 'quantity': 8}, format='json', HTTP_IDEMPOTENCY_KEY='update-1')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        # Hết lỗi (nhập thêm hàng) thì gửi lại cùng key được chạy lại
+        Product.objects.filter(pk=self.product.pk).update(stock=10)
+        response = self.client.post(url, {'item_id': item.pk, 'quantity': 8}, format='json', HTTP_IDEMPOTENCY_KEY='update-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(CartItem.objects.get().quantity, 8)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Cần PostgreSQL để chạy request song song.')
+@override_settings(PRODUCT_CONCURRENCY_WAIT=10)
+class ConcurrentIdempotencyTestCase(TransactionTestCase):
+    """
+    Nhiều thread cùng gửi một request đặt hàng với cùng Idempotency-Key: chỉ một đơn hàng được tạo.
+    """
+    threads = 12
+
+    def test_single_order(self):
+        cache.clear()
+        category = Category.objects.create(name='Flash sale', slug='flash-sale')
+        product = Product.objects.create(
+            category=category, name='Hot item', slug='hot-item', description='...', price=Decimal('1.00'), stock=100,
+        )
+        user = User.objects.create_user(username='buyer')
+        barrier = threading.Barrier(self.threads)
+        responses = []
+        lock = threading.Lock()
+
+        def checkout():
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                barrier.wait()
+                response = client.post(
+                    '/api/order/create/', {**ORDER_ADDRESS, 'items': [{'product_id': product.id, 'quantity': 1}]},
+                    format='json', HTTP_IDEMPOTENCY_KEY='flash-1',
+                )
+                with lock:
+                    responses.append(response)
+            finally:
+                connection.close()
+
+        with override_settings(THROTTLE_BUCKETS={}):
+            workers = [threading.Thread(target=checkout) for _ in range(self.threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+        statuses = [response.status_code for response in responses]
+        self.assertEqual(set(statuses) - {201, 409}, set())
+        self.assertIn(201, statuses)
+        self.assertEqual(Order.objects.count(), 1)
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 99)
+        bodies = {json.dumps(response.json(), sort_keys=True) for response in responses if response.status_code == 201}
+        self.assertEqual(len(bodies), 1)
@@ -0,0 +1,205 @@
+"""
+Giới hạn tốc độ và kiểm soát tải cho đặt hàng và giỏ hàng.
+
+CreateOrderView và các action ghi của CartViewSet khóa / ghi các hàng Product nên
+là chỗ quá tải đầu tiên khi có flash sale. Có hai lớp bảo vệ:
+
+- Token bucket (UserTokenBucketThrottle, GlobalTokenBucketThrottle): mỗi bucket
+  chứa tối đa `burst` token, được nạp lại đều theo `rate`, mỗi request ghi lấy một
+  token. Cấu hình trong settings.THROTTLE_BUCKETS theo `throttle_scope` của view.
+  Hết token của user -> 429, hết token chung của cả hệ thống -> 503, cả hai kèm
+  header Retry-After.
+- Giới hạn đồng thời theo sản phẩm (product_slots): tối đa PRODUCT_CONCURRENCY_LIMIT
+  request cùng xử lý một sản phẩm; request đến sau xếp hàng tối đa
+  PRODUCT_CONCURRENCY_WAIT giây rồi bị từ chối (503 + Retry-After) thay vì dồn lại
+  chờ khóa hàng trong database.
+
+Trạng thái nằm trong Django cache (THROTTLE_CACHE_ALIAS; cần Redis hoặc cache dùng
+chung khi chạy nhiều worker). Bucket được cập nhật kiểu đọc-sửa-ghi nên khi nhiều
+request tranh cùng một bucket có thể lọt quá vài request: chấp nhận được vì mục đích
+là giữ database không quá tải. Request bị từ chối được đếm trong core/metrics.py.
+"""
+import math
+import random
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+from . import metrics
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+class ServiceBusy(APIException):
+    """
+    503 kèm Retry-After (exception handler của DRF đọc thuộc tính `wait`).
+    """
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Hệ thống đang quá tải, vui lòng thử lại sau.'
+    default_code = 'service_busy'
+
+    def __init__(self, wait, detail=None, code=None):
+        super().__init__(detail, code)
+        self.wait = max(1, math.ceil(wait))
+
+
+def get_cache():
+    return caches[getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')]
+
+
+def parse_rate(rate):
+    """
+    '10/min' -> số token được nạp lại mỗi giây.
+    """
+    count, period = rate.split('/')
+    return int(count) / PERIODS[period[0]]
+
+
+def take(key, rate, burst):
+    """
+    Lấy một token của bucket `key`. Trả về 0 nếu lấy được, ngược lại số giây cần
+    chờ tới khi có token.
+    """
+    cache = get_cache()
+    now = time.time()
+    state = cache.get(key)
+    tokens, updated = state if state is not None else (burst, now)
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens < 1:
+        return (1 - tokens) / rate
+    # Sau burst / rate giây bucket đã đầy trở lại, bản ghi hết hạn cũng như bucket đầy
+    cache.set(key, (tokens - 1, now), timeout=math.ceil(burst / rate) + 1)
+    return 0
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Đọc (rate, burst) ở THROTTLE_BUCKETS[view.throttle_scope][kind], không có cấu
+    hình thì không giới hạn. Request đọc (GET, HEAD, OPTIONS) không bị tính.
+    """
+    kind = None
+
+    def get_ident_key(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        self.delay = 0
+        if request.method in SAFE_METHODS:
+            return True
+        scope = getattr(view, 'throttle_scope', None)
+        config = getattr(settings, 'THROTTLE_BUCKETS', {}).get(scope, {}).get(self.kind)
+        if config is None:
+            return True
+        rate, burst = config
+        self.delay = take(f'throttle:{scope}:{self.get_ident_key(request)}', parse_rate(rate), burst)
+        if not self.delay:
+            return True
+        metrics.registry.reject((('reason', f'throttle_{self.kind}'), ('scope', scope)))
+        return self.reject(request, view)
+
+    def reject(self, request, view):
+        return False
+
+    def wait(self):
+        return math.ceil(self.delay)
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """
+    Bucket riêng cho từng user (theo IP nếu chưa đăng nhập); hết token -> 429.
+    """
+    kind = 'user'
+
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return f'ip:{self.get_ident(request)}'
+
+
+class GlobalTokenBucketThrottle(TokenBucketThrottle):
+    """
+    Một bucket chung cho mọi user của scope; hết token -> 503.
+    """
+    kind = 'global'
+
+    def get_ident_key(self, request):
+        return 'global'
+
+    def reject(self, request, view):
+        raise ServiceBusy(self.delay)
+
+
+def slot_keys(product_id, limit):
+    return [f'admission:product:{product_id}:{slot}' for slot in range(limit)]
+
+
+def acquire(cache, keys, token, lease, deadline):
+    """
+    Giữ một trong các chỗ `keys` (cache.add là nguyên tử), chờ tới `deadline` nếu
+    hết chỗ. Trả về key đã giữ hoặc None.
+    """
+    delay = 0.005
+    while True:
+        taken = cache.get_many(keys)
+        free = [key for key in keys if key not in taken]
+        # Thử theo thứ tự ngẫu nhiên để các request không cùng tranh một chỗ
+        random.shuffle(free)
+        for key in free:
+            if cache.add(key, token, timeout=lease):
+                return key
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 0.05)
+
+
+def release(cache, keys, token):
+    for key in keys:
+        # Chỉ xóa chỗ còn do request này giữ (chỗ quá hạn lease có thể đã thuộc request khác)
+        if cache.get(key) == token:
+            cache.delete(key)
+
+
+@contextmanager
+def product_slots(product_ids, scope):
+    """
+    Giữ một chỗ trong giới hạn đồng thời của từng sản phẩm trong suốt khối lệnh.
+    Hết chỗ thì chờ tối đa PRODUCT_CONCURRENCY_WAIT giây rồi raise ServiceBusy.
+    Khối lệnh nằm trong transaction (VD Idempotency-Key) thì chỗ được giữ tới khi
+    transaction commit, vì khóa hàng Product chỉ được nhả lúc đó; transaction bị
+    rollback thì chỗ được trả khi hết PRODUCT_CONCURRENCY_LEASE giây.
+    """
+    limit = getattr(settings, 'PRODUCT_CONCURRENCY_LIMIT', 8)
+    if not limit:
+        yield
+        return
+    cache = get_cache()
+    lease = getattr(settings, 'PRODUCT_CONCURRENCY_LEASE', 30)
+    started = time.monotonic()
+    deadline = started + getattr(settings, 'PRODUCT_CONCURRENCY_WAIT', 0.5)
+    token = uuid.uuid4().hex
+    held = []
+    try:
+        # Thứ tự cố định để hai đơn hàng có chung sản phẩm không giữ chỗ chéo nhau
+        for product_id in sorted(set(product_ids)):
+            key = acquire(cache, slot_keys(product_id, limit), token, lease, deadline)
+            if key is None:
+                metrics.registry.reject((('reason', 'concurrency'), ('scope', scope)))
+                raise ServiceBusy(getattr(settings, 'PRODUCT_CONCURRENCY_RETRY_AFTER', 1))
+            held.append(key)
+        metrics.registry.observe_admission_wait((('scope', scope),), time.monotonic() - started)
+        yield
+    except BaseException:
+        release(cache, held, token)
+        raise
+    # Ngoài transaction thì chạy ngay
+    transaction.on_commit(lambda: release(cache, held, token))
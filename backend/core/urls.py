@@ -4,10 +4,11 @@ from .views import (CategoryViewSet, ProductViewSet,
                     OrderViewSet, RegisterView,
                     CreateOrderView, CartViewSet, 
                     UserProfileView, ProductReviewViewSet
-                    , FavoriteViewSet) 
+                    , FavoriteViewSet, SalesAnalyticsViewSet) 
 from rest_framework.authtoken.views import obtain_auth_token
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from .views import update_order_status
+from .views import update_order_status, CatalogExportView, CatalogImportView, EventFeedView, prometheus_metrics
+from . import async_views
 router = DefaultRouter()
 
 router.register(r'categories', CategoryViewSet)
@@ -16,6 +17,7 @@ router.register(r'orders', OrderViewSet, basename='order')
 router.register(r'carts', CartViewSet, basename='cart')
 router.register(r'reviews', ProductReviewViewSet, basename='review')
 router.register(r'favorites', FavoriteViewSet, basename='favorites')
+router.register(r'analytics', SalesAnalyticsViewSet, basename='analytics')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -26,5 +28,15 @@ urlpatterns = [
     path('profile/', UserProfileView.as_view(), name='user_profile'),
     path('order/create/', CreateOrderView.as_view(), name='create_order'), 
     path('order/<int:pk>/status/', update_order_status, name='update_order_status'),
+    path('catalog/export/', CatalogExportView.as_view(), name='catalog_export'),
+    path('catalog/import/', CatalogImportView.as_view(), name='catalog_import'),
+    path('metrics/', prometheus_metrics, name='metrics'),
+    path('events/', EventFeedView.as_view(), name='event_feed'),
+
+    # Bản async (ASGI) của các endpoint đọc catalog, xem core/async_views.py
+    path('async/categories/', async_views.category_list, name='async_category_list'),
+    path('async/products/', async_views.product_list, name='async_product_list'),
+    path('async/products/<slug:slug>/', async_views.product_detail, name='async_product_detail'),
+    path('async/products/<slug:slug>/reviews/', async_views.product_reviews, name='async_product_reviews'),
     
 ]
\ No newline at end of file
@@ -1,22 +1,239 @@
-from rest_framework import viewsets, permissions, generics
-from .models import Category, Product, Order, Cart, CartItem
+import hashlib
+import io
+from datetime import date, timedelta
+
+from rest_framework import viewsets, permissions, generics, serializers
+from .models import Category, Product, Order, Cart, CartItem, RelatedProduct
 from .serializers import (CategorySerializer, ProductSerializer, 
-                          OrderSerializer, RegisterSerializer, 
+                          OrderSerializer, OrderSummarySerializer, RegisterSerializer, 
                           CreateOrderSerializer, CartSerializer,
-                          CartItemSerializer, ProductReviewSerializer,
+                          CompactCartSerializer,
+                          ProductReviewSerializer,
                           FavoriteSerializer, ProductReview, Favorite)
 from rest_framework import filters 
 from django_filters.rest_framework import DjangoFilterBackend
 from django.contrib.auth.models import User
 from rest_framework.decorators import action
-from rest_framework.authtoken.views import obtain_auth_token
-from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.filters import SearchFilter, OrderingFilter
+from django.shortcuts import get_object_or_404
+from django.db import transaction
+from .pagination import StandardResultsSetPagination, ProductKeysetPagination, OrderKeysetPagination, ReviewKeysetPagination
+from . import analytics
+from . import cache as catalog_cache
+from . import inventory
+from . import jobs
+from . import metrics
+from . import order_events
+from . import outbox
+from . import ratings
+from . import throttling
+from .search import ProductSearchFilter
+from . import catalog_io
+from . import facets
+from . import idempotency
+from .filters import ProductFilterSet
+from .fast_serializers import (FavoriteValuesSerializer, OrderSummaryValuesSerializer, ProductValuesSerializer,
+                               RelatedProductValuesSerializer)
+from .renderers import FastJSONRenderer
+from rest_framework.renderers import BrowsableAPIRenderer
+from django.db.models import Count, Max
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date, quote_etag
+from rest_framework.parsers import MultiPartParser
+from rest_framework.views import APIView
+
+
+
+class EagerLoadingQuerysetMixin:
+    """
+    Nạp trước các quan hệ do serializer của action hiện tại khai báo
+    (xem EagerLoadingMixin trong serializers.py).
+    """
+    eager_loading_actions = ('list', 'retrieve')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if self.action in self.eager_loading_actions and hasattr(serializer_class, 'setup_eager_loading'):
+            queryset = serializer_class.setup_eager_loading(queryset)
+        return queryset
+
+
+class AdminPaginationMixin:
+    """
+    Admin dùng phân trang offset (có tổng số bản ghi, nhảy trang tùy ý),
+    người dùng khác dùng pagination_class của view (keyset).
+    """
+    admin_pagination_class = StandardResultsSetPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.request is not None and self.request.user.is_staff:
+                self._paginator = self.admin_pagination_class()
+            elif self.pagination_class is None:
+                self._paginator = None
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+
+class CatalogCacheMixin:
+    """
+    Cache kết quả list/retrieve cho người dùng không phải admin (xem core/cache.py).
+    Key gồm version của các namespace trong cache_dependencies và query params.
+
+    Hỗ trợ GET có điều kiện: ETag / Last-Modified được tính từ max(updated_at) và
+    số bản ghi của queryset đã lọc (không serialize body), trả về 304 nếu client
+    đã có bản mới nhất.
+    """
+    cache_namespace = None
+    cache_dependencies = ()
+    # Các trường thời gian sửa đổi ảnh hưởng tới body (VD: category_name của sản phẩm)
+    last_modified_fields = ('updated_at',)
+    _filtered_queryset = None
 
+    def filter_queryset(self, queryset):
+        """
+        Trong list, aggregate của validator, trang và facet đều lọc get_queryset(): chỉ
+        lọc một lần (tìm kiếm có thể chạy thêm query .exists()) rồi dùng lại queryset
+        (chưa thực thi) cho cả ba.
+        """
+        if self.action != 'list':
+            return super().filter_queryset(queryset)
+        if self._filtered_queryset is None:
+            self._filtered_queryset = super().filter_queryset(queryset)
+        return self._filtered_queryset
+
+    def cache_params(self, request):
+        return [(name, tuple(values)) for name, values in request.query_params.lists()]
+
+    def cached(self, request, version_keys, compute):
+        if request.user.is_staff:
+            return compute()
+        key = catalog_cache.make_key(f'{self.cache_namespace}:{self.action}', version_keys, self.cache_params(request))
+        data, hit = catalog_cache.get_or_set(key, lambda: compute().data)
+        return Response(data, headers={'X-Cache': 'HIT' if hit else 'MISS'})
+
+    def get_validators(self, request, version_keys, aggregate):
+        """
+        Trả về (etag, last_modified dạng timestamp), hoặc (None, None) nếu không có
+        bản ghi. aggregate() trả về (số bản ghi, updated_at lớn nhất) và được cache
+        theo cùng version với body.
+        """
+        params = self.cache_params(request)
+        if request.user.is_staff:
+            count, last_modified = aggregate()
+        else:
+            # Aggregate rẻ nên không cần lock chống stampede và không tính vào thống kê hit/miss
+            key = catalog_cache.make_key(f'{self.cache_namespace}:{self.action}:validators', version_keys, params)
+            validators = catalog_cache.get_cache().get(key)
+            if validators is None:
+                validators = aggregate()
+                catalog_cache.get_cache().set(key, validators, timeout=catalog_cache.get_timeout())
+            count, last_modified = validators
+        if last_modified is None:
+            return None, None
+        # Admin nhận body khác (phân trang offset) nên có ETag riêng
+        signature = [self.cache_namespace, self.action, sorted(params), request.user.is_staff, count, last_modified.isoformat()]
+        etag = quote_etag(hashlib.md5(repr(signature).encode('utf-8')).hexdigest())
+        return etag, int(last_modified.timestamp())
+
+    def conditional(self, request, version_keys, aggregate, compute):
+        etag, last_modified = self.get_validators(request, version_keys, aggregate)
+        if etag is None:
+            return self.cached(request, version_keys, compute)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.cached(request, version_keys, compute)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        version_keys = [catalog_cache.version_key(namespace) for namespace in self.cache_dependencies]
+
+        def aggregate():
+            row = self.filter_queryset(self.get_queryset()).order_by().aggregate(
+                count=Count('pk'),
+                **{f'modified_{i}': Max(field) for i, field in enumerate(self.last_modified_fields)},
+            )
+            modified = [value for name, value in row.items() if name != 'count' and value is not None]
+            return row['count'], max(modified, default=None)
+
+        return self.conditional(
+            request, version_keys, aggregate,
+            lambda: super(CatalogCacheMixin, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        version_keys = [catalog_cache.version_key(self.cache_namespace, kwargs[lookup_url_kwarg])]
+        version_keys += [
+            catalog_cache.version_key(namespace)
+            for namespace in self.cache_dependencies if namespace != self.cache_namespace
+        ]
+        # Với một bản ghi, validator lấy từ chính object nên không tốn thêm query;
+        # object đã nạp được dùng lại khi phải serialize body
+        fetched = []
+
+        def aggregate():
+            instance = self.get_object()
+            fetched.append(instance)
+            modified = [self.get_modified(instance, field) for field in self.last_modified_fields]
+            return 1, max((value for value in modified if value is not None), default=None)
+
+        def compute():
+            if fetched:
+                return Response(self.get_serializer(fetched[0]).data)
+            return super(CatalogCacheMixin, self).retrieve(request, *args, **kwargs)
+
+        return self.conditional(request, version_keys, aggregate, compute)
+
+    def get_modified(self, instance, field):
+        for name in field.split('__'):
+            instance = getattr(instance, name, None)
+            if instance is None:
+                return None
+        return instance
+
+
+class ValuesListMixin:
+    """
+    Action list đọc bằng queryset.values() và serializer trong core/fast_serializers.py
+    (nếu action có trong values_serializer_classes), JSON được render bằng orjson.
+    """
+    values_serializer_classes = {}
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get_values_serializer(self):
+        serializer_class = self.values_serializer_classes.get(self.action)
+        if serializer_class is None:
+            return None
+        return serializer_class(context=self.get_serializer_context())
+
+    def values_queryset(self, serializer, queryset):
+        # Phân trang keyset cần đọc trường sắp xếp (có thể là annotation) của bản ghi cuối trang
+        keyset_fields = [ordering.lstrip('-') for ordering in getattr(self.paginator, 'keyset_orderings', ())]
+        return serializer.values(queryset, extra=[*queryset.query.annotations, *keyset_fields])
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_values_serializer()
+        if serializer is None:
+            return super().list(request, *args, **kwargs)
+        rows = self.values_queryset(serializer, self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize(page))
+        return Response(serializer.serialize(rows))
 
 
 class UserProfileView(generics.RetrieveAPIView):
@@ -26,77 +243,138 @@ class UserProfileView(generics.RetrieveAPIView):
     def get_object(self):
         return self.request.user
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(CatalogCacheMixin, EagerLoadingQuerysetMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint để xem danh sách danh mục sản phẩm.
     """
-    queryset = Category.objects.all()
+    queryset = Category.objects.order_by('name')
     serializer_class = CategorySerializer
     permission_classes = [permissions.AllowAny] # Ai cũng có thể xem
+    cache_namespace = catalog_cache.CATEGORY
+    cache_dependencies = (catalog_cache.CATEGORY,)
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(CatalogCacheMixin, ValuesListMixin, AdminPaginationMixin, EagerLoadingQuerysetMixin, viewsets.ModelViewSet):
     """
     API endpoint cho phép xem và quản lý sản phẩm.
     Hỗ trợ lọc, tìm kiếm và sắp xếp.
     """
-    queryset = Product.objects.filter(is_available=True)
+    queryset = Product.objects.filter(is_available=True).order_by('-created_at', '-id')
     serializer_class = ProductSerializer
-    lookup_field = 'slug'
+    lookup_field = 'slug' # Dùng slug thay cho id trong URL
+    pagination_class = ProductKeysetPagination # Admin dùng phân trang offset
+    cache_namespace = catalog_cache.PRODUCT
+    cache_dependencies = (catalog_cache.PRODUCT, catalog_cache.CATEGORY)
+    last_modified_fields = ('updated_at', 'category__updated_at')
+    values_serializer_classes = {'list': ProductValuesSerializer}
 
     # Thêm các backend cho lọc, tìm kiếm, sắp xếp
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
+    filter_backends = [ProductSearchFilter, filters.OrderingFilter, DjangoFilterBackend]
     
-    # Các trường có thể lọc theo (VD: /api/products/?category=1)
-    filterset_fields = ['category']
+    # Lọc theo danh mục, khoảng giá, còn hàng (VD: /api/products/?category=1&price_min=100000&in_stock=true)
+    filterset_class = ProductFilterSet
     
-    # Các trường có thể tìm kiếm (VD: /api/products/?search=laptop)
+    # Tìm kiếm full-text trên name/description (VD: /api/products/?search=laptop), xem core/search.py
     search_fields = ['name', 'description']
     
     # Các trường có thể sắp xếp (VD: /api/products/?ordering=price hoặc /api/products/?ordering=-price)
-    ordering_fields = ['price', 'created_at']
-
-    # ... hàm get_permissions giữ nguyên
-    def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
-            permission_classes = [permissions.AllowAny]
-        else:
-            permission_classes = [permissions.IsAdminUser]
-        return [permission() for permission in permission_classes]
-
-    """
-    API endpoint cho phép xem và quản lý sản phẩm.
-    """
-    queryset = Product.objects.filter(is_available=True)
-    serializer_class = ProductSerializer
-    lookup_field = 'slug' # Dùng slug thay cho id trong URL
+    ordering_fields = ['price', 'created_at', 'rating_average']
 
     def get_permissions(self):
         """
         Instantiates and returns the list of permissions that this view requires.
         """
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'reviews', 'related']:
             permission_classes = [permissions.AllowAny] # Ai cũng được xem
         else:
             permission_classes = [permissions.IsAdminUser] # Chỉ admin được sửa, xóa, tạo
         return [permission() for permission in permission_classes]
+
+    # Thay đổi của admin được ghi vào outbox trong cùng transaction (core/outbox.py)
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+            outbox.record(outbox.product_changed(serializer.instance))
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+            outbox.record(outbox.product_changed(serializer.instance))
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            outbox.record(outbox.event(outbox.PRODUCT_DELETED, instance.pk, {'slug': instance.slug}))
+            instance.delete()
+
+    def get_paginated_response(self, data):
+        """
+        ?facets=1: thêm số sản phẩm theo danh mục và khoảng giá (core/facets.py).
+        Chạy bên trong CatalogCacheMixin nên facet được cache cùng body.
+        """
+        response = super().get_paginated_response(data)
+        if self.action == 'list' and self.request.query_params.get('facets') in ('1', 'true'):
+            response.data['facets'] = facets.get_facets(
+                self.cache_params(self.request), lambda: self.filter_queryset(self.get_queryset()),
+            )
+        return response
+
+    @action(detail=True, methods=['get'], pagination_class=ReviewKeysetPagination)
+    def reviews(self, request, slug=None):
+        """
+        Đánh giá của sản phẩm, mới nhất trước (VD: /api/products/<slug>/reviews/).
+        """
+        product = get_object_or_404(Product.objects.filter(is_available=True).only('id'), slug=slug)
+        queryset = ProductReviewSerializer.setup_eager_loading(product.reviews.order_by('-created_at', '-id'))
+        page = self.paginate_queryset(queryset)
+        serializer = ProductReviewSerializer(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def related(self, request, slug=None):
+        """
+        Sản phẩm hay được mua / yêu thích cùng, điểm giảm dần (VD: /api/products/<slug>/related/).
+        Đọc danh sách đã tính sẵn (core/recommendations.py) bằng một query theo index (product, rank).
+        """
+        serializer = RelatedProductValuesSerializer(context=self.get_serializer_context())
+        queryset = RelatedProduct.objects.filter(
+            product__slug=slug, product__is_available=True, related__is_available=True,
+        ).order_by('rank')
+        results = serializer.serialize(serializer.values(queryset))
+        if not results:
+            get_object_or_404(Product.objects.filter(is_available=True).only('id'), slug=slug)
+        return Response(results)
     
     
 
 # ViewSet cho Order (Chỉ người dùng đã đăng nhập và là chủ đơn hàng mới được xem)
-class OrderViewSet(viewsets.ReadOnlyModelViewSet):
+class OrderViewSet(ValuesListMixin, EagerLoadingQuerysetMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint cho phép người dùng xem lại các đơn hàng của họ.
+    Danh sách chỉ trả về bản tóm tắt (OrderSummarySerializer), lọc theo
+    ?status= / ?status__in= và khoảng thời gian ?created_at__gte= / ?created_at__lt=;
+    chi tiết đầy đủ (kèm các dòng sản phẩm) ở retrieve.
     """
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
+    values_serializer_classes = {'list': OrderSummaryValuesSerializer}
     permission_classes = [IsAuthenticated]  # ✅ đúng chỗ
-    filter_backends = [OrderingFilter, SearchFilter]  # nếu muốn lọc
+    pagination_class = OrderKeysetPagination
+    filter_backends = [DjangoFilterBackend]
+    # Dùng index (user, status, -created_at) và (user, -created_at)
+    filterset_fields = {
+        'status': ['exact', 'in'],
+        'created_at': ['gte', 'lt'],
+    }
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return OrderSummarySerializer
+        return super().get_serializer_class()
 
     def get_queryset(self):
         """
         Chỉ trả về các đơn hàng của user đang đăng nhập.
         """
-        return Order.objects.filter(user=self.request.user)
+        return super().get_queryset().filter(user=self.request.user)
     
     
 class RegisterView(generics.CreateAPIView):
@@ -114,134 +392,330 @@ class CreateOrderView(generics.CreateAPIView):
     """
     serializer_class = CreateOrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [throttling.UserTokenBucketThrottle, throttling.GlobalTokenBucketThrottle]
+    throttle_scope = 'checkout'
+
+    # Client gửi lại request (timeout) với cùng Idempotency-Key không tạo thêm đơn hàng
+    @idempotency.idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
-        # Tự động gán user đang đăng nhập cho đơn hàng
-        serializer.save(user=self.request.user)
+        product_ids = [item['product_id'] for item in serializer.validated_data['items']]
+        with throttling.product_slots(product_ids, self.throttle_scope):
+            # Tự động gán user đang đăng nhập cho đơn hàng
+            serializer.save(user=self.request.user)
+        # Email, cảnh báo tồn kho... chạy trong worker (core/jobs.py), không cộng vào thời gian đặt hàng
+        jobs.enqueue_on_commit(order_events.ORDER_CREATED, {'order_id': serializer.instance.pk})
 
 
 
-class CartViewSet(viewsets.ModelViewSet):
+class CartViewSet(EagerLoadingQuerysetMixin, viewsets.ModelViewSet):
+    queryset = Cart.objects.order_by('-created_at')
+    serializer_class = CartSerializer
     permission_classes = [IsAuthenticated]              
     filter_backends = [SearchFilter, OrderingFilter]
+    throttle_classes = [throttling.UserTokenBucketThrottle, throttling.GlobalTokenBucketThrottle]
+    throttle_scope = 'cart'
 
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user)
+        return super().get_queryset().filter(user=self.request.user)
 
+    def get_serializer_class(self):
+        # ?compact=1: sản phẩm trong giỏ chỉ gồm id, name, price, image
+        if self.request is not None and self.request.query_params.get('compact') in ('1', 'true'):
+            return CompactCartSerializer
+        return CartSerializer
+
+    def cart_response(self, cart):
+        """
+        Đọc lại giỏ hàng kèm các quan hệ đã nạp trước rồi trả về cho client.
+        """
+        serializer_class = self.get_serializer_class()
+        cart = serializer_class.setup_eager_loading(Cart.objects.filter(pk=cart.pk)).get()
+        serializer = serializer_class(cart)
+        return Response(serializer.data)
+
+    # Các action ghi nhận header Idempotency-Key (core/idempotency.py)
+    @idempotency.idempotent
     def create(self, request, *args, **kwargs):
         cart, created = Cart.objects.get_or_create(user=request.user)
-        serializer = self.get_serializer(cart)
-        return Response(serializer.data)
+        return self.cart_response(cart)
+
+    def get_quantity(self, request):
+        try:
+            quantity = int(request.data.get('quantity', 1))
+        except (TypeError, ValueError):
+            quantity = 0
+        if quantity < 1:
+            raise serializers.ValidationError("Số lượng không hợp lệ.")
+        return quantity
+
+    def get_product(self, request):
+        try:
+            product_id = int(request.data.get('product_id'))
+        except (TypeError, ValueError):
+            raise serializers.ValidationError("Mã sản phẩm không hợp lệ.")
+        return get_object_or_404(Product, id=product_id)
 
     @action(detail=True, methods=['post'])
+    @idempotency.idempotent
     def add_item(self, request, pk=None):
         cart = self.get_object()
-        product_id = request.data.get('product_id')
-        quantity = request.data.get('quantity', 1)
-        product = Product.objects.get(id=product_id)
+        product = self.get_product(request)
+        quantity = self.get_quantity(request)
 
-        if product.stock < quantity:
-            raise serializers.ValidationError("Số lượng tồn kho không đủ.")
-
-        cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-        if not created:
-            cart_item.quantity += quantity
-        else:
-            cart_item.quantity = quantity
-        cart_item.save()
-        product.stock -= quantity
-        product.save()
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        # Chỉ giữ hàng (StockReservation), không trừ Product.stock cho tới khi đặt hàng
+        with throttling.product_slots([product.id], self.throttle_scope):
+            current = CartItem.objects.filter(cart=cart, product=product).values_list('quantity', flat=True).first()
+            inventory.reserve(cart, product, quantity + (current or 0))
+        return self.cart_response(cart)
 
-    # @action(detail=True, methods=['post'])
-    # def update_item(self, request, pk=None):
-    #     cart = self.get_object()
-    #     item_id = request.data.get('item_id')
-    #     quantity = request.data.get('quantity')
-    #     cart_item = CartItem.objects.get(id=item_id, cart=cart)
-    #     product = Product.objects.get(id=product_id)
-    #     if product.stock < quantity:
-    #         raise serializers.ValidationError("Số lượng tồn kho không đủ.")
-    #     cart_item.quantity = quantity
-    #     cart_item.save()
-    #     product.stock += cart_item.quantity - quantity  # Cập nhật lại stock
-    #     product.save()
-    #     serializer = CartSerializer(cart)
-    #     return Response(serializer.data)
-    
-    
     @action(detail=True, methods=['post'])
+    @idempotency.idempotent
     def update_item(self, request, pk=None):
         cart = self.get_object()
         item_id = request.data.get('item_id')
-        quantity = int(request.data.get('quantity', 1))
+        quantity = self.get_quantity(request)
 
         try:
-            cart_item = CartItem.objects.get(id=item_id, cart=cart)
-        except CartItem.DoesNotExist:
+            cart_item = CartItem.objects.select_related('product').get(id=item_id, cart=cart)
+        except (CartItem.DoesNotExist, ValueError):
             return Response({"error": "Không tìm thấy sản phẩm trong giỏ hàng."}, status=404)
 
-        product = cart_item.product
-
-        if product.stock + cart_item.quantity < quantity:
+        try:
+            with throttling.product_slots([cart_item.product_id], self.throttle_scope):
+                inventory.reserve(cart, cart_item.product, quantity)
+        except serializers.ValidationError:
             return Response({"error": "Số lượng tồn kho không đủ."}, status=400)
-
-        # Trả lại hàng cũ trước khi cập nhật (tránh mất stock)
-        product.stock += cart_item.quantity
-        product.stock -= quantity
-        product.save()
-
-        cart_item.quantity = quantity
-        cart_item.save()
-
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        return self.cart_response(cart)
 
 
     @action(detail=True, methods=['delete'])
+    @idempotency.idempotent
     def remove_item(self, request, pk=None):
         cart = self.get_object()
         item_id = request.data.get('item_id')
-        cart_item = CartItem.objects.get(id=item_id, cart=cart)
-        product = cart_item.product
-        product.stock += cart_item.quantity
-        product.save()
-        cart_item.delete()
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        try:
+            cart_item = CartItem.objects.select_related('product').get(id=item_id, cart=cart)
+        except (CartItem.DoesNotExist, ValueError):
+            return Response({"error": "Không tìm thấy sản phẩm trong giỏ hàng."}, status=404)
+        with transaction.atomic():
+            # Reservation bị xóa theo (on_delete=CASCADE)
+            cart_item.delete()
+            outbox.record(outbox.event(outbox.STOCK_RELEASED, cart_item.product_id, {'cart_id': cart.pk}))
+            inventory.invalidate_catalog([cart_item.product.slug])
+        return self.cart_response(cart)
     
-class ProductReviewViewSet(viewsets.ModelViewSet):
+class ProductReviewViewSet(EagerLoadingQuerysetMixin, viewsets.ModelViewSet):
+    queryset = ProductReview.objects.order_by('-created_at')
     serializer_class = ProductReviewSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return ProductReview.objects.filter(user=self.request.user)
+        return super().get_queryset().filter(user=self.request.user)
 
+    # Cập nhật tổng hợp đánh giá trên Product trong cùng transaction với review
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
-
-class FavoriteViewSet(viewsets.ModelViewSet):
+        review = serializer.save(user=self.request.user)
+        ratings.review_created(review)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        old_product, old_rating = serializer.instance.product, serializer.instance.rating
+        review = serializer.save()
+        ratings.review_updated(review, old_product, old_rating)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+        ratings.review_deleted(instance)
+
+class FavoriteViewSet(ValuesListMixin, EagerLoadingQuerysetMixin, viewsets.ModelViewSet):
+    queryset = Favorite.objects.order_by('-added_at')
     serializer_class = FavoriteSerializer
+    values_serializer_classes = {'list': FavoriteValuesSerializer}
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Favorite.objects.filter(user=self.request.user)
+        return super().get_queryset().filter(user=self.request.user)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+class CatalogExportView(APIView):
+    """
+    API endpoint (admin) xuất danh mục/sản phẩm dạng CSV hoặc JSONL theo luồng.
+    VD: /api/catalog/export/?kind=products&file_format=jsonl
+    """
+    permission_classes = [permissions.IsAdminUser]
+    content_types = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson; charset=utf-8'}
+
+    def get(self, request):
+        kind = request.query_params.get('kind', catalog_io.PRODUCTS)
+        file_format = request.query_params.get('file_format', 'csv')
+        if kind not in catalog_io.KINDS or file_format not in catalog_io.FORMATS:
+            return Response({'error': 'kind hoặc file_format không hợp lệ.'}, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(
+            catalog_io.export_catalog(kind, file_format),
+            content_type=self.content_types[file_format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{kind}.{file_format}"'
+        return response
+
+
+class CatalogImportView(APIView):
+    """
+    API endpoint (admin) nhập danh mục/sản phẩm từ file upload (trường 'file'),
+    upsert theo slug. VD: POST /api/catalog/import/?kind=products&file_format=csv
+    """
+    permission_classes = [permissions.IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        kind = request.query_params.get('kind', catalog_io.PRODUCTS)
+        file_format = request.query_params.get('file_format', 'csv')
+        upload = request.FILES.get('file')
+        if kind not in catalog_io.KINDS or file_format not in catalog_io.FORMATS or upload is None:
+            return Response({'error': 'Cần file và kind/file_format hợp lệ.'}, status=status.HTTP_400_BAD_REQUEST)
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+        try:
+            result = catalog_io.import_catalog(stream, kind, file_format)
+        except (ValueError, UnicodeDecodeError) as exc:
+            return Response({'error': f'File không đọc được: {exc}'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result.as_dict())
+
+
+class EventFeedView(APIView):
+    """
+    API endpoint (admin) đọc change feed của outbox (core/outbox.py) theo lô, theo vị trí
+    (transaction_id, id) tăng dần.
+    VD: /api/events/?after=0-1200&limit=500&type=order.created&type=order.status_changed
+    Lưu giá trị `after` trong response và dùng cho lần đọc tiếp theo (id của sự kiện
+    cuối đã đọc vẫn được nhận như cursor cũ).
+    """
+    permission_classes = [permissions.IsAdminUser]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request):
+        max_limit = getattr(settings, 'OUTBOX_FEED_MAX_BATCH', 5000)
+        try:
+            after = outbox.parse_position(request.query_params.get('after', '0'))
+            limit = min(max(1, int(request.query_params.get('limit', 500))), max_limit)
+        except ValueError:
+            return Response({'error': 'after hoặc limit không hợp lệ.'}, status=status.HTTP_400_BAD_REQUEST)
+        events, has_more = outbox.read(after, limit, request.query_params.getlist('type'))
+        return Response({
+            'results': events,
+            'after': outbox.format_position(outbox.position(events[-1]) if events else after),
+            'has_more': has_more,
+        })
+
+
+class SalesAnalyticsViewSet(viewsets.ViewSet):
+    """
+    API endpoint (admin) báo cáo doanh số, đọc từ các bảng tổng hợp (core/analytics.py);
+    đơn hàng đã hủy không được tính. Khoảng ngày ?from=YYYY-MM-DD&to=YYYY-MM-DD (gồm cả
+    hai đầu), mặc định ANALYTICS_DEFAULT_DAYS ngày gần nhất.
+    - /api/analytics/summary/: tổng số đơn, số sản phẩm bán ra và doanh thu;
+    - /api/analytics/revenue/?group=day|category: doanh thu theo ngày / theo danh mục;
+    - /api/analytics/top-products/?by=units|revenue&limit=10: sản phẩm bán chạy (không
+      có from / to thì tính từ trước tới nay).
+    """
+    permission_classes = [permissions.IsAdminUser]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get_date_range(self, required=True):
+        params = self.request.query_params
+        if not required and 'from' not in params and 'to' not in params:
+            return None, None
+        today = timezone.localdate()
+        try:
+            end = date.fromisoformat(params['to']) if 'to' in params else today
+            start = (
+                date.fromisoformat(params['from']) if 'from' in params
+                else end - timedelta(days=getattr(settings, 'ANALYTICS_DEFAULT_DAYS', 30) - 1)
+            )
+        except ValueError:
+            raise serializers.ValidationError({'error': 'from và to phải có dạng YYYY-MM-DD.'})
+        if start > end:
+            raise serializers.ValidationError({'error': 'from phải trước hoặc bằng to.'})
+        if (end - start).days >= getattr(settings, 'ANALYTICS_MAX_DAYS', 366):
+            raise serializers.ValidationError({'error': 'Khoảng ngày quá dài.'})
+        return start, end
+
+    @action(detail=False)
+    def summary(self, request):
+        start, end = self.get_date_range()
+        return Response({'from': start, 'to': end, **analytics.summary(start, end)})
+
+    @action(detail=False)
+    def revenue(self, request):
+        start, end = self.get_date_range()
+        group = request.query_params.get('group', 'day')
+        if group == 'day':
+            results = analytics.revenue_by_day(start, end)
+        elif group == 'category':
+            results = analytics.revenue_by_category(start, end)
+        else:
+            return Response({'error': 'group phải là day hoặc category.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'from': start, 'to': end, 'group': group, 'results': results})
+
+    @action(detail=False, url_path='top-products')
+    def top_products(self, request):
+        start, end = self.get_date_range(required=False)
+        order_by = request.query_params.get('by', 'units')
+        try:
+            limit = min(max(1, int(request.query_params.get('limit', 10))), getattr(settings, 'ANALYTICS_TOP_PRODUCTS_MAX', 100))
+        except ValueError:
+            return Response({'error': 'limit phải là số nguyên.'}, status=status.HTTP_400_BAD_REQUEST)
+        if order_by not in ('units', 'revenue'):
+            return Response({'error': 'by phải là units hoặc revenue.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'from': start, 'to': end, 'by': order_by,
+            'results': analytics.top_products(start, end, limit, order_by),
+        })
+
+
+def prometheus_metrics(request):
+    """
+    Số liệu hiệu năng của process (core/metrics.py) ở định dạng text của Prometheus.
+    Chỉ admin (session), request có header `Authorization: Bearer <PERF_METRICS_TOKEN>`
+    hoặc các IP được liệt kê rõ trong PERF_METRICS_ALLOWED_IPS (mặc định rỗng) đọc được.
+    """
+    token = getattr(settings, 'PERF_METRICS_TOKEN', '')
+    allowed = (
+        request.user.is_staff
+        or (token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'))
+        or request.META.get('REMOTE_ADDR') in getattr(settings, 'PERF_METRICS_ALLOWED_IPS', ())
+    )
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.registry.expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @api_view(['PATCH'])
 @permission_classes([permissions.IsAuthenticated])
 def update_order_status(request, pk):
     order = get_object_or_404(Order, pk=pk, user=request.user)
-    status = request.data.get('status')
-    if status in ['pending', 'shipped', 'delivered', 'cancelled']:
-        order.status = status
-        order.save()
+    # Không đặt tên biến là `status` (che mất module rest_framework.status ở dòng lỗi bên dưới)
+    new_status = request.data.get('status')
+    if new_status in ['pending', 'shipped', 'delivered', 'cancelled']:
+        with transaction.atomic():
+            # Khóa đơn hàng: hai request đổi trạng thái cùng lúc không ghi cùng một old_status
+            # (bảng tổng hợp doanh số trừ đơn hàng bị hủy đúng một lần)
+            order = Order.objects.select_for_update().get(pk=order.pk)
+            old_status = order.status
+            order.status = new_status
+            order.save()
+            if new_status != old_status:
+                outbox.record(outbox.event(outbox.ORDER_STATUS_CHANGED, order.pk, {
+                    'user_id': order.user_id, 'old_status': old_status, 'new_status': new_status,
+                }))
+                jobs.enqueue_on_commit(order_events.ORDER_STATUS_CHANGED, {
+                    'order_id': order.pk, 'old_status': old_status, 'new_status': new_status,
+                })
         serializer = OrderSerializer(order)
         return Response(serializer.data)
     return Response({'error': 'Invalid status'}, status=status.HTTP_400_BAD_REQUEST)
-
-# Cập nhật ProductViewSet để lọc theo giá và tồn kho
-ProductViewSet.filterset_fields += ['price', 'stock']
\ No newline at end of file